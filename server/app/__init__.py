@@ -1,11 +1,16 @@
 # server/app/__init__.py
-from flask import Flask, send_from_directory, abort, session as flask_session, redirect, url_for, current_app as app_context # Added current_app as app_context for logging inside routes
+from flask import Flask, jsonify, send_from_directory, abort, session as flask_session, redirect, url_for, current_app as app_context # Added current_app as app_context for logging inside routes
 from flask_cors import CORS
 from .config import config_by_name
 from .utils.db import init_db, mongo
 import os
 from flask_login import LoginManager, current_user, login_required
 from .models import User
+from .services.registry import init_services, get_services
+from .services.auth_service import load_session_user_data
+from .utils.metrics import metrics
+from .utils.indexes import ensure_indexes, verify_query_plans
+from .utils.json_provider import BSONJSONProvider
 from bson import ObjectId
 
 # Import blueprints at the top level
@@ -18,6 +23,7 @@ login_manager = LoginManager()
 
 def create_app(config_name='default'):
     app = Flask(__name__, static_folder='../static', template_folder='../static')
+    app.json = BSONJSONProvider(app) # ObjectId/datetime-aware, orjson-backed when installed
     
     selected_config_object = config_by_name[config_name]
     app.config.from_object(selected_config_object)
@@ -30,20 +36,35 @@ def create_app(config_name='default'):
 
     login_manager.init_app(app)
 
+    with app.app_context():
+        if app.config.get('MONGO_ENSURE_INDEXES', True):
+            try:
+                ensure_indexes(mongo.db, logger=app.logger)
+            except Exception as e: # Mongo unreachable; the app still starts and queries fall back to scans
+                app.logger.error(f"Could not ensure Mongo indexes: {e}", exc_info=True)
+        if app.config.get('MONGO_VERIFY_QUERY_PLANS'):
+            try:
+                for entry in verify_query_plans(mongo.db):
+                    if entry['collscan']:
+                        app.logger.warning(f"Query '{entry['name']}' on {entry['collection']} runs as a collection scan: {' > '.join(entry['stages'])}")
+            except Exception as e:
+                app.logger.error(f"Could not verify query plans: {e}", exc_info=True)
+        init_services(app)
+
     @login_manager.user_loader
     def load_user(user_id):
         # Assuming user_id stored in session is a string (e.g., from str(uuid.uuid4()))
-        user_data = mongo.db.users.find_one({"_id": user_id})
+        user_data = load_session_user_data(user_id) # Cached per worker; see USER_CACHE_TTL_SECONDS
         
         if user_data:
             return User(
                 _id=str(user_data['_id']), 
                 email=user_data['email'],
-                password_hash=user_data.get('password_hash'),
                 google_id=user_data.get('google_id'),
                 name=user_data.get('name'),
                 picture=user_data.get('picture'),
-                npc_ids=user_data.get('npc_ids', [])
+                created_at=user_data.get('created_at'),
+                npc_ids=list(user_data.get('npc_ids', [])) # A copy: routes mutate current_user.npc_ids
             )
         return None
 
@@ -108,6 +129,16 @@ def create_app(config_name='default'):
     def health_check():
         return "API is healthy!", 200
 
+    if app.config.get('METRICS_ENABLED'):
+        @app.route('/metrics')
+        def metrics_route():
+            snapshot = metrics.snapshot()
+            services = get_services()
+            snapshot['caches'] = {name: cache.stats() for name, cache in services.caches.items()}
+            snapshot['in_flight'] = services.dialogue_service.in_flight.stats()
+            snapshot['scheduler'] = services.scheduler.stats()
+            return jsonify(snapshot), 200
+
     login_manager.login_view = 'login_page_route_main' 
     login_manager.login_message_category = "info"
 
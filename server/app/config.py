@@ -29,6 +29,12 @@ class Config:
     
     # Google Client ID
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
+    # Google Sign-In signing certificates are cached for as long as Google's cache headers allow
+    # (GOOGLE_CERTS_DEFAULT_TTL_SECONDS when it sends none). GOOGLE_CERTS_FILE, a local copy of
+    # the certs URL's JSON, replaces the download entirely (offline runs, tests).
+    GOOGLE_CERTS_FILE = os.getenv('GOOGLE_CERTS_FILE')
+    GOOGLE_CERTS_DEFAULT_TTL_SECONDS = int(os.getenv('GOOGLE_CERTS_DEFAULT_TTL_SECONDS', 300))
+    GOOGLE_TOKEN_CLOCK_SKEW_SECONDS = int(os.getenv('GOOGLE_TOKEN_CLOCK_SKEW_SECONDS', 10))
 
 
     # API Keys - these MUST be uppercase to be loaded by from_object() into app.config
@@ -38,6 +44,123 @@ class Config:
     # AI Model Name
     GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL_NAME', 'gemini-1.5-flash-latest')
 
+    # Text generation backend: 'gemini' (live API) or 'stub' (local, deterministic; for offline runs,
+    # benchmarks and capacity tests). The stub samples latency from LLM_STUB_LATENCY_DISTRIBUTION
+    # ('fixed', 'uniform', 'normal' or 'lognormal') with the given mean/stddev, fails at
+    # LLM_STUB_FAILURE_RATE, and can read {purpose: text or [texts]} outputs from a JSON file.
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini')
+    LLM_STUB_LATENCY_DISTRIBUTION = os.getenv('LLM_STUB_LATENCY_DISTRIBUTION', 'lognormal')
+    LLM_STUB_LATENCY_MEAN_MS = float(os.getenv('LLM_STUB_LATENCY_MEAN_MS', 800))
+    LLM_STUB_LATENCY_STDDEV_MS = float(os.getenv('LLM_STUB_LATENCY_STDDEV_MS', 300))
+    LLM_STUB_FAILURE_RATE = float(os.getenv('LLM_STUB_FAILURE_RATE', 0.0))
+    LLM_STUB_RESPONSES_FILE = os.getenv('LLM_STUB_RESPONSES_FILE')
+    LLM_STUB_SEED = int(os.getenv('LLM_STUB_SEED')) if os.getenv('LLM_STUB_SEED') else None
+
+    # Upstream protection for every model call. The concurrency limit adapts (AIMD) between MIN and
+    # MAX: it grows while calls succeed under LLM_LATENCY_TARGET_SECONDS and halves on failures or
+    # slow calls. Calls wait up to LLM_QUEUE_TIMEOUT_SECONDS for a slot, then fail fast. After
+    # LLM_BREAKER_FAILURE_THRESHOLD consecutive failures the breaker rejects calls immediately for
+    # LLM_BREAKER_RESET_SECONDS. Failed calls are retried LLM_MAX_RETRIES times with jittered backoff.
+    LLM_INITIAL_CONCURRENCY = int(os.getenv('LLM_INITIAL_CONCURRENCY', 4))
+    LLM_MIN_CONCURRENCY = int(os.getenv('LLM_MIN_CONCURRENCY', 1))
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+    LLM_LATENCY_TARGET_SECONDS = float(os.getenv('LLM_LATENCY_TARGET_SECONDS', 8.0))
+    LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', 10.0))
+    LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', 5))
+    LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30.0))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+    LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv('LLM_RETRY_BASE_DELAY_SECONDS', 0.5))
+    LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv('LLM_RETRY_MAX_DELAY_SECONDS', 4.0))
+
+    # Fair-share scheduling of model calls: per-user round robin within each work class, classes
+    # served in proportion to their weights (interactive = dialogue lines, suggestion = topic and
+    # option suggestions, background = memory extraction).
+    LLM_SCHEDULER_WEIGHTS = {
+        'interactive': int(os.getenv('LLM_SCHEDULER_WEIGHT_INTERACTIVE', 6)),
+        'suggestion': int(os.getenv('LLM_SCHEDULER_WEIGHT_SUGGESTION', 3)),
+        'background': int(os.getenv('LLM_SCHEDULER_WEIGHT_BACKGROUND', 1))
+    }
+    LLM_SCHEDULER_WAIT_TIMEOUT_SECONDS = float(os.getenv('LLM_SCHEDULER_WAIT_TIMEOUT_SECONDS', 30.0))
+
+    # Speculative suggestions: after each NPC line, next_topic/show_top5_options are generated in the
+    # background (as low-priority work) and parked for LLM_SPECULATION_TTL_SECONDS, so the usual
+    # follow-up click is answered instantly. Each user may spend at most
+    # LLM_SPECULATION_BUDGET_PER_USER speculative calls per LLM_SPECULATION_BUDGET_WINDOW_SECONDS.
+    LLM_SPECULATION_ENABLED = os.getenv('LLM_SPECULATION_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    LLM_SPECULATION_ACTIONS = ['next_topic', 'show_top5_options']
+    LLM_SPECULATION_WORKERS = int(os.getenv('LLM_SPECULATION_WORKERS', 2))
+    LLM_SPECULATION_TTL_SECONDS = int(os.getenv('LLM_SPECULATION_TTL_SECONDS', 120))
+    LLM_SPECULATION_BUDGET_PER_USER = int(os.getenv('LLM_SPECULATION_BUDGET_PER_USER', 20))
+    LLM_SPECULATION_BUDGET_WINDOW_SECONDS = int(os.getenv('LLM_SPECULATION_BUDGET_WINDOW_SECONDS', 600))
+
+    # Max concurrent Gemini calls when a whole scene is generated at once (/api/dialogue/scene/start)
+    SCENE_MAX_WORKERS = int(os.getenv('SCENE_MAX_WORKERS', 6))
+
+    # Prompt-level response cache for suggestion actions (next_topic / show_top5_options).
+    # Remove an action from RESPONSE_CACHE_ACTIONS to opt it out. Actions in
+    # RESPONSE_CACHE_REFRESH_ACTIONS never read the cache but store their fresh result.
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 512))
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', 300))
+    RESPONSE_CACHE_ACTIONS = ['next_topic', 'show_top5_options']
+    RESPONSE_CACHE_REFRESH_ACTIONS = ['regenerate_topics']
+
+    # The world knowledge summary in prompts is cached per worker and rebuilt when the world
+    # collections' versions change, or after WORLD_KNOWLEDGE_CACHE_TTL_SECONDS regardless
+    # (catches writes that never bumped a version, e.g. world data loaded from the shell).
+    WORLD_KNOWLEDGE_CACHE_TTL_SECONDS = int(os.getenv('WORLD_KNOWLEDGE_CACHE_TTL_SECONDS', 300))
+
+    # Background job queue (memory extraction). Jobs are persisted in the dialogue_jobs collection;
+    # a 'running' job whose lease expires (e.g. its worker died) is picked up again on restart.
+    JOB_QUEUE_WORKERS = int(os.getenv('JOB_QUEUE_WORKERS', 8))
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+
+    # Memory extraction batching: extractions arriving within MEMORY_BATCH_WINDOW_SECONDS (up to
+    # MEMORY_BATCH_MAX_ITEMS) share one model call. Each waiting job holds a job worker, so keep
+    # JOB_QUEUE_WORKERS at least MEMORY_BATCH_MAX_ITEMS for full batches.
+    MEMORY_BATCH_ENABLED = os.getenv('MEMORY_BATCH_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    MEMORY_BATCH_MAX_ITEMS = int(os.getenv('MEMORY_BATCH_MAX_ITEMS', 8))
+    MEMORY_BATCH_WINDOW_SECONDS = float(os.getenv('MEMORY_BATCH_WINDOW_SECONDS', 0.5))
+
+    # Estimated-token budgets per prompt (see services/prompt_budget.py). Profile, scene and task
+    # instructions are always kept; history, memories, backstory and world knowledge are trimmed to fit.
+    PROMPT_TOKEN_BUDGETS = {
+        'dialogue': int(os.getenv('PROMPT_BUDGET_DIALOGUE', 1500)),
+        'next_topic': int(os.getenv('PROMPT_BUDGET_SUGGESTIONS', 800)),
+        'regenerate_topics': int(os.getenv('PROMPT_BUDGET_SUGGESTIONS', 800)),
+        'show_top5_options': int(os.getenv('PROMPT_BUDGET_OPTIONS', 900)),
+        'default': 1500
+    }
+
+    # Flask-Login's per-request user lookup is cached per worker for USER_CACHE_TTL_SECONDS; routes
+    # that change a user (NPC upload/delete, registration, sign-in) invalidate their entry at once.
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 1024))
+    USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', 30))
+
+    # NPC and world-info list responses carry ETags built from shared per-collection versions
+    # (collection_versions, bumped by the write routes and the loader/migration scripts) plus a
+    # time bucket of CONDITIONAL_ETAG_MAX_AGE_SECONDS, so a write that skips the bump (a manual
+    # edit in the shell) is served fresh within that long. 0 drops the bucket.
+    CONDITIONAL_ETAG_MAX_AGE_SECONDS = int(os.getenv('CONDITIONAL_ETAG_MAX_AGE_SECONDS', 300))
+
+    # Password hashing runs on its own pool of PASSWORD_HASH_WORKERS processes, with at most
+    # PASSWORD_HASH_MAX_PENDING more calls queued; callers wait up to PASSWORD_HASH_WAIT_TIMEOUT_SECONDS
+    # to get in, else the login/register request gets a 503. Stored hashes with a different
+    # BCRYPT_ROUNDS cost are rehashed on the user's next successful login.
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_WAIT_TIMEOUT_SECONDS = float(os.getenv('PASSWORD_HASH_WAIT_TIMEOUT_SECONDS', 10.0))
+
+    # Mongo indexes declared in utils/indexes.py are created (idempotently) at startup. With
+    # MONGO_VERIFY_QUERY_PLANS the app also explains its hot queries and logs any collection scan.
+    # manage_indexes.py does both from the command line.
+    MONGO_ENSURE_INDEXES = os.getenv('MONGO_ENSURE_INDEXES', 'true').lower() in ('1', 'true', 'yes')
+    MONGO_VERIFY_QUERY_PLANS = os.getenv('MONGO_VERIFY_QUERY_PLANS', 'false').lower() in ('1', 'true', 'yes')
+
+    # /metrics (counters, cache/scheduler stats) is unauthenticated, so it is only served with
+    # METRICS_ENABLED; ProductionConfig turns it off unless the environment asks for it.
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
     DEBUG = False
     TESTING = False
 
@@ -66,7 +189,7 @@ class ProductionConfig(Config):
     """Production configuration."""
     # Production specific settings would go here
     # For example, DEBUG and TESTING would be False (already set in base Config)
-    pass
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
 
 # Dictionary to access config classes by name
 config_by_name = dict(
@@ -1,14 +1,13 @@
 # app/routes/auth.py
 from flask import Blueprint, request, jsonify, current_app, session
 from ..services.auth_service import register_user_s, login_user_s, get_or_create_google_user
+from ..services.password_hasher import PasswordHasherBusyError
+from ..services.google_auth import GoogleCertsUnavailableError
+from ..services.registry import get_services
 from flask_login import login_user, logout_user, login_required, current_user
 from ..models import User # Ensure User model is imported
 import os
 
-# For Google Sign-In backend verification
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['POST'])
@@ -23,7 +22,10 @@ def register_route():
     if len(password) < 8:
         return jsonify({"error": "Password must be at least 8 characters long"}), 400
 
-    user_data, error = register_user_s(email, password)
+    try:
+        user_data, error = register_user_s(email, password)
+    except PasswordHasherBusyError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "2"}
     if error:
         return jsonify({"error": error}), 400 # Or 409 for conflict
 
@@ -46,7 +48,10 @@ def login_route():
 
     email = data['email']
     password = data['password']
-    user_data, error = login_user_s(email, password)
+    try:
+        user_data, error = login_user_s(email, password)
+    except PasswordHasherBusyError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "2"}
 
     if error:
         return jsonify({"error": error}), 401
@@ -95,8 +100,8 @@ def google_signin_route():
         return jsonify({"error": "Google Sign-In not configured on server."}), 500
 
     try:
-        # Verify the ID token
-        idinfo = id_token.verify_oauth2_token(token, google_requests.Request(), GOOGLE_CLIENT_ID)
+        # Verify the ID token (signing certificates are cached; see GoogleTokenVerifier)
+        idinfo = get_services().google_token_verifier.verify(token, GOOGLE_CLIENT_ID)
 
         # ID token is valid. Get the user's Google Account ID from the decoded token.
         # userid = idinfo['sub']
@@ -117,6 +122,9 @@ def google_signin_route():
         current_app.logger.info(f"User {user_data['email']} logged in via Google.")
         return jsonify({"message": "Google Sign-In successful", "user": user_data}), 200
 
+    except GoogleCertsUnavailableError as e:
+        current_app.logger.error(f"Google Sign-In unavailable: {e}")
+        return jsonify({"error": "Google Sign-In is temporarily unavailable."}), 503
     except ValueError as e:
         # Invalid token
         current_app.logger.error(f"Google token verification failed: {e}")
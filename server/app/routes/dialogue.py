@@ -1,12 +1,21 @@
 # server/app/routes/dialogue.py
-from flask import Blueprint, request, jsonify, current_app, Response
-from ..services.dialogue_service import DialogueService 
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_login import current_user
+from ..services.registry import get_dialogue_service, get_services
 from ..utils.db import mongo 
 # asyncio import and async_to_sync wrapper are no longer needed if all service calls are sync
 # import asyncio 
 
 dialogue_bp = Blueprint('dialogue', __name__)
 
+def _current_user_id():
+    """Id the fair-share scheduler queues this request under (None for anonymous requests)."""
+    return current_user.get_id() if current_user.is_authenticated else None
+
+def _sse_event(event, data):
+    """Formats one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
 # def async_to_sync(f): # No longer needed if all calls become synchronous
 #     import functools
 #     @functools.wraps(f)
@@ -19,11 +28,11 @@ def generate_npc_line_route():
     # (This route is already synchronous and correct from the previous step)
     print("--- PRINT DEBUG: /api/dialogue/generate_npc_line ROUTE HIT ---") 
     current_app.logger.critical("--- CRITICAL DEBUG: /api/dialogue/generate_npc_line ROUTE HIT ---") 
-    retrieved_gemini_key = current_app.config.get('GEMINI_API_KEY')
-    retrieved_google_key = current_app.config.get('GOOGLE_API_KEY')
-    if not (retrieved_gemini_key or retrieved_google_key):
-        current_app.logger.critical("--- CRITICAL DEBUG [ROUTE]: API Key NOT FOUND. ABORTING early.")
-        return jsonify({"error": "Server configuration error: API Key not found."}), 500
+    # The Gemini backend is unavailable without an API key; the offline stub backend needs none
+    dialogue_service = get_dialogue_service()
+    if not dialogue_service.available:
+        current_app.logger.critical("--- CRITICAL DEBUG [ROUTE]: LLM backend is unavailable (API key not found?). ABORTING early.")
+        return jsonify({"error": "AI service initialization failed."}), 500
     data = request.get_json()
     if not data:
         current_app.logger.critical("--- CRITICAL DEBUG: /generate_npc_line - No JSON data.")
@@ -45,17 +54,18 @@ def generate_npc_line_route():
         current_app.logger.critical(f"--- CRITICAL DEBUG: DB error fetching NPC '{npc_id}': {e}", exc_info=True)
         return jsonify({"error": "DB error fetching NPC profile.", "details": str(e)}), 500
     try:
-        dialogue_service = DialogueService() 
-        if dialogue_service.model is None: 
-            current_app.logger.critical("--- CRITICAL DEBUG: DialogueService model is None.")
-            return jsonify({"error": "AI service initialization failed."}), 500
         ai_response_text = dialogue_service.generate_dialogue_for_npc_in_scene(
             npc_profile=npc_data_from_db, 
             scene_description=scene_context,
-            conversation_history=conversation_history
+            conversation_history=conversation_history,
+            user_id=_current_user_id()
         ) 
         if ai_response_text: 
             current_app.logger.info(f"--- INFO DEBUG: Generated dialogue for '{npc_id}'.")
+            if not ai_response_text.startswith('['): # Bracketed text is an error/fallback line, nothing to follow up on
+                dialogue_service.speculate_suggestions(
+                    npc_data_from_db, data.get('scene_description') or scene_context, conversation_history, ai_response_text, user_id=_current_user_id()
+                )
             return jsonify({"dialogue_text": ai_response_text}), 200
         else:
             current_app.logger.critical(f"--- CRITICAL DEBUG: Dialogue service returned None/empty for '{npc_id}'.")
@@ -64,6 +74,53 @@ def generate_npc_line_route():
         current_app.logger.critical(f"--- CRITICAL DEBUG: Error calling DialogueService for '{npc_id}': {e}", exc_info=True)
         return jsonify({"error": "Unexpected server error during dialogue generation."}), 500
 
+@dialogue_bp.route('/generate_npc_line/stream', methods=['POST'])
+def generate_npc_line_stream_route():
+    """
+    Streaming variant of /generate_npc_line. Same request body; answers with Server-Sent Events:
+    'delta' events carry cleaned partial dialogue, then one 'done' (full cleaned line) or 'error'.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid request: No JSON data."}), 400
+    npc_id = data.get('npc_id')
+    scene_context = data.get('scene_context')
+    conversation_history = data.get('history', [])
+    if not npc_id or not scene_context:
+        return jsonify({"error": "npc_id and scene_context are required."}), 400
+    try:
+        npc_data_from_db = mongo.db.npcs.find_one({"_id": npc_id})
+    except Exception as e:
+        current_app.logger.error(f"--- ERROR DEBUG: /generate_npc_line/stream - DB error fetching NPC '{npc_id}': {e}", exc_info=True)
+        return jsonify({"error": "DB error fetching NPC profile.", "details": str(e)}), 500
+    if not npc_data_from_db:
+        return jsonify({"error": f"NPC with ID '{npc_id}' not found."}), 404
+    dialogue_service = get_dialogue_service()
+    if not dialogue_service.available:
+        current_app.logger.critical("--- CRITICAL DEBUG: /generate_npc_line/stream - LLM backend is unavailable.")
+        return jsonify({"error": "AI service initialization failed."}), 500
+
+    user_id = _current_user_id()
+    scene_description = data.get('scene_description') or scene_context # Scene the follow-up actions will send
+
+    def generate_events():
+        for kind, text in dialogue_service.stream_dialogue_for_npc_in_scene(
+            npc_profile=npc_data_from_db,
+            scene_description=scene_context,
+            conversation_history=conversation_history,
+            user_id=user_id
+        ):
+            if kind == 'delta':
+                yield _sse_event('delta', {"text": text})
+            elif kind == 'done':
+                yield _sse_event('done', {"dialogue_text": text})
+                dialogue_service.speculate_suggestions(npc_data_from_db, scene_description, conversation_history, text, user_id=user_id)
+            else:
+                yield _sse_event('error', {"error": text})
+
+    return Response(stream_with_context(generate_events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @dialogue_bp.route('/npc_action', methods=['POST'])
 # Removed @async_to_sync and async def
 def npc_action_route():
@@ -89,7 +146,7 @@ def npc_action_route():
     try:
         # For most actions, a minimal profile might be enough for the service to decide if it needs more.
         # The service's handle_npc_action will fetch the full profile if needed (e.g., for submit_memory).
-        npc_profile_minimal = mongo.db.npcs.find_one({"_id": npc_id}, {"name": 1, "personality_traits": 1, "motivations": 1, "memories": 1}) # Include memories for context
+        npc_profile_minimal = mongo.db.npcs.find_one({"_id": npc_id}, {"name": 1, "personality_traits": 1, "motivations": 1})
         if not npc_profile_minimal:
             current_app.logger.error(f"--- ERROR DEBUG: /npc_action - NPC ID '{npc_id}' NOT FOUND for action '{action_type}'.")
             return jsonify({"error": f"NPC with ID '{npc_id}' not found."}), 404
@@ -100,10 +157,10 @@ def npc_action_route():
         return jsonify({"error": "DB error fetching NPC profile for action."}), 500
 
     try:
-        dialogue_service = DialogueService()
+        dialogue_service = get_dialogue_service()
         actions_requiring_model = ["submit_memory", "next_topic", "regenerate_topics", "show_top5_options"]
-        if action_type in actions_requiring_model and dialogue_service.model is None:
-            current_app.logger.error(f"--- ERROR DEBUG: /npc_action - DialogueService model is None for AI-dependent action '{action_type}'.")
+        if action_type in actions_requiring_model and not dialogue_service.available:
+            current_app.logger.error(f"--- ERROR DEBUG: /npc_action - LLM backend is unavailable for AI-dependent action '{action_type}'.")
             return jsonify({"error": f"AI service initialization failed for action '{action_type}'. Check server logs."}), 500
 
         # Calling the now synchronous service method
@@ -113,11 +170,14 @@ def npc_action_route():
             payload=payload,
             npc_profile=npc_profile_minimal, 
             scene_description=scene_description, 
-            conversation_history=conversation_history
+            conversation_history=conversation_history,
+            user_id=_current_user_id()
         )
         
         status_code = 200
-        if response_data.get("status") == "error":
+        if response_data.get("status") == "queued":
+            status_code = 202
+        elif response_data.get("status") == "error":
             current_app.logger.error(f"--- ERROR DEBUG: /npc_action - Action '{action_type}' for NPC '{npc_id}' failed: {response_data.get('message')}")
             status_code = response_data.get("code", 500) 
         
@@ -126,4 +186,85 @@ def npc_action_route():
 
     except Exception as e:
         current_app.logger.error(f"--- ERROR DEBUG: /npc_action - Unexpected error during NPC action '{action_type}' for NPC '{npc_id}': {e}", exc_info=True)
-        return jsonify({"error": f"Unexpected server error during NPC action '{action_type}'."}), 500
\ No newline at end of file
+        return jsonify({"error": f"Unexpected server error during NPC action '{action_type}'."}), 500
+
+@dialogue_bp.route('/scene/start', methods=['POST'])
+def scene_start_route():
+    """
+    Generates the opening line for every NPC in a scene with one request.
+    Body: {"npc_ids": [...], "scene_context": "...", "histories": {npc_id: [...]}, "stream": bool}
+    With stream=true, answers as Server-Sent Events (one 'npc_line' event per NPC as it completes);
+    otherwise returns all results in one JSON object.
+    """
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "Invalid request: No JSON data."}), 400
+    npc_ids = data.get('npc_ids')
+    scene_context = data.get('scene_context')
+    histories = data.get('histories') or {}
+    stream = bool(data.get('stream', False))
+    if not isinstance(npc_ids, list) or not npc_ids or not scene_context:
+        return jsonify({"error": "npc_ids (non-empty list) and scene_context are required."}), 400
+    if not isinstance(histories, dict):
+        return jsonify({"error": "histories must be an object keyed by npc_id."}), 400
+    npc_ids = list(dict.fromkeys(npc_ids)) # De-duplicate, keep order
+    current_app.logger.info(f"--- INFO DEBUG: /scene/start - {len(npc_ids)} NPCs requested.")
+
+    try:
+        npc_profiles = list(mongo.db.npcs.find({"_id": {"$in": npc_ids}}))
+    except Exception as e:
+        current_app.logger.error(f"--- ERROR DEBUG: /scene/start - DB error fetching NPCs: {e}", exc_info=True)
+        return jsonify({"error": "DB error fetching NPC profiles.", "details": str(e)}), 500
+    found_ids = {profile['_id'] for profile in npc_profiles}
+    missing_ids = [npc_id for npc_id in npc_ids if npc_id not in found_ids]
+    if not npc_profiles:
+        return jsonify({"error": "None of the requested NPCs were found.", "missing": missing_ids}), 404
+
+    dialogue_service = get_dialogue_service()
+    if not dialogue_service.available:
+        current_app.logger.critical("--- CRITICAL DEBUG: /scene/start - LLM backend is unavailable.")
+        return jsonify({"error": "AI service initialization failed."}), 500
+    executor = get_services().scene_executor
+    results = dialogue_service.iter_scene_dialogue(npc_profiles, scene_context, histories, executor, user_id=_current_user_id())
+
+    if stream:
+        def generate_events():
+            for npc_id in missing_ids:
+                yield _sse_event('npc_error', {"npc_id": npc_id, "error": f"NPC with ID '{npc_id}' not found."})
+            for npc_id, dialogue_text in results:
+                if dialogue_text:
+                    yield _sse_event('npc_line', {"npc_id": npc_id, "dialogue_text": dialogue_text})
+                else:
+                    yield _sse_event('npc_error', {"npc_id": npc_id, "error": "AI failed to generate dialogue."})
+            yield _sse_event('done', {"count": len(npc_profiles)})
+        return Response(stream_with_context(generate_events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    response_payload = {"results": {}, "missing": missing_ids}
+    for npc_id, dialogue_text in results:
+        if dialogue_text:
+            response_payload["results"][npc_id] = {"dialogue_text": dialogue_text}
+        else:
+            response_payload["results"][npc_id] = {"error": "AI failed to generate dialogue."}
+    return jsonify(response_payload), 200
+
+@dialogue_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status_route(job_id):
+    """Status of a background job (e.g. a queued memory submission)."""
+    try:
+        job = get_services().job_queue.get(job_id)
+    except Exception as e:
+        current_app.logger.error(f"--- ERROR DEBUG: /jobs - DB error fetching job '{job_id}': {e}", exc_info=True)
+        return jsonify({"error": "DB error fetching job status."}), 500
+    if not job:
+        return jsonify({"error": f"Job '{job_id}' not found."}), 404
+    return jsonify({
+        "job_id": job['_id'],
+        "type": job.get('type'),
+        "status": job.get('status'),
+        "result": job.get('result'),
+        "error": job.get('error'),
+        "attempts": job.get('attempts', 0),
+        "created_at": job.get('created_at'),
+        "finished_at": job.get('finished_at')
+    }), 200
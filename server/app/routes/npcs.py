@@ -1,65 +1,116 @@
 # app/routes/npcs.py
 from flask import Blueprint, jsonify, current_app, request, abort
 from ..utils.db import mongo
+from ..services.prompt_templates import compute_profile_version
+from ..services.memory_store import memory_store
+from ..services.auth_service import invalidate_cached_user
+from ..services.foundry_import import FoundryImportError, foundry_actor_from_dict, foundry_actor_to_npc, is_foundry_actor_filename, looks_like_foundry_actor, read_foundry_actor
+from ..utils.versions import collection_versions, conditional_on
 from flask_login import login_required, current_user
 import json
+import re
 import uuid
+from urllib.parse import quote, unquote
 from bson import ObjectId # For converting string ID to MongoDB ObjectId if necessary
-from datetime import datetime # For timestamping memories, though actual creation is in service
+from datetime import datetime
 
 npcs_bp = Blueprint('npcs', __name__)
 NPC_COLLECTION_NAME = 'npcs'
 USERS_COLLECTION_NAME = 'users'
+# Memories live in npc_memories; this hides arrays left embedded by pre-migration NPC documents
+LEGACY_MEMORIES_PROJECTION = {"memories": 0}
+# What the NPC selector, dashboard and scene pages need from each NPC in the list
+NPC_SUMMARY_FIELDS = ['name', 'personality_traits', 'appearance', 'user_id']
+NPC_LIST_DEFAULT_LIMIT = 100
+NPC_LIST_MAX_LIMIT = 500
+NPC_FIELD_NAME_RE = re.compile(r'^[A-Za-z0-9_]+$')
+# List cursors carry the _id's type: Mongo sorts every string _id before every ObjectId, and a
+# $gt on one type never matches the other, so legacy ObjectId-keyed NPCs need their own bracket
+NPC_CURSOR_STRING_PREFIX = 'str:'
+NPC_CURSOR_OBJECTID_PREFIX = 'oid:'
+
+
+def _encode_npc_cursor(npc_id):
+    if isinstance(npc_id, ObjectId):
+        return f"{NPC_CURSOR_OBJECTID_PREFIX}{npc_id}"
+    return f"{NPC_CURSOR_STRING_PREFIX}{quote(str(npc_id), safe='')}" # Header-safe whatever the id holds
+
+
+def _npc_cursor_filter(cursor):
+    """Filter for the NPCs after cursor in _id order, or None if the cursor is malformed."""
+    if cursor.startswith(NPC_CURSOR_OBJECTID_PREFIX):
+        value = cursor[len(NPC_CURSOR_OBJECTID_PREFIX):]
+        return {"_id": {"$gt": ObjectId(value)}} if ObjectId.is_valid(value) else None
+    if cursor.startswith(NPC_CURSOR_STRING_PREFIX):
+        value = unquote(cursor[len(NPC_CURSOR_STRING_PREFIX):])
+        return {"$or": [{"_id": {"$gt": value}}, {"_id": {"$type": "objectId"}}]}
+    return None
 
 @npcs_bp.route('', methods=['GET'])
 @login_required
+@conditional_on(NPC_COLLECTION_NAME, per_user=True)
 def get_combined_npcs():
+    """
+    Global NPCs plus the current user's, as summaries (NPC_SUMMARY_FIELDS, or ?fields=a,b).
+    Optional ?ids=a,b restricts the list to those NPCs. Paged by _id: ?limit=N (default
+    NPC_LIST_DEFAULT_LIMIT), and when more remain the X-Next-Cursor header holds the value to
+    pass back as ?cursor= for the next page. Full documents come from GET /api/npcs/<id>.
+    """
     try:
         npc_collection = mongo.db[NPC_COLLECTION_NAME]
-        npcs_list = []
-        processed_ids = set()
-
-        # Fetch global/default NPCs (user_id does not exist or is explicitly null)
-        global_npcs_cursor = npc_collection.find({"$or": [{"user_id": {"$exists": False}}, {"user_id": None}]})
-        for npc in global_npcs_cursor:
-            npc_id_str = str(npc['_id'])
-            npc['_id'] = npc_id_str 
-            if npc.get('user_id'): 
-                 npc['user_id'] = str(npc['user_id'])
-            if 'memories' not in npc: # Ensure memories field exists for frontend if ever needed, though primarily backend
-                npc['memories'] = []
-            npcs_list.append(npc)
-            processed_ids.add(npc_id_str)
-
-        if current_user and hasattr(current_user, 'get_id') and current_user.get_id():
-            user_specific_npcs_cursor = npc_collection.find({"user_id": current_user.get_id()})
-            for npc in user_specific_npcs_cursor:
-                npc_id_str = str(npc['_id'])
-                if npc_id_str not in processed_ids: 
-                    npc['_id'] = npc_id_str
-                    if 'user_id' in npc: 
-                        npc['user_id'] = str(npc['user_id'])
-                    if 'memories' not in npc: # Ensure memories field exists
-                        npc['memories'] = []
-                    npcs_list.append(npc)
-                    processed_ids.add(npc_id_str)
-        
-        current_app.logger.info(f"Returning {len(npcs_list)} NPCs for user {current_user.email}.")
-        return jsonify(npcs_list), 200
+
+        fields = NPC_SUMMARY_FIELDS
+        if request.args.get('fields'):
+            fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+            if not fields or any(not NPC_FIELD_NAME_RE.match(field) or field == 'memories' for field in fields):
+                return jsonify({"error": "Invalid 'fields' parameter."}), 400
+        projection = {field: 1 for field in fields}
+
+        try:
+            limit = min(int(request.args.get('limit', NPC_LIST_DEFAULT_LIMIT)), NPC_LIST_MAX_LIMIT)
+        except ValueError:
+            return jsonify({"error": "Invalid 'limit' parameter."}), 400
+        if limit < 1:
+            return jsonify({"error": "Invalid 'limit' parameter."}), 400
+
+        # One indexed query for both; {"user_id": None} also matches NPCs with no user_id at all
+        clauses = [{"$or": [{"user_id": None}, {"user_id": current_user.get_id()}]}]
+        if request.args.get('ids'):
+            ids = [npc_id for npc_id in request.args['ids'].split(',') if npc_id]
+            clauses.append({"_id": {"$in": ids + [ObjectId(npc_id) for npc_id in ids if ObjectId.is_valid(npc_id)]}})
+        if request.args.get('cursor'):
+            cursor_filter = _npc_cursor_filter(request.args['cursor'])
+            if cursor_filter is None:
+                return jsonify({"error": "Invalid 'cursor' parameter."}), 400
+            clauses.append(cursor_filter)
+        query = clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+        npcs_list = list(npc_collection.find(query, projection).sort("_id", 1).limit(limit + 1))
+        next_cursor = None
+        if len(npcs_list) > limit:
+            npcs_list.pop()
+            next_cursor = _encode_npc_cursor(npcs_list[-1]['_id'])
+
+        current_app.logger.info(f"Returning {len(npcs_list)} NPCs for user {current_user.email}{' (more available)' if next_cursor else ''}.")
+        response = jsonify(npcs_list)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
     except Exception as e:
         current_app.logger.error(f"Error fetching combined NPCs: {e}", exc_info=True)
         return jsonify({"error": "Failed to fetch NPCs.", "details": str(e)}), 500
 
 @npcs_bp.route('/<npc_id_str>', methods=['GET'])
 @login_required
+@conditional_on(NPC_COLLECTION_NAME, per_user=True)
 def get_single_npc(npc_id_str):
     try:
         npc_collection = mongo.db[NPC_COLLECTION_NAME]
         
-        npc_data = npc_collection.find_one({"_id": npc_id_str})
+        npc_data = npc_collection.find_one({"_id": npc_id_str}, LEGACY_MEMORIES_PROJECTION)
         
         if not npc_data and ObjectId.is_valid(npc_id_str):
-            npc_data = npc_collection.find_one({"_id": ObjectId(npc_id_str)})
+            npc_data = npc_collection.find_one({"_id": ObjectId(npc_id_str)}, LEGACY_MEMORIES_PROJECTION)
 
         if not npc_data:
             return jsonify({"error": "NPC not found"}), 404
@@ -69,13 +120,7 @@ def get_single_npc(npc_id_str):
 
         if not (is_global or is_owner):
             return jsonify({"error": "Forbidden: You do not have access to this NPC"}), 403
-        
-        npc_data['_id'] = str(npc_data['_id']) 
-        if 'user_id' in npc_data and npc_data['user_id']:
-            npc_data['user_id'] = str(npc_data['user_id'])
-        if 'memories' not in npc_data: # Ensure memories field exists
-            npc_data['memories'] = []
-            
+
         return jsonify(npc_data), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching single NPC {npc_id_str}: {e}", exc_info=True)
@@ -94,7 +139,13 @@ def upload_npc_route():
 
     if file and file.filename.endswith('.json'):
         try:
-            npc_data_raw = json.load(file.stream) 
+            if is_foundry_actor_filename(file.filename):
+                # Streamed: only the profile fields of the (several hundred KB) export are kept
+                npc_data_raw = foundry_actor_to_npc(read_foundry_actor(file.stream), file.filename)
+            else:
+                npc_data_raw = json.load(file.stream) 
+                if looks_like_foundry_actor(npc_data_raw): # A renamed Foundry VTT export
+                    npc_data_raw = foundry_actor_to_npc(foundry_actor_from_dict(npc_data_raw), file.filename)
             
             if not isinstance(npc_data_raw, dict) or 'name' not in npc_data_raw:
                 return jsonify({"error": "Invalid JSON format or missing NPC name."}), 400
@@ -123,30 +174,30 @@ def upload_npc_route():
                 'current_situation': npc_data_raw.get('current_situation'),
                 'relationships_with_pcs': npc_data_raw.get('relationships_with_pcs'),
                 'appearance': npc_data_raw.get('appearance', 'No description available.'), 
-                'source_file': file.filename,
-                'memories': [] # Initialize memories as an empty list
+                'source_file': file.filename
             }
             npc_doc_cleaned = {k: v for k, v in npc_doc.items() if v is not None}
+            npc_doc_cleaned['profile_version'] = compute_profile_version(npc_doc_cleaned)
 
             npc_collection.insert_one(npc_doc_cleaned)
+            collection_versions.bump(NPC_COLLECTION_NAME)
             
             users_collection.update_one(
                 {"_id": current_user.get_id()}, 
                 {"$addToSet": {"npc_ids": npc_id}} 
             )
+            invalidate_cached_user(current_user.get_id())
             if hasattr(current_user, 'npc_ids') and isinstance(current_user.npc_ids, list) and npc_id not in current_user.npc_ids:
                 current_user.npc_ids.append(npc_id)
 
             created_npc = npc_collection.find_one({"_id": npc_id})
-            if created_npc: 
-                 created_npc['_id'] = str(created_npc['_id'])
-                 if 'user_id' in created_npc: 
-                     created_npc['user_id'] = str(created_npc['user_id'])
 
             return jsonify({"message": f"NPC '{created_npc.get('name')}' uploaded successfully.", "npc": created_npc}), 201
 
         except json.JSONDecodeError:
             return jsonify({"error": "Invalid JSON file."}), 400
+        except FoundryImportError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             current_app.logger.error(f"Error uploading NPC: {e}", exc_info=True)
             return jsonify({"error": "Failed to upload NPC.", "details": str(e)}), 500
@@ -174,31 +225,29 @@ def update_npc(npc_id_str):
 
         npc_data_to_update.pop('_id', None)
         npc_data_to_update.pop('user_id', None) 
-        # Ensure memories field is not accidentally overwritten if not included in update payload
-        # Typically, memories would be managed by specific actions, not general PUT.
-        # If 'memories' is in npc_data_to_update, it will be set. If not, it remains unchanged by $set.
+        # Cached prompt templates are keyed on this; recompute it from the merged profile
+        npc_data_to_update.pop('profile_version', None)
+        npc_data_to_update['profile_version'] = compute_profile_version({**existing_npc, **npc_data_to_update})
+        # Memories are managed through NPC actions and stored in npc_memories, never via PUT
+        npc_data_to_update.pop('memories', None)
 
         result = npc_collection.update_one(
             {"_id": query_id_str, "user_id": current_user.get_id()}, 
             {"$set": npc_data_to_update}
         )
+        if result.modified_count:
+            collection_versions.bump(NPC_COLLECTION_NAME)
 
         if result.matched_count == 0:
             return jsonify({"error": "NPC not found or update forbidden (match failed)"}), 404 
         if result.modified_count == 0:
-            unchanged_npc = npc_collection.find_one({"_id": query_id_str})
+            unchanged_npc = npc_collection.find_one({"_id": query_id_str}, LEGACY_MEMORIES_PROJECTION)
             if unchanged_npc:
-                unchanged_npc['_id'] = str(unchanged_npc['_id'])
-                if 'user_id' in unchanged_npc: unchanged_npc['user_id'] = str(unchanged_npc['user_id'])
-                if 'memories' not in unchanged_npc: unchanged_npc['memories'] = []
                 return jsonify({"message": "NPC data was the same, no changes made.", "npc": unchanged_npc}), 200
             else: 
                 return jsonify({"error": "NPC found but could not retrieve after no-modification update."}), 500
 
-        updated_npc = npc_collection.find_one({"_id": query_id_str})
-        updated_npc['_id'] = str(updated_npc['_id'])
-        if 'user_id' in updated_npc: updated_npc['user_id'] = str(updated_npc['user_id'])
-        if 'memories' not in updated_npc: updated_npc['memories'] = [] # Ensure it's present
+        updated_npc = npc_collection.find_one({"_id": query_id_str}, LEGACY_MEMORIES_PROJECTION)
 
         return jsonify({"message": "NPC updated successfully", "npc": updated_npc}), 200
     except Exception as e:
@@ -226,11 +275,14 @@ def delete_npc(npc_id_str):
 
         if result.deleted_count == 0:
             return jsonify({"error": "NPC not found or delete failed (no document deleted)"}), 404
-        
+        collection_versions.bump(NPC_COLLECTION_NAME)
+        memory_store.delete_for_npc(query_id_str)
+
         users_collection.update_one(
             {"_id": current_user.get_id()},
             {"$pull": {"npc_ids": npc_id_str}} 
         )
+        invalidate_cached_user(current_user.get_id())
         if hasattr(current_user, 'npc_ids') and isinstance(current_user.npc_ids, list) and npc_id_str in current_user.npc_ids:
             current_user.npc_ids.remove(npc_id_str)
 
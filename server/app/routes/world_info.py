@@ -1,6 +1,8 @@
 # server/app/routes/world_info.py
 from flask import Blueprint, jsonify, current_app, request
 from ..utils.db import mongo
+from ..services.world_knowledge import WORLD_COLLECTIONS
+from ..utils.versions import collection_versions, conditional_on
 from flask_login import login_required # Assuming only logged-in users can manage world info
 from bson import ObjectId # For handling MongoDB ObjectIds
 import uuid # If you prefer string UUIDs for new items
@@ -10,14 +12,10 @@ world_info_bp = Blueprint('world_info', __name__)
 # --- Events CRUD ---
 @world_info_bp.route('/events', methods=['GET'])
 @login_required
+@conditional_on('world_events')
 def get_world_events():
     try:
-        events_cursor = mongo.db.world_events.find({})
-        events = []
-        for event in events_cursor:
-            event['_id'] = str(event['_id']) # Ensure _id is string
-            events.append(event)
-        return jsonify(events), 200
+        return jsonify(list(mongo.db.world_events.find({}))), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching world events: {e}", exc_info=True)
         return jsonify({"error": "Failed to fetch world events."}), 500
@@ -43,8 +41,7 @@ def create_world_event():
             # Add any other relevant fields
         }
         mongo.db.world_events.insert_one(new_event)
-        # Convert _id to string for the response if it was an ObjectId
-        new_event['_id'] = str(new_event['_id']) 
+        collection_versions.bump('world_events')
         return jsonify({"message": "World event created successfully.", "event": new_event}), 201
     except Exception as e:
         current_app.logger.error(f"Error creating world event: {e}", exc_info=True)
@@ -67,6 +64,8 @@ def update_world_event(event_id_str):
         update_data = {k: v for k, v in data.items() if k != '_id'} # Don't allow changing _id
 
         result = mongo.db.world_events.update_one({"_id": query_id}, {"$set": update_data})
+        if result.modified_count:
+            collection_versions.bump('world_events')
 
         if result.matched_count == 0:
             return jsonify({"error": "World event not found."}), 404
@@ -74,8 +73,6 @@ def update_world_event(event_id_str):
             return jsonify({"message": "World event data was the same, no changes made."}), 200
         
         updated_event = mongo.db.world_events.find_one({"_id": query_id})
-        if updated_event:
-            updated_event['_id'] = str(updated_event['_id'])
         return jsonify({"message": "World event updated successfully.", "event": updated_event}), 200
     except Exception as e:
         current_app.logger.error(f"Error updating world event {event_id_str}: {e}", exc_info=True)
@@ -91,6 +88,8 @@ def delete_world_event(event_id_str):
             pass
 
         result = mongo.db.world_events.delete_one({"_id": query_id})
+        if result.deleted_count:
+            collection_versions.bump('world_events')
         if result.deleted_count == 0:
             return jsonify({"error": "World event not found."}), 404
         return jsonify({"message": "World event deleted successfully."}), 200
@@ -101,14 +100,10 @@ def delete_world_event(event_id_str):
 # --- Locations CRUD (Similar structure) ---
 @world_info_bp.route('/locations', methods=['GET'])
 @login_required
+@conditional_on('world_locations')
 def get_world_locations():
     try:
-        locations_cursor = mongo.db.world_locations.find({})
-        locations = []
-        for loc in locations_cursor:
-            loc['_id'] = str(loc['_id'])
-            locations.append(loc)
-        return jsonify(locations), 200
+        return jsonify(list(mongo.db.world_locations.find({}))), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching world locations: {e}", exc_info=True)
         return jsonify({"error": "Failed to fetch world locations."}), 500
@@ -117,14 +112,10 @@ def get_world_locations():
 # --- Religions CRUD (Similar structure) ---
 @world_info_bp.route('/religions', methods=['GET'])
 @login_required
+@conditional_on('world_religions')
 def get_world_religions():
     try:
-        religions_cursor = mongo.db.world_religions.find({})
-        religions = []
-        for rel in religions_cursor:
-            rel['_id'] = str(rel['_id'])
-            religions.append(rel)
-        return jsonify(religions), 200
+        return jsonify(list(mongo.db.world_religions.find({}))), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching world religions: {e}", exc_info=True)
         return jsonify({"error": "Failed to fetch world religions."}), 500
@@ -133,21 +124,14 @@ def get_world_religions():
 # Helper route to get all world info at once (as used by dashboard)
 @world_info_bp.route('/all', methods=['GET']) # Changed from '' to '/all'
 @login_required
+@conditional_on(*WORLD_COLLECTIONS)
 def get_all_world_info():
     try:
-        events_cursor = mongo.db.world_events.find({})
-        events = [{k: str(v) if k == '_id' else v for k, v in event.items()} for event in events_cursor]
-        
-        locations_cursor = mongo.db.world_locations.find({})
-        locations = [{k: str(v) if k == '_id' else v for k, v in location.items()} for location in locations_cursor]
-
-        religions_cursor = mongo.db.world_religions.find({})
-        religions = [{k: str(v) if k == '_id' else v for k, v in religion.items()} for religion in religions_cursor]
-
+        # Documents go to the JSON provider as they come off the cursors; it encodes the BSON types
         return jsonify({
-            "events": events,
-            "locations": locations,
-            "religions": religions
+            "events": list(mongo.db.world_events.find({})),
+            "locations": list(mongo.db.world_locations.find({})),
+            "religions": list(mongo.db.world_religions.find({}))
         }), 200
     except Exception as e:
         current_app.logger.error(f"Error fetching all world info: {e}", exc_info=True)
@@ -1,25 +1,46 @@
 # app/services/auth_service.py
 from flask import current_app
-# from flask_bcrypt import Bcrypt # Using direct bcrypt as per previous setup
-import bcrypt # ENSURE THIS IMPORT IS PRESENT
 from ..utils.db import mongo
+from ..utils.metrics import metrics
+from .registry import get_services
 from ..models import User # Assuming your User model is defined
 import uuid
 from datetime import datetime
 
+# Fields the session User is built from; the password hash is deliberately left out of the cache
+SESSION_USER_PROJECTION = {"email": 1, "google_id": 1, "name": 1, "picture": 1, "npc_ids": 1, "created_at": 1}
+
+
+def load_session_user_data(user_id):
+    """User document for Flask-Login's load_user, from the per-worker user cache when fresh."""
+    user_cache = get_services().user_cache
+    user_data = user_cache.get(user_id)
+    if user_data is None:
+        user_data = mongo.db.users.find_one({"_id": user_id}, SESSION_USER_PROJECTION)
+        if user_data:
+            user_cache.set(user_id, user_data)
+    return user_data
+
+
+def invalidate_cached_user(user_id):
+    """Call after changing a user document, so the next request reloads it."""
+    if user_id:
+        get_services().user_cache.invalidate(str(user_id))
+
+
 def register_user_s(email, password):
     users_collection = mongo.db.users
     existing_user = users_collection.find_one({"email": email})
     if existing_user:
         return None, "User with this email already exists"
 
-    # Using direct bcrypt
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()) # This line should now work
+    # Hashed on the bounded password pool; raises PasswordHasherBusyError if it is saturated
+    hashed_password = get_services().password_hasher.hash(password)
 
     new_user_data = {
         "_id": str(uuid.uuid4()), 
         "email": email,
-        "password_hash": hashed_password.decode('utf-8'),
+        "password_hash": hashed_password,
         "created_at": datetime.utcnow(),
         "google_id": None,
         "name": None, # You might want to add a name field to your registration form
@@ -27,6 +48,7 @@ def register_user_s(email, password):
         "npc_ids": [] 
     }
     result = users_collection.insert_one(new_user_data)
+    invalidate_cached_user(new_user_data["_id"])
     created_user = users_collection.find_one({"_id": new_user_data["_id"]})
     if created_user:
         del created_user["password_hash"] 
@@ -38,7 +60,19 @@ def login_user_s(email, password):
     if not user_data or not user_data.get('password_hash'): # Check if password_hash exists
         return None, "Invalid email or password"
 
-    if bcrypt.checkpw(password.encode('utf-8'), user_data['password_hash'].encode('utf-8')):
+    password_hasher = get_services().password_hasher
+    if password_hasher.verify(password, user_data['password_hash']):
+        if password_hasher.needs_rehash(user_data['password_hash']):
+            # BCRYPT_ROUNDS changed since this hash was made; upgrade it while we have the password
+            try:
+                users_collection.update_one(
+                    {"_id": user_data["_id"], "password_hash": user_data['password_hash']},
+                    {"$set": {"password_hash": password_hasher.hash(password)}}
+                )
+                metrics.incr("password_hash.rehashed")
+                invalidate_cached_user(user_data["_id"])
+            except Exception as e:
+                current_app.logger.warning(f"Could not rehash password for {email}: {e}")
         user_data_safe = {k: v for k, v in user_data.items() if k != "password_hash"}
         return user_data_safe, None
     else:
@@ -62,6 +96,7 @@ def get_or_create_google_user(user_info):
         "npc_ids": []
     }
     users_collection.insert_one(new_user_data)
+    invalidate_cached_user(new_user_data["_id"])
     # Return a safe version without the (non-existent) password hash
     del new_user_data["password_hash"] 
     return new_user_data, None
\ No newline at end of file
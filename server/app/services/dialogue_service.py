@@ -1,139 +1,166 @@
 # server/app/services/dialogue_service.py
-import google.generativeai as genai # type: ignore
 from flask import current_app, jsonify 
 from ..utils.db import mongo 
+from ..utils.singleflight import SingleFlight
+from .world_knowledge import world_knowledge_cache
+from .memory_index import tokenize, memory_term_frequencies
+from .memory_store import memory_store
+from .prompt_templates import get_compiled_npc_prompt
+from .prompt_budget import budget_for
+from .llm_backends import LLMBlockedError, LLMJSONError
+from .resilience import LLMUnavailableError
+from .scheduler import WORK_CLASS_BACKGROUND, ANONYMOUS_USER
+from .memory_batcher import MemoryExtractionBatcher
+from ..utils.metrics import metrics
 import random 
 import uuid 
 from datetime import datetime 
 import json 
+import hashlib
 import re # For keyword extraction
+from concurrent.futures import as_completed
+from contextlib import nullcontext
 
-# Refinement 5: Clarity of Memory Slice Limit
-MAX_NPC_MEMORIES = 20 # Define as a constant
+MEMORY_JOB_TYPE = 'submit_memory'
+DIALOGUE_GENERATION_CONFIG = {"temperature": 0.8, "top_p": 0.95, "max_output_tokens": 200}
+MEMORY_EXTRACTION_CONFIG = {"temperature": 0.4, "max_output_tokens": 400}
+MEMORY_BATCH_MAX_OUTPUT_TOKENS = 4096
+MEMORY_DETAIL_FIELDS = ("key_entities", "key_facts_events", "npc_sentiment_tag", "ai_generated_summary")
+# Upper bounds on conversation turns offered to the prompt budget; the budget may keep fewer
+DIALOGUE_HISTORY_MAX_TURNS = 8
+ACTION_HISTORY_MAX_TURNS = 6
+# scene.js sends the last 10 turns with every request; speculation predicts the same window
+CLIENT_HISTORY_WINDOW = 10
+
+
+def _strip_dialogue_prefixes(npc_name, text):
+    """Removes 'Name:' / 'Dialogue:' style labels from the start of model output."""
+    if text.lower().startswith(f"{npc_name.lower()}:"): text = text[len(npc_name)+1:].lstrip()
+    common_ai_prefixes = ["dialogue:", "response:", f"{npc_name} says:", "spokendialogue:"]
+    for prefix in common_ai_prefixes:
+        if text.lower().startswith(prefix.lower()): text = text[len(prefix):].lstrip()
+    return text
+
+
+class IncrementalDialogueCleaner:
+    """
+    Streaming counterpart of DialogueService._clean_dialogue_text.
+    Buffers the first few characters until any label prefix can be recognised, drops an
+    opening quote, and withholds trailing whitespace / a possible closing quote until
+    more text (or the end of the stream) shows whether it is really the end.
+    """
+    def __init__(self, npc_name):
+        self.npc_name = npc_name
+        self.raw_text = ""
+        self._head_limit = 2 * len(npc_name) + len("spokendialogue:") + 8
+        self._head = ""
+        self._started = False
+        self._quote = None
+        self._tail = ""
+
+    def feed(self, chunk):
+        """Accepts raw model text, returns the cleaned text that is safe to show now."""
+        self.raw_text += chunk
+        if not self._started:
+            self._head += chunk
+            if len(self._head.lstrip()) < self._head_limit:
+                return ""
+            return self._start()
+        return self._release(chunk)
+
+    def finish(self):
+        """Returns whatever was still withheld once the stream has ended."""
+        pending = "" if self._started else self._start()
+        tail = self._tail.rstrip()
+        self._tail = ""
+        if self._quote and tail.endswith(self._quote):
+            tail = tail[:-1].rstrip()
+        return pending + tail
+
+    def _start(self):
+        self._started = True
+        text = _strip_dialogue_prefixes(self.npc_name, self._head.lstrip())
+        if text[:1] in ('"', "'"):
+            self._quote = text[0]
+            text = text[1:]
+        return self._release(text)
+
+    def _release(self, text):
+        combined = self._tail + text
+        pattern = r'\s*' + (re.escape(self._quote) + r'?\s*' if self._quote else '') + r'$'
+        cut = re.search(pattern, combined).start()
+        self._tail = combined[cut:]
+        return combined[:cut]
 
 class DialogueService:
-    def __init__(self):
-        print("--- PRINT DEBUG: DialogueService __init__ ENTERED ---")
-        current_app.logger.critical("--- CRITICAL DEBUG: DialogueService __init__ ENTERED ---") 
-        self.gemini_api_key = current_app.config.get('GEMINI_API_KEY') or current_app.config.get('GOOGLE_API_KEY')
-        print(f"--- PRINT DEBUG: DialogueService __init__ - API Key Retrieved: {'SET' if self.gemini_api_key else 'NOT SET'} ---")
-        current_app.logger.critical(f"--- CRITICAL DEBUG: DialogueService __init__ - API Key Retrieved: {'SET' if self.gemini_api_key else 'NOT SET'} ---")
-        if not self.gemini_api_key:
-            print("--- PRINT DEBUG: DialogueService __init__ - Gemini API key IS MISSING. ---")
-            current_app.logger.critical("--- CRITICAL DEBUG: DialogueService __init__ - Gemini API key IS MISSING. ---")
-            self.model = None
-            return 
-        try:
-            print("--- PRINT DEBUG: DialogueService __init__ - Attempting to configure genai and initialize model... ---")
-            current_app.logger.info("--- INFO DEBUG: DialogueService __init__ - Attempting to configure genai and initialize model... ---")
-            if not hasattr(genai, '_is_configured_globally_by_bugbear_v4'): 
-                print("--- PRINT DEBUG: DialogueService __init__ - Calling genai.configure()... ---")
-                current_app.logger.info("--- INFO DEBUG: Attempting to call genai.configure()... ---")
-                genai.configure(api_key=self.gemini_api_key)
-                genai._is_configured_globally_by_bugbear_v4 = True 
-                print("--- PRINT DEBUG: DialogueService __init__ - genai.configure() CALLED SUCCESSFULLY. ---")
-                current_app.logger.critical("--- CRITICAL DEBUG: DialogueService __init__ - genai.configure() CALLED SUCCESSFULLY. ---")
-            else:
-                print("--- PRINT DEBUG: DialogueService __init__ - genai already configured globally by Bugbear. ---")
-                current_app.logger.info("--- INFO DEBUG: genai already configured globally by Bugbear. ---")
-            model_name = current_app.config.get('GEMINI_MODEL_NAME', 'gemini-1.5-flash-latest')
-            print(f"--- PRINT DEBUG: DialogueService __init__ - Attempting to initialize GenerativeModel with name: {model_name} ---")
-            current_app.logger.info(f"--- INFO DEBUG: Attempting to initialize GenerativeModel with name: {model_name} ---")
-            self.model = genai.GenerativeModel(model_name)
-            print(f"--- PRINT DEBUG: DialogueService __init__ - GenerativeModel '{model_name}' INITIALIZED SUCCESSFULLY. ---")
-            current_app.logger.critical(f"--- CRITICAL DEBUG: DialogueService __init__ - GenerativeModel '{model_name}' INITIALIZED SUCCESSFULLY. ---")
-        except Exception as e:
-            print(f"--- PRINT DEBUG: DialogueService __init__ - FAILED to initialize GenerativeModel or configure genai: {e} ---")
-            current_app.logger.critical(f"--- CRITICAL DEBUG: DialogueService __init__ - FAILED to initialize GenerativeModel or configure genai: {e} ---")
-            current_app.logger.exception("Full exception during DialogueService init:") 
-            self.model = None
+    def __init__(self, llm, response_cache=None, cached_actions=(), cache_refresh_actions=(), job_queue=None, scheduler=None, speculator=None):
+        # Built once per worker by the ServiceRegistry. llm is an LLMBackend (Gemini, or the local stub).
+        self.llm = llm
+        # Concurrent identical model calls (same prompt, config and purpose) share one upstream request
+        self.in_flight = SingleFlight('llm')
+        # Fair-share admission of model calls per user and work class (see services/scheduler.py)
+        self.scheduler = scheduler
+        # Optional speculative pre-generation of follow-up suggestions (see speculate_suggestions)
+        self.speculator = speculator
+        # Set by enable_memory_batching; None means one extraction call per memory
+        self.memory_batcher = None
+        # Suggestion actions in cached_actions read and fill the response cache; actions in
+        # cache_refresh_actions (e.g. regenerate_topics) always call the model but store the fresh result.
+        self.response_cache = response_cache
+        self.cached_actions = frozenset(cached_actions)
+        self.cache_refresh_actions = frozenset(cache_refresh_actions)
+        # Memory submissions run on the background job queue when one is configured
+        self.job_queue = job_queue
+        if job_queue is not None:
+            job_queue.register_handler(MEMORY_JOB_TYPE, self._run_memory_job)
+
+    @property
+    def available(self):
+        return self.llm.available
+
+    def _model_slot(self, user_id, purpose, work_class=None, ticket=None):
+        return self.scheduler.slot(user_id, purpose, work_class, ticket=ticket) if self.scheduler is not None else nullcontext()
+
+    def _generate(self, prompt, generation_config, purpose, as_json=False, user_id=None, work_class=None, ticket=None):
+        """Calls the backend, coalescing with any identical call already in flight.
+        Only the call that goes upstream waits for a scheduler slot. The work class is part of
+        the key, so a call never ends up waiting at a lower class's priority than its own."""
+        key = f"{purpose}:{work_class or 'default'}:{'json' if as_json else 'text'}:{self._response_cache_key(prompt, generation_config)}"
+        call = self.llm.generate_json if as_json else self.llm.generate
+
+        def _call_upstream():
+            with self._model_slot(user_id, purpose, work_class, ticket):
+                return call(prompt, generation_config, purpose=purpose)
+
+        result, shared = self.in_flight.do(key, _call_upstream)
+        if shared:
+            current_app.logger.info(f"--- INFO DEBUG: Shared an in-flight '{purpose}' model call instead of issuing a duplicate. ---")
+        return result
 
     def _get_world_knowledge_summary(self):
-        knowledge_parts = []
-        try:
-            recent_events = list(mongo.db.world_events.find().sort("status", -1).limit(3)) 
-            if recent_events:
-                knowledge_parts.append("Some Recent World Events of Note:")
-                for event in recent_events:
-                    knowledge_parts.append(f"- {event.get('name')}: {event.get('description', '')[:100]}... (Impact: {event.get('impact', '')[:70]}...) Status: {event.get('status', 'Unknown')}.")
-            prominent_locations = list(mongo.db.world_locations.find().limit(2)) 
-            if prominent_locations:
-                knowledge_parts.append("\nKey Locations in the World:")
-                for loc in prominent_locations:
-                    knowledge_parts.append(f"- {loc.get('name')} ({loc.get('type')}): {loc.get('description', '')[:100]}... Current Mood: {loc.get('current_mood', 'Normal')}.")
-            prominent_religions = list(mongo.db.world_religions.find().limit(2))
-            if prominent_religions:
-                knowledge_parts.append("\nProminent Deities or Beliefs:")
-                for religion in prominent_religions:
-                    domains = religion.get('domains', [])
-                    domains_str = ', '.join(domains) if isinstance(domains, list) else str(domains)
-                    knowledge_parts.append(f"- {religion.get('name')}: Known for {domains_str}. Common saying: \"{religion.get('common_saying','')}\"")
-        except Exception as e:
-            current_app.logger.error(f"Error fetching world knowledge from DB: {e}")
-            knowledge_parts.append("Error retrieving some world knowledge details.")
-        return "\n".join(knowledge_parts) if knowledge_parts else "General world knowledge is currently undefined or sparse."
+        return world_knowledge_cache.get_summary()
 
     def _extract_keywords(self, text, num_keywords=5):
-        """Rudimentary keyword extraction."""
-        if not text or not isinstance(text, str):
-            return []
-        text = text.lower()
-        # Remove common punctuation and split into words
-        words = re.findall(r'\b\w+\b', text)
-        # Very simple stopword list (expand as needed)
-        stopwords = set(["a", "an", "the", "is", "are", "was", "were", "of", "in", "on", "at", "to", "for", "and", "or", "but", "i", "you", "he", "she", "it", "we", "they", "me", "him", "her", "us", "them", "my", "your", "his", "its", "our", "their", "tell", "about", "what", "who", "when", "where", "why", "how", "npc", "name", "scene", "context"])
-        
-        # Count frequency of non-stopwords
+        """Rudimentary keyword extraction: the most frequent non-stopword tokens."""
         word_counts = {}
-        for word in words:
-            if word not in stopwords and len(word) > 2: # Ignore very short words
-                word_counts[word] = word_counts.get(word, 0) + 1
-        
-        # Sort by frequency
+        for word in tokenize(text):
+            word_counts[word] = word_counts.get(word, 0) + 1
         sorted_keywords = sorted(word_counts.items(), key=lambda item: item[1], reverse=True)
         return [kw[0] for kw in sorted_keywords[:num_keywords]]
 
     def _get_npc_memories_summary(self, npc_profile, current_scene_context):
         # Refinement 1: Memory Recall Specificity
-        if not npc_profile or 'memories' not in npc_profile or not npc_profile['memories']:
+        if not npc_profile or not npc_profile.get('_id'):
             return "This NPC has no specific memories recorded yet."
 
-        all_memories = npc_profile.get('memories', [])
-        if not all_memories:
-            return "This NPC has no specific memories recorded."
-
         scene_keywords = self._extract_keywords(current_scene_context, num_keywords=3)
-        
-        relevant_memories = []
-        for mem in all_memories:
-            relevance_score = 0
-            memory_text_corpus = f"{mem.get('dialogue_snippet','')} {mem.get('extracted_facts_events','')} {' '.join(mem.get('extracted_entities',[]))} {mem.get('ai_generated_summary','')}".lower()
-            
-            for keyword in scene_keywords:
-                if keyword in memory_text_corpus:
-                    relevance_score += 2 # Higher score for keyword match
-            
-            # Add a recency factor (e.g., more recent memories get a slight boost)
-            time_delta = datetime.utcnow() - (mem.get('timestamp', datetime.utcnow()) or datetime.utcnow())
-            if time_delta.days < 1: relevance_score += 1.5 # Very recent
-            elif time_delta.days < 7: relevance_score += 1   # Within a week
-            elif time_delta.days < 30: relevance_score += 0.5 # Within a month
-            
-            if relevance_score > 0:
-                relevant_memories.append((mem, relevance_score))
-
-        # Sort by relevance, then by recency as a tie-breaker
-        relevant_memories.sort(key=lambda x: (x[1], x[0].get('timestamp', datetime.min)), reverse=True)
-        
-        # Take top 3-5 relevant memories, or just most recent if no keyword matches
-        if relevant_memories:
-            selected_memories = [mem_tuple[0] for mem_tuple in relevant_memories[:3]]
-        else: # Fallback to most recent if no keyword matches found
-            selected_memories = sorted(all_memories, key=lambda m: m.get('timestamp', datetime.min), reverse=True)[:2]
-
+        # Top 3 by keyword match + recency, or just the most recent if nothing scores
+        selected_memories = memory_store.top_k(npc_profile['_id'], scene_keywords, k=3)
+        if not selected_memories:
+            selected_memories = memory_store.recent(npc_profile['_id'], 2)
 
         if not selected_memories:
-            return "No particularly relevant memories found for the current context."
+            return "This NPC has no specific memories recorded yet."
 
         summary_lines = [f"\n=== {npc_profile.get('name', 'The NPC')}'s Relevant Memories ==="]
         for mem in selected_memories:
@@ -146,96 +173,183 @@ class DialogueService:
         return "\n".join(summary_lines)
 
 
-    def generate_dialogue_for_npc_in_scene(self, npc_profile, scene_description, conversation_history):
-        # (Code from previous correct version, with personality_traits handling improved)
-        print("--- PRINT DEBUG: DialogueService generate_dialogue_for_npc_in_scene (SYNC) CALLED ---")
-        current_app.logger.critical("--- CRITICAL DEBUG: DialogueService generate_dialogue_for_npc_in_scene (SYNC) CALLED ---")
-        if not self.model:
-            current_app.logger.critical("--- CRITICAL DEBUG: generate_dialogue_for_npc_in_scene - Gemini model is None. ---")
+    def build_dialogue_prompt(self, npc_profile, scene_description, conversation_history, world_knowledge_summary=None):
+        """Assembles the full dialogue prompt. world_knowledge_summary may be passed in when the
+        caller has already fetched it for several NPCs (e.g. a whole scene)."""
+        npc_name = npc_profile.get('name', 'The NPC')
+        if world_knowledge_summary is None:
+            world_knowledge_summary = self._get_world_knowledge_summary()
+        npc_memory_summary = self._get_npc_memories_summary(npc_profile, scene_description)
+        compiled = get_compiled_npc_prompt(npc_profile) # NPC-static block, rendered once per profile version
+        budget = budget_for('dialogue')
+        budget.add('profile', compiled.dialogue_profile, required=True)
+        budget.add('backstory', compiled.backstory, priority=50)
+        budget.add('profile_details', compiled.dialogue_profile_details, priority=80)
+        budget.add('world_knowledge', "\n=== General World Knowledge & Recent Events (You are aware of this as background context) ===\n" + (world_knowledge_summary if world_knowledge_summary else "The world is a vast place..."), priority=40)
+        budget.add('memories', npc_memory_summary, priority=60)
+        budget.add('scene', "\n=== Current Scene Context (Provided by GM) ===\n" + scene_description, required=True)
+        budget.add_items(
+            'history', f"\n=== Recent Turns in Conversation (Your lines are as {npc_name}) ===",
+            [f"{entry.get('speaker', 'Unknown')}: \"{entry.get('text', '')}\"" for entry in conversation_history or []],
+            priority=70, max_items=DIALOGUE_HISTORY_MAX_TURNS
+        )
+        task_lines = []
+        task_lines.append(f"\n=== Your Task: {npc_name}'s Cinematic Dialogue Line ===")
+        task_lines.append(f"Based on your detailed profile ({npc_name}), your awareness of the world knowledge, YOUR RELEVANT MEMORIES, and the current scene, deliver your next spoken line(s). Aim for dialogue that is memorable, reveals character, and feels like it belongs in a compelling story or movie. How would YOU, {npc_name}, truly respond in this moment to \"{scene_description}\"?")
+        task_lines.append(f"Provide ONLY the dialogue spoken by {npc_name}. If short, make it count. If a longer (1-3 sentences) impactful statement is appropriate, deliver that.")
+        task_lines.append("DIALOGUE RESPONSE:")
+        budget.add('task', "\n".join(task_lines), required=True)
+        return budget.render()
+
+    def _clean_dialogue_text(self, npc_name, generated_text):
+        """Strips speaker/label prefixes and wrapping quotes the model sometimes adds."""
+        generated_text = _strip_dialogue_prefixes(npc_name, generated_text)
+        if len(generated_text) > 1 and ((generated_text.startswith('"') and generated_text.endswith('"')) or (generated_text.startswith("'") and generated_text.endswith("'"))):
+            generated_text = generated_text[1:-1]
+        return generated_text
+
+    def generate_dialogue_for_npc_in_scene(self, npc_profile, scene_description, conversation_history, world_knowledge_summary=None, user_id=None):
+        if not self.available:
+            current_app.logger.critical("--- CRITICAL DEBUG: generate_dialogue_for_npc_in_scene - LLM backend is unavailable. ---")
             return "[Error: AI Model Not Initialized. Check server logs for API key/configuration issues.]"
         npc_name = npc_profile.get('name', 'The NPC')
         current_app.logger.info(f"--- INFO DEBUG: Generating dialogue for: {npc_name} ---")
-        world_knowledge_summary = self._get_world_knowledge_summary()
-        npc_memory_summary = self._get_npc_memories_summary(npc_profile, scene_description)
-        prompt_lines = []
-        prompt_lines.append(f"You are an AI masterfully roleplaying as {npc_name}, a character in a rich fantasy world. Your goal is to deliver compelling, cinematic dialogue that reveals your character's depth, advances the narrative, and engages the Game Master (GM).")
-        prompt_lines.append(f"The GM will describe a scene or pose a question. Your response MUST be a single, impactful, in-character line or two of spoken dialogue from {npc_name}'s perspective. Do NOT narrate actions, describe thoughts out of character, or break character. Focus purely on what {npc_name} says aloud.")
-        prompt_lines.append(f"\n=== {npc_name}'s In-Depth Character Profile ===")
-        prompt_lines.append(f"Name: {npc_name}")
-        prompt_lines.append(f"Race: {npc_profile.get('race', 'Unknown')}")
-        prompt_lines.append(f"Class/Role: {npc_profile.get('class', 'Unknown')}") 
-        prompt_lines.append(f"Appearance: {npc_profile.get('appearance', 'Not clearly described.')}")
-        
-        personality_traits_input = npc_profile.get('personality_traits', [])
-        if isinstance(personality_traits_input, str): #This should ideally be handled at data ingestion (load_npc_data.py)
-            personality_traits_list = [trait.strip() for trait in personality_traits_input.split(',') if trait.strip()]
-        elif isinstance(personality_traits_input, list):
-            personality_traits_list = personality_traits_input
-        else:
-            personality_traits_list = []
-            current_app.logger.warning(f"Personality traits for {npc_name} was not a string or list: {type(personality_traits_input)}")
-
-        if personality_traits_list:
-            prompt_lines.append(f"Core Personality Traits: {', '.join(personality_traits_list)}. These traits MUST be evident in your speech and attitude. Consider the subtext they imply.")
-        else: # Fallback if list is empty
-            prompt_lines.append("Core Personality Traits: Not specified. (Adopt a generally observant and cautious demeanor, reacting based on the immediate context).")
-
-        if npc_profile.get('backstory'): prompt_lines.append(f"Key Backstory Elements: {npc_profile['backstory'][:400]}...") 
-        else: prompt_lines.append("Key Backstory Elements: Not specified.")
-        if npc_profile.get('motivations'): prompt_lines.append(f"Driving Motivations: {npc_profile['motivations']}. Your dialogue should reflect these underlying goals and desires, even if subtly.")
-        else: prompt_lines.append("Driving Motivations: Not specified.")
-        if npc_profile.get('flaws'): prompt_lines.append(f"Significant Flaws/Weaknesses: {npc_profile['flaws']}. These can create internal conflict or lead to characteristic reactions or mistakes in your speech.")
-        else: prompt_lines.append("Significant Flaws/Weaknesses: Not specified.")
-        if npc_profile.get('speech_patterns'): prompt_lines.append(f"Speech Patterns/Voice: {npc_profile.get('speech_patterns')}")
-        prompt_lines.append("\n=== General World Knowledge & Recent Events (You are aware of this as background context) ===")
-        prompt_lines.append(world_knowledge_summary if world_knowledge_summary else "The world is a vast place...")
-        prompt_lines.append(npc_memory_summary)
-        prompt_lines.append("\n=== Current Scene Context (Provided by GM) ===")
-        prompt_lines.append(scene_description)
-        if conversation_history:
-            prompt_lines.append("\n=== Recent Turns in Conversation (Your lines are as {npc_name}) ===")
-            for entry in conversation_history[-5:]: 
-                prompt_lines.append(f"{entry.get('speaker', 'Unknown')}: \"{entry.get('text', '')}\"")
-        prompt_lines.append(f"\n=== Your Task: {npc_name}'s Cinematic Dialogue Line ===")
-        prompt_lines.append(f"Based on your detailed profile ({npc_name}), your awareness of the world knowledge, YOUR RELEVANT MEMORIES, and the current scene, deliver your next spoken line(s). Aim for dialogue that is memorable, reveals character, and feels like it belongs in a compelling story or movie. How would YOU, {npc_name}, truly respond in this moment to \"{scene_description}\"?")
-        prompt_lines.append("Provide ONLY the dialogue spoken by {npc_name}. If short, make it count. If a longer (1-3 sentences) impactful statement is appropriate, deliver that.")
-        prompt_lines.append("DIALOGUE RESPONSE:")
-        full_prompt = "\n".join(prompt_lines)
+        full_prompt = self.build_dialogue_prompt(npc_profile, scene_description, conversation_history, world_knowledge_summary)
         current_app.logger.debug(f"--- FULL PROMPT FOR {npc_name} ---\n{full_prompt}\n--- END OF FULL PROMPT ---")
         try:
-            safety_settings = self.get_default_safety_settings()
-            generation_config = genai.types.GenerationConfig(temperature=0.8, top_p=0.95, max_output_tokens=200)
-            response = self.model.generate_content(full_prompt, generation_config=generation_config, safety_settings=safety_settings) 
-            if response.parts:
-                generated_text = "".join(part.text for part in response.parts if hasattr(part, 'text')).strip()
-                if generated_text.lower().startswith(f"{npc_name.lower()}:"): generated_text = generated_text[len(npc_name)+1:].strip()
-                common_ai_prefixes = ["dialogue:", "response:", f"{npc_name} says:", "spokendialogue:"]
-                for prefix in common_ai_prefixes:
-                    if generated_text.lower().startswith(prefix.lower()): generated_text = generated_text[len(prefix):].strip()
-                if len(generated_text) > 1 and ((generated_text.startswith('"') and generated_text.endswith('"')) or (generated_text.startswith("'") and generated_text.endswith("'"))):
-                    generated_text = generated_text[1:-1]
-                current_app.logger.info(f"Successfully generated dialogue for {npc_name}: \"{generated_text}\"")
-                return generated_text if generated_text else f"[{npc_name} pauses, considering the moment.]" 
-            else: 
-                block_reason_msg = "Response contained no usable parts."
-                if hasattr(response, 'prompt_feedback') and response.prompt_feedback and response.prompt_feedback.block_reason:
-                    block_reason_msg = response.prompt_feedback.block_reason_message
-                current_app.logger.error(f"Prompt for {npc_name} BLOCKED/empty. Reason: {block_reason_msg}. Feedback: {response.prompt_feedback if hasattr(response, 'prompt_feedback') else 'N/A'}")
-                return f"[{npc_name} seems unable to respond. AI Reason: {block_reason_msg}]"
+            generated_text = self._generate(full_prompt, DIALOGUE_GENERATION_CONFIG, 'dialogue', user_id=user_id)
+            generated_text = self._clean_dialogue_text(npc_name, generated_text)
+            current_app.logger.info(f"Successfully generated dialogue for {npc_name}: \"{generated_text}\"")
+            return generated_text if generated_text else f"[{npc_name} pauses, considering the moment.]" 
+        except LLMBlockedError as blocked:
+            current_app.logger.error(f"Prompt for {npc_name} BLOCKED/empty. Reason: {blocked.reason}.")
+            return f"[{npc_name} seems unable to respond. AI Reason: {blocked.reason}]"
+        except LLMUnavailableError as e:
+            current_app.logger.warning(f"Dialogue for {npc_name} rejected without calling the AI service: {e}")
+            return f"[{npc_name} hesitates. The AI service is busy right now; try again shortly.]"
         except Exception as e:
-            current_app.logger.critical(f"Exception during Gemini API call for {npc_name}: {e}", exc_info=True)
+            current_app.logger.critical(f"Exception during LLM call ({self.llm.name}) for {npc_name}: {e}", exc_info=True)
             return f"[Error: AI service issue for {npc_name}. Check logs.]"
 
-    def _extract_memory_details_with_ai(self, npc_profile, dialogue_exchange, scene_context_for_memory):
+    def stream_dialogue_for_npc_in_scene(self, npc_profile, scene_description, conversation_history, world_knowledge_summary=None, user_id=None):
+        """
+        Streaming variant of generate_dialogue_for_npc_in_scene.
+        Yields ('delta', text) as cleaned text becomes available, then either
+        ('done', full_cleaned_text) or ('error', message).
+        """
+        npc_name = npc_profile.get('name', 'The NPC')
+        if not self.available:
+            current_app.logger.critical("--- CRITICAL DEBUG: stream_dialogue_for_npc_in_scene - LLM backend is unavailable. ---")
+            yield 'error', "AI Model Not Initialized. Check server logs for API key/configuration issues."
+            return
+        full_prompt = self.build_dialogue_prompt(npc_profile, scene_description, conversation_history, world_knowledge_summary)
+        current_app.logger.debug(f"--- FULL PROMPT FOR {npc_name} (STREAM) ---\n{full_prompt}\n--- END OF FULL PROMPT ---")
+        cleaner = IncrementalDialogueCleaner(npc_name)
+        try:
+            with self._model_slot(user_id, 'dialogue'):
+                for chunk_text in self.llm.stream(full_prompt, DIALOGUE_GENERATION_CONFIG, purpose='dialogue'):
+                    cleaned = cleaner.feed(chunk_text)
+                    if cleaned:
+                        yield 'delta', cleaned
+            remainder = cleaner.finish()
+            if remainder:
+                yield 'delta', remainder
+        except LLMBlockedError as blocked:
+            current_app.logger.error(f"Streaming prompt for {npc_name} BLOCKED/empty. Reason: {blocked.reason}.")
+            yield 'error', f"{npc_name} seems unable to respond. AI Reason: {blocked.reason}"
+            return
+        except LLMUnavailableError as e:
+            current_app.logger.warning(f"Streaming dialogue for {npc_name} rejected without calling the AI service: {e}")
+            yield 'error', "The AI service is busy right now; try again shortly."
+            return
+        except Exception as e:
+            current_app.logger.critical(f"Exception during streaming LLM call ({self.llm.name}) for {npc_name}: {e}", exc_info=True)
+            yield 'error', f"AI service issue for {npc_name}. Check logs."
+            return
+        final_text = self._clean_dialogue_text(npc_name, cleaner.raw_text.strip())
+        current_app.logger.info(f"Successfully streamed dialogue for {npc_name}: \"{final_text}\"")
+        yield 'done', final_text if final_text else f"[{npc_name} pauses, considering the moment.]"
+
+    def iter_scene_dialogue(self, npc_profiles, scene_description, conversation_histories, executor, user_id=None):
+        """
+        Generates one line per NPC concurrently on the given executor.
+        World knowledge is fetched once for the whole scene. Yields (npc_id, dialogue_text)
+        in completion order, so callers can stream each NPC as soon as it is ready.
+        """
+        app = current_app._get_current_object()
+        world_knowledge_summary = self._get_world_knowledge_summary()
+
+        def _generate_one(npc_profile):
+            with app.app_context():
+                return self.generate_dialogue_for_npc_in_scene(
+                    npc_profile=npc_profile,
+                    scene_description=scene_description,
+                    conversation_history=conversation_histories.get(npc_profile['_id'], []),
+                    world_knowledge_summary=world_knowledge_summary,
+                    user_id=user_id
+                )
+
+        futures = {executor.submit(_generate_one, profile): profile['_id'] for profile in npc_profiles}
+        for future in as_completed(futures):
+            npc_id = futures[future]
+            try:
+                yield npc_id, future.result()
+            except Exception as e:
+                current_app.logger.error(f"Scene generation failed for NPC '{npc_id}': {e}", exc_info=True)
+                yield npc_id, None
+
+    def speculate_suggestions(self, npc_profile, scene_description, conversation_history, npc_line, user_id=None):
+        """
+        Called after an NPC line is delivered. Pre-generates the follow-up suggestion actions in the
+        background for the state the client will send next (its history plus the new line), so the
+        follow-up click is answered from the speculator. Returns False if speculation is off, the
+        backend is unavailable or the user's speculative budget is spent.
+        """
+        speculator = self.speculator
+        if speculator is None or not self.available:
+            return False
+        if not speculator.budget.try_spend(user_id or ANONYMOUS_USER, len(speculator.actions)):
+            metrics.incr("speculation.over_budget")
+            return False
+        app = current_app._get_current_object()
+        predicted_history = (list(conversation_history or []) + [{"speaker": npc_profile.get('name', 'The NPC'), "text": npc_line}])[-CLIENT_HISTORY_WINDOW:]
+
+        def _speculate():
+            with app.app_context():
+                # Every action is registered before the first call, so a click for any of them joins
+                # its speculation (and promotes it) rather than duplicating it
+                planned = []
+                for action_type in speculator.actions:
+                    try:
+                        action_prompt, generation_params = self._build_suggestion_prompt(npc_profile, action_type, scene_description, predicted_history)
+                    except Exception as e:
+                        app.logger.warning(f"Speculative {action_type} for '{npc_profile.get('name')}' failed: {e}")
+                        continue
+                    cache_key = self._response_cache_key(action_prompt, generation_params)
+                    planned.append((action_type, action_prompt, generation_params, cache_key, speculator.begin(cache_key)))
+                for action_type, action_prompt, generation_params, cache_key, pending in planned:
+                    try:
+                        text_from_ai = self._generate(action_prompt, generation_params, action_type, user_id=user_id,
+                                                      work_class=WORK_CLASS_BACKGROUND, ticket=pending.ticket)
+                        suggestions = self._parse_suggestions(text_from_ai) if text_from_ai else []
+                        if suggestions:
+                            speculator.park(cache_key, suggestions)
+                    except Exception as e:
+                        app.logger.warning(f"Speculative {action_type} for '{npc_profile.get('name')}' failed: {e}")
+                    finally:
+                        speculator.finish(cache_key, pending)
+
+        speculator.executor.submit(_speculate)
+        metrics.incr("speculation.scheduled")
+        return True
+
+    def _extract_memory_details_with_ai(self, npc_profile, dialogue_exchange, scene_context_for_memory, user_id=None):
         # Refinement 3: Robust AI JSON Parsing
-        if not self.model:
-            current_app.logger.error("Memory extraction: AI model not initialized.")
+        if not self.available:
+            current_app.logger.error("Memory extraction: LLM backend is unavailable.")
             return None
         npc_name = npc_profile.get('name', 'The NPC')
-        personality_traits_input = npc_profile.get('personality_traits', [])
-        if isinstance(personality_traits_input, str): personality_summary = personality_traits_input
-        elif isinstance(personality_traits_input, list): personality_summary = ", ".join(personality_traits_input)
-        else: personality_summary = "observant"
+        personality_summary = get_compiled_npc_prompt(npc_profile).memory_personality_summary
         extraction_prompt_lines = [
             f"You are an AI specializing in analyzing dialogue for memory creation in a role-playing game.",
             f"The NPC in question is '{npc_name}', who is generally {personality_summary}.",
@@ -257,30 +371,117 @@ class DialogueService:
         ]
         extraction_prompt = "\n".join(extraction_prompt_lines)
         current_app.logger.debug(f"Memory Extraction Prompt for {npc_name}:\n{extraction_prompt}")
-        raw_json_text = "" # Initialize for logging in case of error
         try:
-            extraction_config = genai.types.GenerationConfig(temperature=0.4, max_output_tokens=400) # Increased tokens
-            safety_settings = self.get_default_safety_settings()
-            response = self.model.generate_content(extraction_prompt, generation_config=extraction_config, safety_settings=safety_settings)
-            if response.parts:
-                raw_json_text = "".join(part.text for part in response.parts if hasattr(part, 'text')).strip()
-                if raw_json_text.startswith("```json"): raw_json_text = raw_json_text[7:]
-                if raw_json_text.endswith("```"): raw_json_text = raw_json_text[:-3]
-                raw_json_text = raw_json_text.strip()
-                current_app.logger.debug(f"Raw JSON from AI for memory extraction for {npc_name}: {raw_json_text}")
-                extracted_data = json.loads(raw_json_text)
-                return extracted_data
-            else:
-                current_app.logger.error(f"Memory extraction for {npc_name} failed: No parts in AI response. Feedback: {response.prompt_feedback if hasattr(response, 'prompt_feedback') else 'N/A'}")
-                return None
-        except json.JSONDecodeError as je:
-            current_app.logger.error(f"Memory extraction JSON parsing error for '{npc_name}': {je}. Raw AI output was: '{raw_json_text}'") # Log the problematic text
+            extracted_data = self._generate(extraction_prompt, MEMORY_EXTRACTION_CONFIG, 'memory_extraction', as_json=True, user_id=user_id)
+            current_app.logger.debug(f"Parsed JSON from AI for memory extraction for {npc_name}: {extracted_data}")
+            return extracted_data
+        except LLMBlockedError as blocked:
+            current_app.logger.error(f"Memory extraction for {npc_name} failed: No usable AI response. Reason: {blocked.reason}")
+            return None
+        except LLMJSONError as je:
+            current_app.logger.error(f"Memory extraction JSON parsing error for '{npc_name}': {je}. Raw AI output was: '{je.raw_text}'") # Log the problematic text
             return None 
+        except LLMUnavailableError as e:
+            current_app.logger.warning(f"Memory extraction for {npc_name} rejected without calling the AI service: {e}")
+            return None
         except Exception as e:
             current_app.logger.error(f"Error during AI memory extraction for {npc_name}: {e}", exc_info=True)
             return None
 
-    def handle_npc_action(self, npc_id, action_type, payload, npc_profile, scene_description, conversation_history):
+    def enable_memory_batching(self, app, max_items=8, window_seconds=0.5):
+        """Memory extractions submitted within window_seconds of each other share one model call."""
+        self.memory_batcher = MemoryExtractionBatcher(
+            app, self._extract_memory_details_batch, self._extract_memory_details_for_item,
+            max_items=max_items, window_seconds=window_seconds
+        )
+
+    def _extract_memory_details_for_item(self, item):
+        return self._extract_memory_details_with_ai(item["npc_profile"], item["dialogue_exchange"], item["scene_context_for_memory"], user_id=item.get("user_id"))
+
+    def _extract_memory_details_batch(self, entries):
+        """
+        One model call for several (request_id, item) extractions; returns {request_id: details}
+        for every entry of the reply that parsed into a usable object. Raises if the reply as a
+        whole isn't a JSON array, so the batcher falls back to per-item calls.
+        """
+        prompt_lines = [
+            "You are an AI specializing in analyzing dialogue for memory creation in a role-playing game.",
+            f"Below are {len(entries)} separate memory requests, each for one NPC. Analyze each exchange ONLY from that request's NPC's perspective; never mix information between requests.",
+            "For each request extract: 'key_entities' (list of important named people, places, items or organizations, concise), 'key_facts_events' (concise string of the most crucial new information, decisions or actions for the NPC), 'npc_sentiment_tag' (ONE of POSITIVE, NEGATIVE, NEUTRAL, from the NPC's perspective and personality) and 'ai_generated_summary' (10-20 words, phrased from the NPC's point of view, e.g. 'I learned that X...').",
+            "Respond ONLY with a valid JSON array containing one object per request, each with a 'request_id' field copied exactly from the request plus the four fields above. Example:",
+            '[{"request_id": "ab12cd34", "key_entities": ["Sir Reginald", "The Sunken Temple"], "key_facts_events": "Sir Reginald asked for my help retrieving the Azure Gem.", "npc_sentiment_tag": "POSITIVE", "ai_generated_summary": "Sir Reginald needs my help finding the Azure Gem."}]'
+        ]
+        for request_id, item in entries:
+            npc_profile = item["npc_profile"]
+            prompt_lines.append(f"\n=== Request ID: {request_id} ===")
+            prompt_lines.append(f"NPC: '{npc_profile.get('name', 'The NPC')}', who is generally {get_compiled_npc_prompt(npc_profile).memory_personality_summary}.")
+            prompt_lines.append(f"Scene Context: \"{item['scene_context_for_memory']}\"")
+            prompt_lines.append(f"Dialogue Exchange:\n---\n{item['dialogue_exchange']}\n---")
+        generation_config = dict(MEMORY_EXTRACTION_CONFIG, max_output_tokens=min(MEMORY_BATCH_MAX_OUTPUT_TOKENS, MEMORY_EXTRACTION_CONFIG["max_output_tokens"] * len(entries)))
+        user_id = entries[0][1].get("user_id")
+        parsed = self._generate("\n".join(prompt_lines), generation_config, 'memory_extraction_batch', as_json=True, user_id=user_id)
+        if not isinstance(parsed, list):
+            raise LLMJSONError("Batch memory extraction reply is not a JSON array.", str(parsed)[:500])
+
+        wanted = {request_id for request_id, _item in entries}
+        results = {}
+        for entry in parsed:
+            # Each entry is checked on its own; a malformed one only sends that request to the fallback
+            if not isinstance(entry, dict) or entry.get("request_id") not in wanted:
+                continue
+            if not any(field in entry for field in MEMORY_DETAIL_FIELDS):
+                continue
+            results[entry["request_id"]] = {field: entry[field] for field in MEMORY_DETAIL_FIELDS if field in entry}
+        current_app.logger.info(f"Batch memory extraction: {len(results)}/{len(entries)} requests answered in one call.")
+        return results
+
+    def process_memory_submission(self, npc_id, dialogue_to_remember, scene_context_for_memory, user_id=None, memory_id=None):
+        """Extracts memory details with the model and stores the entry. Runs as a background job,
+        with a memory_id derived from the job so a replayed job replaces its memory instead of adding another."""
+        npc_name = npc_id
+        current_app.logger.info(f"NPC Action: '{npc_name}' attempting to remember: \"{dialogue_to_remember[:100]}...\" with scene context: \"{scene_context_for_memory[:100]}...\"")
+        full_npc_data_for_memory = mongo.db.npcs.find_one({"_id": npc_id})
+        if not full_npc_data_for_memory:
+             return {"status": "error", "message": f"NPC {npc_id} not found for memory submission."}
+        npc_name = full_npc_data_for_memory.get('name', npc_name)
+        extraction_item = {"npc_profile": full_npc_data_for_memory, "dialogue_exchange": dialogue_to_remember, "scene_context_for_memory": scene_context_for_memory, "user_id": user_id}
+        if self.memory_batcher is not None:
+            extracted_details = self.memory_batcher.extract(extraction_item)
+        else:
+            extracted_details = self._extract_memory_details_for_item(extraction_item)
+        if extracted_details:
+            memory_entry = {
+                "memory_id": memory_id or str(uuid.uuid4()), "timestamp": datetime.utcnow(),
+                "scene_context_summary": scene_context_for_memory[:250],
+                "dialogue_snippet": dialogue_to_remember,
+                "extracted_entities": extracted_details.get("key_entities", []),
+                "extracted_facts_events": extracted_details.get("key_facts_events", "Details not extracted."),
+                "npc_sentiment_tag": extracted_details.get("npc_sentiment_tag", "NEUTRAL").upper(),
+                "ai_generated_summary": extracted_details.get("ai_generated_summary", "A notable event occurred.")
+            }
+            # Tokenized once here so retrieval is an index lookup rather than a text scan
+            memory_entry["index_terms"] = memory_term_frequencies(memory_entry)
+            try:
+                memory_store.add(npc_id, memory_entry)
+                current_app.logger.info(f"Memory entry successfully added for {npc_name}.")
+                return {"status": "success", "message": f"Memory of '{memory_entry['ai_generated_summary'][:50]}...' recorded for {npc_name}."}
+            except Exception as e:
+                current_app.logger.error(f"DB error saving memory for {npc_name}: {e}", exc_info=True)
+                return {"status": "error", "message": "Failed to save memory to database."}
+        else:
+            current_app.logger.warning(f"Could not extract details to form a memory for {npc_name}.")
+            return {"status": "error", "message": f"AI could not extract details to form a memory for {npc_name}."}
+
+    def _run_memory_job(self, job_payload, job_id):
+        return self.process_memory_submission(
+            job_payload.get("npc_id"),
+            job_payload.get("dialogue_exchange", ""),
+            job_payload.get("scene_context_for_memory", ""),
+            user_id=job_payload.get("user_id"),
+            memory_id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{MEMORY_JOB_TYPE}:{job_id}"))
+        )
+
+    def handle_npc_action(self, npc_id, action_type, payload, npc_profile, scene_description, conversation_history, user_id=None):
         current_app.logger.info(f"--- INFO DEBUG: Handling action '{action_type}' for NPC ID '{npc_id}' (SYNC) ---")
         npc_name = npc_profile.get('name', 'The NPC')
 
@@ -289,45 +490,23 @@ class DialogueService:
             scene_context_for_memory = payload.get("scene_context_for_memory", scene_description) 
             if not dialogue_to_remember:
                 return {"status": "error", "message": "No dialogue provided to remember."}
-            current_app.logger.info(f"NPC Action: '{npc_name}' attempting to remember: \"{dialogue_to_remember[:100]}...\" with scene context: \"{scene_context_for_memory[:100]}...\"")
-            full_npc_data_for_memory = mongo.db.npcs.find_one({"_id": npc_id})
-            if not full_npc_data_for_memory:
-                 return {"status": "error", "message": f"NPC {npc_id} not found for memory submission."}
-            extracted_details = self._extract_memory_details_with_ai(full_npc_data_for_memory, dialogue_to_remember, scene_context_for_memory)
-            if extracted_details:
-                memory_entry = {
-                    "memory_id": str(uuid.uuid4()), "timestamp": datetime.utcnow(),
-                    "scene_context_summary": scene_context_for_memory[:250],
-                    "dialogue_snippet": dialogue_to_remember,
-                    "extracted_entities": extracted_details.get("key_entities", []),
-                    "extracted_facts_events": extracted_details.get("key_facts_events", "Details not extracted."),
-                    "npc_sentiment_tag": extracted_details.get("npc_sentiment_tag", "NEUTRAL").upper(),
-                    "ai_generated_summary": extracted_details.get("ai_generated_summary", "A notable event occurred.")
-                }
-                try:
-                    mongo.db.npcs.update_one(
-                        {"_id": npc_id}, 
-                        {"$push": {"memories": {"$each": [memory_entry], "$slice": -MAX_NPC_MEMORIES}}} # Use constant
-                    )
-                    current_app.logger.info(f"Memory entry successfully added for {npc_name}.")
-                    return {"status": "success", "message": f"Memory of '{memory_entry['ai_generated_summary'][:50]}...' recorded for {npc_name}."}
-                except Exception as e:
-                    current_app.logger.error(f"DB error saving memory for {npc_name}: {e}", exc_info=True)
-                    return {"status": "error", "message": "Failed to save memory to database."}
-            else:
-                current_app.logger.warning(f"Could not extract details to form a memory for {npc_name}.")
-                return {"status": "error", "message": f"AI could not extract details to form a memory for {npc_name}."}
+            if self.job_queue is None:
+                return self.process_memory_submission(npc_id, dialogue_to_remember, scene_context_for_memory, user_id=user_id)
+            job_id = self.job_queue.enqueue(MEMORY_JOB_TYPE, {
+                "npc_id": npc_id,
+                "dialogue_exchange": dialogue_to_remember,
+                "scene_context_for_memory": scene_context_for_memory,
+                "user_id": user_id # The worker thread has no request user; the scheduler needs it
+            }, user_id=user_id)
+            current_app.logger.info(f"NPC Action: memory submission for '{npc_name}' queued as job {job_id}.")
+            return {"status": "queued", "job_id": job_id, "code": 202, "message": f"{npc_name} is committing this to memory..."}
 
         elif action_type == "undo_memory":
             current_app.logger.info(f"NPC Action: '{npc_name}' is attempting to 'undo last memory'.")
             try:
-                result = mongo.db.npcs.update_one({"_id": npc_id}, {"$pop": {"memories": 1}})
-                if result.modified_count > 0: return {"status": "success", "message": f"Last memory item for {npc_name} removed."}
-                else:
-                    npc_check = mongo.db.npcs.find_one({"_id": npc_id}, {"memories": 1})
-                    if npc_check and (not npc_check.get("memories") or len(npc_check.get("memories")) == 0) :
-                         return {"status": "info", "message": f"{npc_name} has no memories to remove."}
-                    return {"status": "info", "message": f"No memory removed for {npc_name} (perhaps none existed or ID mismatch)."}
+                removed = memory_store.remove_latest(npc_id)
+                if removed: return {"status": "success", "message": f"Last memory item for {npc_name} removed."}
+                return {"status": "info", "message": f"{npc_name} has no memories to remove."}
             except Exception as e:
                 current_app.logger.error(f"DB error undoing memory for {npc_name}: {e}", exc_info=True)
                 return {"status": "error", "message": "Failed to undo memory from database."}
@@ -338,55 +517,43 @@ class DialogueService:
             if not full_npc_data_for_action:
                  return {"status": "error", "message": f"NPC {npc_id} not found for {action_type}."}
 
-            world_knowledge_summary = self._get_world_knowledge_summary()
-            # Pass current_scene_context instead of full_npc_data_for_action to avoid recursion if _get_npc_memories_summary needs full profile
-            npc_memory_summary = self._get_npc_memories_summary(full_npc_data_for_action, scene_description) 
-            
-            personality_traits_input = full_npc_data_for_action.get('personality_traits', [])
-            if isinstance(personality_traits_input, str): personality_traits_list = [trait.strip() for trait in personality_traits_input.split(',') if trait.strip()]
-            elif isinstance(personality_traits_input, list): personality_traits_list = personality_traits_input
-            else: personality_traits_list = []
-            personality_summary = ', '.join(personality_traits_list) if personality_traits_list else 'Unknown'
-
-            action_prompt_lines = [
-                f"You are an AI assistant for a tabletop RPG. The NPC {npc_name} (profile, memories, scene context below) needs some suggestions.",
-                f"NPC Profile Summary: Personality: {personality_summary}. Motivations: {full_npc_data_for_action.get('motivations', 'Unknown')}.",
-                npc_memory_summary, 
-                f"World Context: {world_knowledge_summary[:300]}...",
-                f"Current Scene: {scene_description}",
-                f"Recent Conversation with {npc_name} (last ~3 exchanges):"
-            ]
-            for entry in conversation_history[-3:]: 
-                action_prompt_lines.append(f"  {entry.get('speaker', 'Unknown')}: \"{entry.get('text', '')}\"")
-            
-            if action_type == "next_topic" or action_type == "regenerate_topics":
-                action_prompt_lines.append(f"\nBased on all this (especially {npc_name}'s recent memories and personality), suggest 3-5 distinct and engaging conversation topics, questions, or observations that {npc_name} might bring up or be interested in discussing next. Each topic should be a short phrase or question suitable for a player to click on to steer the conversation.")
-                action_prompt_lines.append("Output each topic on a new line, starting with '- '.")
-            elif action_type == "show_top5_options":
-                action_prompt_lines.append(f"\nConsidering all this, especially {npc_name}'s memories and personality, generate 3 to 5 distinct, in-character dialogue lines that {npc_name} could say next. Each line should offer a different approach or reaction to the current situation. Number each option (e.g., 1. Dialogue line one. 2. Dialogue line two.).")
-                action_prompt_lines.append("Output ONLY the numbered dialogue lines.")
-            
-            action_prompt = "\n".join(action_prompt_lines)
+            action_prompt, generation_params = self._build_suggestion_prompt(full_npc_data_for_action, action_type, scene_description, conversation_history)
             current_app.logger.debug(f"--- ACTION PROMPT ({action_type}) for {npc_name} ---\n{action_prompt}\n--- END ACTION PROMPT ---")
+            data_key = "new_topics" if (action_type == "next_topic" or action_type == "regenerate_topics") else "dialogue_options"
+            cache_key = self._response_cache_key(action_prompt, generation_params)
+            if self.speculator is not None and action_type in self.speculator.actions:
+                speculative_suggestions = self.speculator.take(cache_key)
+                if speculative_suggestions is None:
+                    # Still being speculated: raise it to this click's class and wait for it
+                    work_class = self.scheduler.work_class_for(action_type) if self.scheduler is not None else None
+                    speculative_suggestions = self.speculator.join(cache_key, self.scheduler, work_class)
+                if speculative_suggestions is not None:
+                    current_app.logger.info(f"Serving pre-generated (speculative) suggestions for {action_type} for {npc_name}.")
+                    return {"status": "success", "action": action_type, "cached": True, "data": {data_key: speculative_suggestions, "message": f"Suggestions for {action_type} generated for {npc_name}."}}
+            if self.response_cache is not None and action_type in self.cached_actions:
+                cached_suggestions = self.response_cache.get(cache_key)
+                if cached_suggestions is not None:
+                    current_app.logger.info(f"Serving cached suggestions for {action_type} for {npc_name}.")
+                    return {"status": "success", "action": action_type, "cached": True, "data": {data_key: cached_suggestions, "message": f"Suggestions for {action_type} generated for {npc_name}."}}
 
             try:
-                if not self.model: return {"status": "error", "message": "AI model not initialized."}
-                action_gen_config = genai.types.GenerationConfig(temperature=0.8 if action_type == "show_top5_options" else 0.75, max_output_tokens=300 if action_type == "show_top5_options" else 150)
-                safety_settings_action = self.get_default_safety_settings()
-                response = self.model.generate_content(action_prompt, generation_config=action_gen_config, safety_settings=safety_settings_action)
-                
-                if response.parts:
-                    text_from_ai = "".join(part.text for part in response.parts if hasattr(part, 'text')).strip()
-                    suggestions = [sug.strip().lstrip('-0123456789. ') for sug in text_from_ai.split('\n') if sug.strip() and len(sug.strip()) > 2] # Strip numbers for options too
+                if not self.available: return {"status": "error", "message": "AI model not initialized."}
+                text_from_ai = self._generate(action_prompt, generation_params, action_type, user_id=user_id)
+                if text_from_ai:
+                    suggestions = self._parse_suggestions(text_from_ai)
                     current_app.logger.info(f"Generated suggestions for {action_type} for {npc_name}: {suggestions}")
-                    data_key = "new_topics" if (action_type == "next_topic" or action_type == "regenerate_topics") else "dialogue_options"
-                    return {"status": "success", "action": action_type, "data": {data_key: suggestions[:5], "message": f"Suggestions for {action_type} generated for {npc_name}."}}
+                    if self.response_cache is not None and suggestions and (action_type in self.cached_actions or action_type in self.cache_refresh_actions):
+                        self.response_cache.set(cache_key, suggestions)
+                    return {"status": "success", "action": action_type, "data": {data_key: suggestions, "message": f"Suggestions for {action_type} generated for {npc_name}."}}
                 else:
-                    block_reason_msg = f"{action_type} gen response had no parts."
-                    if hasattr(response, 'prompt_feedback') and response.prompt_feedback and response.prompt_feedback.block_reason:
-                         block_reason_msg = response.prompt_feedback.block_reason_message
-                    current_app.logger.warning(f"{action_type} generation for {npc_name} failed: {block_reason_msg}")
-                    return {"status": "error", "message": f"Could not generate suggestions for {action_type}: {block_reason_msg}"}
+                    current_app.logger.warning(f"{action_type} generation for {npc_name} returned no text.")
+                    return {"status": "error", "message": f"Could not generate suggestions for {action_type}: {action_type} gen response had no parts."}
+            except LLMBlockedError as blocked:
+                current_app.logger.warning(f"{action_type} generation for {npc_name} failed: {blocked.reason}")
+                return {"status": "error", "message": f"Could not generate suggestions for {action_type}: {blocked.reason}"}
+            except LLMUnavailableError as e:
+                current_app.logger.warning(f"{action_type} for {npc_name} rejected without calling the AI service: {e}")
+                return {"status": "error", "code": 503, "message": "The AI service is busy right now; try again shortly."}
             except Exception as e:
                 current_app.logger.error(f"Error generating suggestions for {action_type} for {npc_name}: {e}", exc_info=True)
                 return {"status": "error", "message": f"Error during {action_type} generation."}
@@ -398,10 +565,43 @@ class DialogueService:
             current_app.logger.warning(f"NPC Action: Unknown action type '{action_type}' for NPC ID '{npc_id}'.")
             return {"status": "error", "message": f"Unknown action: {action_type}"}
 
-    def get_default_safety_settings(self):
-        return [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_ONLY_HIGH"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_ONLY_HIGH"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_ONLY_HIGH"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"},
-        ]
\ No newline at end of file
+    def _build_suggestion_prompt(self, npc_profile, action_type, scene_description, conversation_history):
+        """Prompt and generation params for a suggestion action. Depends only on the NPC document,
+        scene and history, so a prompt built ahead of time (speculation) hashes the same as the real one."""
+        npc_name = npc_profile.get('name', 'The NPC')
+        world_knowledge_summary = self._get_world_knowledge_summary()
+        npc_memory_summary = self._get_npc_memories_summary(npc_profile, scene_description) 
+        compiled = get_compiled_npc_prompt(npc_profile)
+
+        budget = budget_for(action_type)
+        budget.add('header', f"You are an AI assistant for a tabletop RPG. The NPC {npc_name} (profile, memories, scene context below) needs some suggestions.", required=True)
+        budget.add('profile', compiled.action_profile_summary, required=True)
+        budget.add('memories', npc_memory_summary, priority=60)
+        budget.add('world_knowledge', f"World Context: {world_knowledge_summary}", priority=40)
+        budget.add('scene', f"Current Scene: {scene_description}", required=True)
+        budget.add('history_header', f"Recent Conversation with {npc_name}:", required=True)
+        budget.add_items(
+            'history', None,
+            [f"  {entry.get('speaker', 'Unknown')}: \"{entry.get('text', '')}\"" for entry in conversation_history or []],
+            priority=70, max_items=ACTION_HISTORY_MAX_TURNS
+        )
+        
+        if action_type == "next_topic" or action_type == "regenerate_topics":
+            budget.add('instructions', f"\nBased on all this (especially {npc_name}'s recent memories and personality), suggest 3-5 distinct and engaging conversation topics, questions, or observations that {npc_name} might bring up or be interested in discussing next. Each topic should be a short phrase or question suitable for a player to click on to steer the conversation.\nOutput each topic on a new line, starting with '- '.", required=True)
+        elif action_type == "show_top5_options":
+            budget.add('instructions', f"\nConsidering all this, especially {npc_name}'s memories and personality, generate 3 to 5 distinct, in-character dialogue lines that {npc_name} could say next. Each line should offer a different approach or reaction to the current situation. Number each option (e.g., 1. Dialogue line one. 2. Dialogue line two.).\nOutput ONLY the numbered dialogue lines.", required=True)
+        
+        generation_params = {
+            "temperature": 0.8 if action_type == "show_top5_options" else 0.75,
+            "max_output_tokens": 300 if action_type == "show_top5_options" else 150
+        }
+        return budget.render(), generation_params
+
+    def _parse_suggestions(self, text_from_ai):
+        return [sug.strip().lstrip('-0123456789. ') for sug in text_from_ai.split('\n') if sug.strip() and len(sug.strip()) > 2][:5] # Strip numbers for options too
+
+    def _response_cache_key(self, prompt, generation_params):
+        # Whitespace-normalized, so prompts differing only in spacing/blank lines share a key
+        normalized_prompt = " ".join(prompt.split())
+        key_material = json.dumps({"backend": self.llm.cache_namespace, "prompt": normalized_prompt, "config": generation_params}, sort_keys=True)
+        return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
@@ -0,0 +1,169 @@
+# server/app/services/foundry_import.py
+import html
+import json
+import re
+
+try:
+    import ijson # type: ignore
+except ImportError: # Optional: without it an export is read whole with json.load
+    ijson = None
+
+FOUNDRY_ACTOR_FILE_RE = re.compile(r'^fvtt-Actor-.*\.json$', re.IGNORECASE)
+FOUNDRY_ACTOR_ID_RE = re.compile(r'-([A-Za-z0-9]{16})\.json$')
+# system.details fields the NPC schema uses; everything else in an export is stats, items and effects
+FOUNDRY_DETAIL_FIELDS = ('biography', 'alignment', 'race', 'appearance', 'trait', 'ideal', 'bond', 'flaw',
+                         'gender', 'age', 'height', 'weight', 'eyes', 'hair', 'skin', 'faith')
+FOUNDRY_APPEARANCE_FIELDS = ('gender', 'age', 'height', 'weight', 'eyes', 'hair', 'skin')
+# Embedded items kept (as _id/name/type only) to resolve race and class names
+FOUNDRY_PROFILE_ITEM_TYPES = ('race', 'class', 'subclass', 'background')
+_BLOCK_TAG_RE = re.compile(r'<\s*(?:br|/p|/h[1-6]|/li|/div)\s*/?>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_DETAIL_PREFIX = 'system.details.'
+# ijson reads this much at a time and queues the events of each read, so it bounds peak memory
+# (64 KB reads of a dense export peak near 700 KB; 8 KB reads stay under 100 KB)
+FOUNDRY_STREAM_READ_BYTES = 8 * 1024
+
+
+class FoundryImportError(ValueError):
+    """The file is not a readable Foundry VTT actor export."""
+
+
+def is_foundry_actor_filename(filename):
+    """Foundry names actor exports 'fvtt-Actor-<name>-<id>.json'."""
+    return bool(filename) and bool(FOUNDRY_ACTOR_FILE_RE.match(filename))
+
+
+def looks_like_foundry_actor(data):
+    return isinstance(data, dict) and isinstance(data.get('system'), dict) and isinstance(data.get('items'), list)
+
+
+def _stream_actor(stream):
+    """
+    The profile parts of an actor export, from ijson parse events: only the top-level name and
+    type, scalar system.details fields, and _id/name/type of race/class items are kept, so memory
+    stays flat however large the items and effects arrays are.
+    """
+    actor = {'name': None, 'type': None, 'details': {}, 'items': []}
+    item = None
+    has_system = False
+    for prefix, event, value in ijson.parse(stream, buf_size=FOUNDRY_STREAM_READ_BYTES):
+        if prefix == 'system' and event == 'start_map':
+            has_system = True
+        elif prefix in ('name', 'type') and event == 'string':
+            actor[prefix] = value
+        elif prefix.startswith(_DETAIL_PREFIX) and event in ('string', 'number'):
+            field = prefix[len(_DETAIL_PREFIX):]
+            if field == 'biography.value': # Newer exports: {"value": html, "public": html}
+                field = 'biography'
+            if field in FOUNDRY_DETAIL_FIELDS:
+                actor['details'][field] = str(value)
+        elif prefix == 'items.item':
+            if event == 'start_map':
+                item = {}
+            elif event == 'end_map':
+                if item.get('type') in FOUNDRY_PROFILE_ITEM_TYPES:
+                    actor['items'].append(item)
+                item = None
+        elif item is not None and prefix in ('items.item._id', 'items.item.name', 'items.item.type') and event == 'string':
+            item[prefix[len('items.item.'):]] = value
+    if not has_system:
+        raise FoundryImportError("Not a Foundry VTT actor export.")
+    return actor
+
+
+def foundry_actor_from_dict(data):
+    """Same shape as _stream_actor, from an already parsed export."""
+    raw_details = data.get('system', {}).get('details') or {}
+    details = {}
+    for field in FOUNDRY_DETAIL_FIELDS:
+        value = raw_details.get(field)
+        if field == 'biography' and isinstance(value, dict):
+            value = value.get('value')
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            details[field] = str(value)
+    items = [{k: item.get(k) for k in ('_id', 'name', 'type')} for item in data.get('items', [])
+             if isinstance(item, dict) and item.get('type') in FOUNDRY_PROFILE_ITEM_TYPES]
+    return {'name': data.get('name'), 'type': data.get('type'), 'details': details, 'items': items}
+
+
+def read_foundry_actor(stream):
+    """Profile parts of a Foundry actor export from a binary stream; raises FoundryImportError if unreadable."""
+    try:
+        if ijson is not None:
+            actor = _stream_actor(stream)
+        else:
+            data = json.load(stream)
+            if not looks_like_foundry_actor(data):
+                raise FoundryImportError("Not a Foundry VTT actor export.")
+            actor = foundry_actor_from_dict(data)
+    except FoundryImportError:
+        raise
+    except Exception as e: # ijson.JSONError, json.JSONDecodeError, UnicodeDecodeError
+        reason = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__ # yajl appends a caret diagram
+        raise FoundryImportError(f"Invalid Foundry VTT export: {reason}") from e
+    if not actor['name']:
+        raise FoundryImportError("Foundry VTT export has no actor name.")
+    return actor
+
+
+def html_to_text(value):
+    """Foundry rich text (HTML) as plain text, one line per paragraph/heading/line break."""
+    text = html.unescape(_TAG_RE.sub('', _BLOCK_TAG_RE.sub('\n', value)))
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def _unique_lines(value):
+    # Character builders often append the same rolled trait/ideal twice
+    lines = []
+    for line in (value or '').splitlines():
+        line = line.strip()
+        if line and line not in lines:
+            lines.append(line)
+    return lines
+
+
+def foundry_actor_to_npc(actor, file_name=None):
+    """
+    A raw NPC record in the shape load_npc_data.py and the upload route read (name, race, class,
+    personality_traits, ...) from read_foundry_actor's result. Empty fields are left out.
+    """
+    details = actor.get('details', {})
+    items = actor.get('items', [])
+
+    def items_of(item_type):
+        return [item for item in items if item.get('type') == item_type and item.get('name')]
+
+    races = items_of('race')
+    race = next((item['name'] for item in races if item.get('_id') == details.get('race')), None)
+    if race is None and races:
+        race = races[0]['name']
+    classes = [item['name'] for item in items_of('class')]
+    subclasses = [item['name'] for item in items_of('subclass')]
+    npc_class = ' / '.join(classes)
+    if len(classes) == 1 and len(subclasses) == 1:
+        npc_class = f"{classes[0]} ({subclasses[0]})"
+
+    appearance = details.get('appearance', '').strip()
+    if not appearance:
+        appearance = ', '.join(f"{field.capitalize()}: {details[field]}" for field in FOUNDRY_APPEARANCE_FIELDS if details.get(field, '').strip())
+
+    npc = {
+        'name': actor.get('name'),
+        'race': race,
+        'class': npc_class,
+        'alignment': details.get('alignment'),
+        'age': details.get('age'),
+        'appearance': appearance,
+        'personality_traits': _unique_lines(details.get('trait')),
+        'ideals': '\n'.join(_unique_lines(details.get('ideal'))),
+        'bonds': '\n'.join(_unique_lines(details.get('bond'))),
+        'flaws': '\n'.join(_unique_lines(details.get('flaw'))),
+        'backstory': html_to_text(details.get('biography', '')),
+    }
+    backgrounds = items_of('background')
+    if backgrounds:
+        npc['background'] = backgrounds[0]['name']
+    match = FOUNDRY_ACTOR_ID_RE.search(file_name or '')
+    if match:
+        npc['id'] = f"fvtt_{match.group(1)}" # Stable across re-imports of the same actor
+    return {k: v for k, v in npc.items() if v}
@@ -0,0 +1,131 @@
+# server/app/services/google_auth.py
+import base64
+import json
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from google.auth import jwt as google_jwt # type: ignore
+from ..utils.metrics import metrics
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+_MAX_AGE_RE = re.compile(r'max-age\s*=\s*(\d+)')
+
+
+class GoogleCertsUnavailableError(Exception):
+    """Google's signing certificates could not be fetched (and none are cached)."""
+
+
+def certs_ttl_from_headers(headers, default_ttl):
+    """Seconds the certificate response may be reused for, per Cache-Control max-age (less Age) or Expires."""
+    cache_control = headers.get('Cache-Control', '')
+    if 'no-store' in cache_control or 'no-cache' in cache_control:
+        return 0
+    match = _MAX_AGE_RE.search(cache_control)
+    if match:
+        try:
+            age = int(headers.get('Age', 0))
+        except ValueError:
+            age = 0
+        return max(0, int(match.group(1)) - age)
+    expires = headers.get('Expires')
+    if expires:
+        try:
+            return max(0, int(parsedate_to_datetime(expires).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            pass
+    return default_ttl
+
+
+def _token_key_id(token):
+    """'kid' from the (unverified) JWT header, or None."""
+    try:
+        header = token.split('.')[0] if isinstance(token, str) else token.decode('utf-8').split('.')[0]
+        return json.loads(base64.urlsafe_b64decode(header + '=' * (-len(header) % 4))).get('kid')
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        return None
+
+
+class GoogleTokenVerifier:
+    """
+    Verifies Google Sign-In ID tokens against Google's signing certificates, which are fetched
+    over one pooled HTTP session and reused for as long as their cache headers allow.
+
+    With certs_file set, certificates ({key id: PEM}, the format of the certs URL) are read from
+    that file instead and never fetched - for offline runs and tests. A token signed with a key
+    we don't know yet (Google rotated keys early) triggers at most one refetch per
+    min_refresh_seconds.
+    """
+    def __init__(self, certs_url=GOOGLE_CERTS_URL, certs_file=None, default_ttl=300, fetch_timeout=5.0,
+                 min_refresh_seconds=30.0, clock_skew_seconds=0):
+        self.certs_url = certs_url
+        self.certs_file = certs_file
+        self.default_ttl = default_ttl
+        self.fetch_timeout = fetch_timeout
+        self.min_refresh_seconds = min_refresh_seconds
+        self.clock_skew_seconds = clock_skew_seconds
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self._certs = None
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load_certs_file(self):
+        with open(self.certs_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _fetch_certs(self):
+        started = time.monotonic()
+        try:
+            response = self.session.get(self.certs_url, timeout=self.fetch_timeout)
+            response.raise_for_status()
+            certs = response.json()
+        except (requests.RequestException, ValueError) as e:
+            metrics.incr("google_certs.fetch_errors")
+            raise GoogleCertsUnavailableError(f"Could not fetch Google signing certificates: {e}") from e
+        metrics.incr("google_certs.fetches")
+        metrics.observe("google_certs.fetch_seconds", time.monotonic() - started)
+        return certs, certs_ttl_from_headers(response.headers, self.default_ttl)
+
+    def get_certs(self, force_refresh=False):
+        if self.certs_file:
+            with self._lock:
+                if self._certs is None:
+                    self._certs = self._load_certs_file()
+                return self._certs
+        now = time.monotonic()
+        certs = self._certs
+        if certs is not None and now < self._expires_at and not force_refresh:
+            return certs
+        with self._lock:
+            now = time.monotonic()
+            if self._certs is not None:
+                if force_refresh and now - self._fetched_at < self.min_refresh_seconds:
+                    return self._certs
+                if not force_refresh and now < self._expires_at:
+                    return self._certs # Another thread refreshed while we waited
+            try:
+                certs, ttl = self._fetch_certs()
+            except GoogleCertsUnavailableError:
+                if self._certs is not None:
+                    return self._certs # Keep serving the previous keys rather than failing sign-ins
+                raise
+            self._certs = certs
+            self._fetched_at = now
+            self._expires_at = now + ttl
+            return certs
+
+    def verify(self, token, audience):
+        """Claims of a valid token for the given client id; raises ValueError for an invalid one."""
+        certs = self.get_certs()
+        key_id = _token_key_id(token)
+        if key_id and key_id not in certs:
+            certs = self.get_certs(force_refresh=True)
+        idinfo = google_jwt.decode(token, certs=certs, audience=audience, clock_skew_in_seconds=self.clock_skew_seconds)
+        if idinfo.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer '{idinfo.get('iss')}'.")
+        return idinfo
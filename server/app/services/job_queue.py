@@ -0,0 +1,109 @@
+# server/app/services/job_queue.py
+import uuid
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import ReturnDocument # type: ignore
+from ..utils.db import mongo
+
+JOB_COLLECTION_NAME = 'dialogue_jobs'
+
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_SUCCEEDED = 'succeeded'
+JOB_STATUS_FAILED = 'failed'
+
+
+class JobQueue:
+    """
+    Background job queue persisted in Mongo and executed on a local thread pool.
+
+    Every job is a document in the dialogue_jobs collection, so queued work survives a
+    worker restart: recover() re-submits queued jobs and jobs whose running lease expired.
+    Workers claim a job atomically (queued -> running), so a job recovered by several
+    processes still runs once per claim.
+    """
+    def __init__(self, app, max_workers=2, lease_seconds=300):
+        self.app = app
+        self.lease_seconds = lease_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._handlers = {}
+
+    @property
+    def collection(self):
+        return mongo.db[JOB_COLLECTION_NAME]
+
+    def register_handler(self, job_type, handler):
+        """
+        handler(payload, job_id) -> result dict; a result with status 'error' marks the job failed.
+        A recovered job runs again from the start, so handlers should key what they write on job_id.
+        """
+        self._handlers[job_type] = handler
+
+    def enqueue(self, job_type, payload, user_id=None):
+        if job_type not in self._handlers:
+            raise ValueError(f"No handler registered for job type '{job_type}'")
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        self.collection.insert_one({
+            "_id": job_id,
+            "type": job_type,
+            "status": JOB_STATUS_QUEUED,
+            "payload": payload,
+            "user_id": user_id,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now
+        })
+        self._submit(job_id)
+        return job_id
+
+    def get(self, job_id):
+        return self.collection.find_one({"_id": job_id}, {"payload": 0})
+
+    def recover(self):
+        """Re-submits jobs left behind by a previous (or crashed) worker. Returns how many were queued."""
+        now = datetime.utcnow()
+        self.collection.update_many(
+            {"status": JOB_STATUS_RUNNING, "lease_expires_at": {"$lt": now}},
+            {"$set": {"status": JOB_STATUS_QUEUED, "updated_at": now}}
+        )
+        job_ids = [job['_id'] for job in self.collection.find({"status": JOB_STATUS_QUEUED}, {"_id": 1})]
+        for job_id in job_ids:
+            self._submit(job_id)
+        if job_ids:
+            self.app.logger.info(f"JobQueue: recovered {len(job_ids)} pending job(s).")
+        return len(job_ids)
+
+    def _submit(self, job_id):
+        self.executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            now = datetime.utcnow()
+            job = self.collection.find_one_and_update(
+                {"_id": job_id, "status": JOB_STATUS_QUEUED},
+                {"$set": {"status": JOB_STATUS_RUNNING, "started_at": now, "updated_at": now,
+                          "lease_expires_at": now + timedelta(seconds=self.lease_seconds)},
+                 "$inc": {"attempts": 1}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not job:
+                return # Already claimed by another worker, or finished
+            handler = self._handlers.get(job['type'])
+            update = {}
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler registered for job type '{job['type']}'")
+                result = handler(job.get('payload') or {}, job_id)
+                update["status"] = JOB_STATUS_FAILED if (result or {}).get("status") == "error" else JOB_STATUS_SUCCEEDED
+                update["result"] = result
+            except Exception as e:
+                self.app.logger.error(f"JobQueue: job {job_id} ({job['type']}) raised: {e}", exc_info=True)
+                update["status"] = JOB_STATUS_FAILED
+                update["error"] = str(e)
+            finished = datetime.utcnow()
+            update["updated_at"] = update["finished_at"] = finished
+            self.collection.update_one({"_id": job_id}, {"$set": update, "$unset": {"lease_expires_at": ""}})
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait)
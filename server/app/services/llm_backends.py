@@ -0,0 +1,281 @@
+# server/app/services/llm_backends.py
+import abc
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from string import Template
+import google.generativeai as genai # type: ignore
+from ..utils.metrics import metrics
+
+DEFAULT_SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_ONLY_HIGH"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"},
+]
+
+
+class LLMBackendError(Exception):
+    """The backend call failed (network, quota, injected failure...)."""
+
+
+class LLMBlockedError(LLMBackendError):
+    """The model returned nothing usable, usually because the prompt or response was blocked."""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class LLMJSONError(LLMBackendError):
+    """generate_json got text that isn't valid JSON; raw_text is kept for logging."""
+    def __init__(self, message, raw_text):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+def strip_json_fences(text):
+    text = text.strip()
+    if text.startswith("```json"): text = text[7:]
+    elif text.startswith("```"): text = text[3:]
+    if text.endswith("```"): text = text[:-3]
+    return text.strip()
+
+
+class LLMBackend(abc.ABC):
+    """
+    Text generation backend used by DialogueService.
+
+    generation_config is a plain dict (temperature, top_p, max_output_tokens); purpose is a
+    short tag ('dialogue', 'memory_extraction', an action name...) used for metrics and by
+    the stub backend to pick its output. Subclasses must implement _generate and _stream;
+    one missing either can't be instantiated.
+    """
+    name = 'base'
+
+    @property
+    def available(self):
+        return True
+
+    @property
+    def cache_namespace(self):
+        """Distinguishes cached responses produced by different backends/models."""
+        return self.name
+
+    def generate(self, prompt, generation_config, purpose='default'):
+        """Returns the generated text. Raises LLMBlockedError / LLMBackendError."""
+        started = time.perf_counter()
+        try:
+            return self._generate(prompt, generation_config, purpose)
+        except Exception:
+            metrics.incr(f"llm.errors.{purpose}")
+            raise
+        finally:
+            metrics.observe(f"llm.latency.{purpose}", time.perf_counter() - started)
+
+    def stream(self, prompt, generation_config, purpose='default'):
+        """Yields text chunks as they arrive. Raises LLMBlockedError if nothing usable came back."""
+        started = time.perf_counter()
+        first_chunk = True
+        try:
+            for chunk in self._stream(prompt, generation_config, purpose):
+                if first_chunk:
+                    metrics.observe(f"llm.first_chunk.{purpose}", time.perf_counter() - started)
+                    first_chunk = False
+                yield chunk
+        except Exception:
+            metrics.incr(f"llm.errors.{purpose}")
+            raise
+        finally:
+            metrics.observe(f"llm.latency.{purpose}", time.perf_counter() - started)
+
+    def generate_json(self, prompt, generation_config, purpose='default'):
+        """generate() parsed as JSON (a ```json fence around the payload is tolerated)."""
+        raw_text = strip_json_fences(self.generate(prompt, generation_config, purpose))
+        try:
+            return json.loads(raw_text)
+        except json.JSONDecodeError as je:
+            metrics.incr(f"llm.json_errors.{purpose}")
+            raise LLMJSONError(str(je), raw_text) from je
+
+    @abc.abstractmethod
+    def _generate(self, prompt, generation_config, purpose):
+        """The response text for one call."""
+
+    @abc.abstractmethod
+    def _stream(self, prompt, generation_config, purpose):
+        """Yields the response text in chunks."""
+
+
+def _block_reason(response, default):
+    prompt_feedback = getattr(response, 'prompt_feedback', None)
+    if prompt_feedback and prompt_feedback.block_reason:
+        return prompt_feedback.block_reason_message
+    return default
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini via the shared ModelPool."""
+    name = 'gemini'
+
+    def __init__(self, model_pool, model_name=None, safety_settings=None):
+        self.model_pool = model_pool
+        self.model_name = model_name or model_pool.default_model_name
+        self.safety_settings = safety_settings or DEFAULT_SAFETY_SETTINGS
+
+    @property
+    def available(self):
+        return self.model_pool.get(self.model_name) is not None
+
+    @property
+    def cache_namespace(self):
+        return f"gemini:{self.model_name}"
+
+    def _model(self):
+        model = self.model_pool.get(self.model_name)
+        if model is None:
+            raise LLMBackendError(f"Gemini model '{self.model_name}' is not initialized.")
+        return model
+
+    def _generation_config(self, generation_config):
+        return genai.types.GenerationConfig(**generation_config)
+
+    def _generate(self, prompt, generation_config, purpose):
+        response = self._model().generate_content(prompt, generation_config=self._generation_config(generation_config), safety_settings=self.safety_settings)
+        if not response.parts:
+            raise LLMBlockedError(_block_reason(response, "Response contained no usable parts."))
+        return "".join(part.text for part in response.parts if hasattr(part, 'text')).strip()
+
+    def _stream(self, prompt, generation_config, purpose):
+        response = self._model().generate_content(prompt, generation_config=self._generation_config(generation_config), safety_settings=self.safety_settings, stream=True)
+        produced = False
+        for chunk in response:
+            chunk_text = "".join(part.text for part in (chunk.parts or []) if hasattr(part, 'text'))
+            if chunk_text:
+                produced = True
+                yield chunk_text
+        if not produced:
+            raise LLMBlockedError(_block_reason(response, "Response contained no usable parts."))
+
+
+# Canned outputs per purpose. $-placeholders: $purpose, $prompt_hash, $variant.
+STUB_DEFAULT_RESPONSES = {
+    'dialogue': [
+        '"You ask a lot of questions for someone who hasn\'t bought a drink."',
+        '"I have heard that name before, and never in good company."',
+        '"Keep your voice down. The walls in this place have ears, and some of them are mine."',
+        '"If it\'s coin you\'re offering, I\'m listening. If it\'s trouble, I\'ve got plenty."',
+    ],
+    'next_topic': ["- The rumours from the north road\n- Who really owns the tavern\n- The missing caravan\n- An old debt still unpaid"],
+    'regenerate_topics': ["- A strange light over the marsh\n- The new captain of the guard\n- Prices at the market\n- A letter with a broken seal"],
+    'show_top5_options': ['1. "That\'s none of your concern."\n2. "Perhaps. What\'s it worth to you?"\n3. "I\'ve heard stories, nothing more."\n4. "Ask the innkeeper, not me."\n5. "Fine. But you didn\'t hear it from me."'],
+    'memory_extraction': ['{"key_entities": ["Stranger"], "key_facts_events": "A stranger asked questions.", "npc_sentiment_tag": "NEUTRAL", "ai_generated_summary": "Someone asked me about things I would rather forget."}'],
+    'default': ['[stub response $prompt_hash for $purpose]'],
+}
+
+
+_REQUEST_ID_RE = re.compile(r'^=== Request ID: (\S+) ===$', re.MULTILINE)
+
+
+class StubBackend(LLMBackend):
+    """
+    Local deterministic backend for offline runs, benchmarks and capacity tests.
+
+    Output is picked from canned/templated responses per purpose by a hash of the prompt, so
+    the same prompt always gets the same text. Latency is sampled from a configurable
+    distribution (fixed, uniform, normal, lognormal) and failures are injected at failure_rate;
+    with a seed, the latency/failure sequence is reproducible too.
+    """
+    name = 'stub'
+    LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+    def __init__(self, latency_distribution='fixed', latency_mean_ms=0, latency_stddev_ms=0,
+                 failure_rate=0.0, responses=None, stream_chunk_words=4, seed=None):
+        if latency_distribution not in self.LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown stub latency distribution '{latency_distribution}'. Expected one of {self.LATENCY_DISTRIBUTIONS}.")
+        self.latency_distribution = latency_distribution
+        self.latency_mean = max(0.0, latency_mean_ms / 1000.0)
+        self.latency_stddev = max(0.0, latency_stddev_ms / 1000.0)
+        self.failure_rate = failure_rate
+        self.responses = {**STUB_DEFAULT_RESPONSES, **(responses or {})}
+        self.stream_chunk_words = max(1, stream_chunk_words)
+        self._random = random.Random(seed)
+
+    def sample_latency(self):
+        mean, stddev = self.latency_mean, self.latency_stddev
+        if self.latency_distribution == 'fixed' or mean == 0:
+            return mean
+        if self.latency_distribution == 'uniform':
+            return self._random.uniform(max(0.0, mean - stddev), mean + stddev)
+        if self.latency_distribution == 'normal':
+            return max(0.0, self._random.gauss(mean, stddev))
+        # lognormal parameterised so the samples have the configured mean and stddev
+        sigma_squared = math.log(1 + (stddev / mean) ** 2)
+        return self._random.lognormvariate(math.log(mean) - sigma_squared / 2, math.sqrt(sigma_squared))
+
+    def render(self, prompt, purpose):
+        if purpose == 'memory_extraction_batch' and purpose not in self.responses:
+            return self._render_memory_batch(prompt)
+        prompt_hash = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        options = self.responses.get(purpose) or self.responses['default']
+        if isinstance(options, str):
+            options = [options]
+        variant = int(prompt_hash[:8], 16) % len(options)
+        return Template(options[variant]).safe_substitute(purpose=purpose, prompt_hash=prompt_hash[:12], variant=variant)
+
+    def _render_memory_batch(self, prompt):
+        # Batched extraction answers one object per "Request ID: ..." section of the prompt
+        entries = []
+        for request_id in _REQUEST_ID_RE.findall(prompt):
+            entry = json.loads(self.render(f"{prompt}#{request_id}", 'memory_extraction'))
+            entries.append(dict(entry, request_id=request_id))
+        return json.dumps(entries)
+
+    def _maybe_fail(self, purpose):
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise LLMBackendError(f"Stub backend injected failure for '{purpose}'.")
+
+    def _generate(self, prompt, generation_config, purpose):
+        time.sleep(self.sample_latency())
+        self._maybe_fail(purpose)
+        return self.render(prompt, purpose)
+
+    def _stream(self, prompt, generation_config, purpose):
+        latency = self.sample_latency()
+        self._maybe_fail(purpose)
+        words = self.render(prompt, purpose).split(' ')
+        chunks = [' '.join(words[i:i + self.stream_chunk_words]) for i in range(0, len(words), self.stream_chunk_words)]
+        for position, chunk in enumerate(chunks):
+            time.sleep(latency / len(chunks))
+            yield chunk if position == len(chunks) - 1 else chunk + ' '
+
+
+def load_stub_responses(path):
+    """Reads a {purpose: text or [texts]} JSON file of stub outputs."""
+    with open(path, 'r', encoding='utf-8') as f:
+        responses = json.load(f)
+    if not isinstance(responses, dict):
+        raise ValueError(f"Stub responses file '{path}' must contain a JSON object keyed by purpose.")
+    return responses
+
+
+def create_llm_backend(app, model_pool):
+    """Builds the backend selected by LLM_BACKEND ('gemini' or 'stub')."""
+    backend_name = (app.config.get('LLM_BACKEND') or 'gemini').lower()
+    if backend_name == 'stub':
+        responses_file = app.config.get('LLM_STUB_RESPONSES_FILE')
+        backend = StubBackend(
+            latency_distribution=app.config.get('LLM_STUB_LATENCY_DISTRIBUTION', 'fixed'),
+            latency_mean_ms=app.config.get('LLM_STUB_LATENCY_MEAN_MS', 0),
+            latency_stddev_ms=app.config.get('LLM_STUB_LATENCY_STDDEV_MS', 0),
+            failure_rate=app.config.get('LLM_STUB_FAILURE_RATE', 0.0),
+            responses=load_stub_responses(responses_file) if responses_file else None,
+            seed=app.config.get('LLM_STUB_SEED')
+        )
+        app.logger.warning(f"LLM backend: using the local STUB backend ({backend.latency_distribution}, mean {backend.latency_mean * 1000:.0f}ms, failure rate {backend.failure_rate}). No Gemini calls will be made.")
+        return backend
+    if backend_name != 'gemini':
+        raise ValueError(f"Unknown LLM_BACKEND '{backend_name}'. Expected 'gemini' or 'stub'.")
+    return GeminiBackend(model_pool, app.config.get('GEMINI_MODEL_NAME'))
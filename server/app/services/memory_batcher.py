@@ -0,0 +1,89 @@
+# server/app/services/memory_batcher.py
+import threading
+import uuid
+from concurrent.futures import Future
+from ..utils.metrics import metrics
+
+
+class _PendingExtraction:
+    __slots__ = ('request_id', 'item', 'future')
+
+    def __init__(self, item):
+        self.request_id = uuid.uuid4().hex[:8]
+        self.item = item
+        self.future = Future()
+
+
+class MemoryExtractionBatcher:
+    """
+    Collects memory extraction requests for up to window_seconds (or until max_items are
+    pending) and extracts them with one model call.
+
+    extract_batch([(request_id, item), ...]) returns {request_id: details} for the items it
+    could parse; every item it didn't return (or the whole batch, if the call fails) falls
+    back to extract_one(item), so one bad entry never costs the others their result.
+    Callers block in extract() until their own item is done.
+    """
+    def __init__(self, app, extract_batch, extract_one, max_items=8, window_seconds=0.5):
+        self.app = app
+        self.extract_batch = extract_batch
+        self.extract_one = extract_one
+        self.max_items = max(1, max_items)
+        self.window_seconds = window_seconds
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def extract(self, item, timeout=None):
+        pending = _PendingExtraction(item)
+        batch = None
+        with self._lock:
+            self._pending.append(pending)
+            if len(self._pending) >= self.max_items:
+                batch = self._take_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._run(batch) # Full batch: the caller that completed it runs it
+        return pending.future.result(timeout)
+
+    def _take_locked(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush_on_timer(self):
+        with self._lock:
+            batch = self._take_locked()
+        if batch:
+            with self.app.app_context():
+                self._run(batch)
+
+    def _run(self, batch):
+        metrics.observe("memory_batch.size", len(batch))
+        results = {}
+        if len(batch) > 1:
+            try:
+                results = self.extract_batch([(pending.request_id, pending.item) for pending in batch]) or {}
+            except Exception as e:
+                metrics.incr("memory_batch.batch_failures")
+                self.app.logger.warning(f"MemoryExtractionBatcher: batch of {len(batch)} failed ({e}); extracting items one by one.")
+
+        fallbacks = []
+        for pending in batch:
+            details = results.get(pending.request_id)
+            if details is None:
+                fallbacks.append(pending)
+            else:
+                pending.future.set_result(details)
+        if len(batch) > 1 and fallbacks:
+            metrics.incr("memory_batch.item_fallbacks", len(fallbacks))
+        for pending in fallbacks:
+            try:
+                pending.future.set_result(self.extract_one(pending.item))
+            except Exception as e:
+                pending.future.set_exception(e)
@@ -0,0 +1,89 @@
+# server/app/services/memory_index.py
+import heapq
+import re
+from datetime import datetime
+
+# Very simple stopword list (expand as needed)
+STOPWORDS = frozenset(["a", "an", "the", "is", "are", "was", "were", "of", "in", "on", "at", "to", "for", "and", "or", "but", "i", "you", "he", "she", "it", "we", "they", "me", "him", "her", "us", "them", "my", "your", "his", "its", "our", "their", "tell", "about", "what", "who", "when", "where", "why", "how", "npc", "name", "scene", "context"])
+_WORD_RE = re.compile(r'\b\w+\b')
+
+KEYWORD_MATCH_SCORE = 2 # Per scene keyword found in a memory
+
+
+def tokenize(text):
+    """Lowercased word tokens, minus stopwords and very short words."""
+    if not text or not isinstance(text, str):
+        return []
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS and len(word) > 2]
+
+
+def memory_term_frequencies(memory):
+    """Term -> count over the searchable fields of a memory entry. Computed once, at write time."""
+    entities = memory.get('extracted_entities') or []
+    if not isinstance(entities, list):
+        entities = [str(entities)]
+    text = " ".join([
+        str(memory.get('dialogue_snippet', '')),
+        str(memory.get('extracted_facts_events', '')),
+        " ".join(str(entity) for entity in entities),
+        str(memory.get('ai_generated_summary', ''))
+    ])
+    frequencies = {}
+    for term in tokenize(text):
+        frequencies[term] = frequencies.get(term, 0) + 1
+    return frequencies
+
+
+def recency_score(timestamp, now):
+    if not isinstance(timestamp, datetime):
+        timestamp = now
+    age_days = (now - timestamp).days
+    if age_days < 1: return 1.5 # Very recent
+    if age_days < 7: return 1 # Within a week
+    if age_days < 30: return 0.5 # Within a month
+    return 0
+
+
+class MemoryIndex:
+    """
+    Inverted index over one NPC's memories, built from the term frequencies stored with
+    each memory (legacy memories without them are tokenized once here).
+    Memories are kept in the order they were recorded (oldest first).
+    """
+    def __init__(self, memories):
+        self.memories = memories
+        self.postings = {}
+        for position, memory in enumerate(memories):
+            term_frequencies = memory.get('index_terms')
+            if not isinstance(term_frequencies, dict):
+                term_frequencies = memory_term_frequencies(memory)
+            for term, count in term_frequencies.items():
+                self.postings.setdefault(term, []).append((position, count))
+
+    def top_k(self, keywords, k=3, now=None):
+        """
+        Highest scoring memories for the given keywords: KEYWORD_MATCH_SCORE per matched keyword
+        plus a recency bonus, ties broken by recency. Only memories that match a keyword or are
+        among the k most recent can make the cut, so only those are scored.
+        """
+        now = now or datetime.utcnow()
+        scores = {}
+        for keyword in set(keywords):
+            for position, _count in self.postings.get(keyword, ()):
+                scores[position] = scores.get(position, 0) + KEYWORD_MATCH_SCORE
+        for position in range(max(0, len(self.memories) - k), len(self.memories)):
+            scores.setdefault(position, 0)
+
+        scored = []
+        for position, score in scores.items():
+            memory = self.memories[position]
+            timestamp = memory.get('timestamp')
+            score += recency_score(timestamp, now)
+            if score > 0:
+                scored.append((score, timestamp if isinstance(timestamp, datetime) else datetime.min, position))
+        best = heapq.nlargest(k, scored)
+        return [self.memories[position] for _score, _timestamp, position in best]
+
+    def most_recent(self, n):
+        return sorted(self.memories, key=lambda m: m.get('timestamp') if isinstance(m.get('timestamp'), datetime) else datetime.min, reverse=True)[:n]
+
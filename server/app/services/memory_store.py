@@ -0,0 +1,81 @@
+# server/app/services/memory_store.py
+from datetime import datetime
+from pymongo import DESCENDING # type: ignore
+from ..utils.db import mongo
+from .memory_index import MemoryIndex, memory_term_frequencies
+
+MEMORY_COLLECTION_NAME = 'npc_memories'
+
+# Fields the prompt needs from a memory; the dialogue snippet and extraction details stay in Mongo
+MEMORY_SUMMARY_PROJECTION = {"ai_generated_summary": 1, "npc_sentiment_tag": 1, "timestamp": 1, "index_terms": 1}
+# Upper bound on keyword-matching memories pulled back to rank; newest first
+TOP_K_CANDIDATE_LIMIT = 200
+
+
+def memory_document(npc_id, memory_entry):
+    """npc_memories document for a memory entry (as built by process_memory_submission or embedded in legacy NPCs)."""
+    document = {key: value for key, value in memory_entry.items() if key != 'memory_id'}
+    document["_id"] = memory_entry["memory_id"]
+    document["npc_id"] = npc_id
+    if not isinstance(document.get("index_terms"), dict):
+        document["index_terms"] = memory_term_frequencies(document)
+    # Multikey-indexed copy of the term keys, so keyword lookups don't scan an NPC's whole history
+    document["terms"] = sorted(document["index_terms"])
+    return document
+
+
+class MemoryStore:
+    """
+    NPC memories, one document per memory in the npc_memories collection.
+
+    Memories used to be embedded in the NPC document and capped at the newest 20; here they
+    are never dropped, and NPC documents stay the same size however long a campaign runs.
+    Retrieval only pulls the summary fields of memories that match a keyword (or are the
+    most recent), then ranks them with MemoryIndex. Its indexes are declared in utils/indexes.py.
+    """
+    @property
+    def collection(self):
+        return mongo.db[MEMORY_COLLECTION_NAME]
+
+    def add(self, npc_id, memory_entry):
+        """Stores the memory under its memory_id; adding the same memory_id again replaces it."""
+        document = memory_document(npc_id, memory_entry)
+        self.collection.replace_one({"_id": document["_id"]}, document, upsert=True)
+        return document
+
+    def remove_latest(self, npc_id):
+        """Deletes the NPC's newest memory. Returns it, or None if the NPC has none."""
+        return self.collection.find_one_and_delete({"npc_id": npc_id}, sort=[("timestamp", DESCENDING)])
+
+    def count(self, npc_id):
+        return self.collection.count_documents({"npc_id": npc_id})
+
+    def recent(self, npc_id, n):
+        """The NPC's n newest memories, newest first (summary fields only)."""
+        if n <= 0:
+            return []
+        return list(self.collection.find({"npc_id": npc_id}, MEMORY_SUMMARY_PROJECTION).sort("timestamp", DESCENDING).limit(n))
+
+    def with_entity(self, npc_id, entity, limit=10):
+        """Newest memories that extracted the given entity, newest first (summary fields only)."""
+        return list(self.collection.find({"npc_id": npc_id, "extracted_entities": entity}, MEMORY_SUMMARY_PROJECTION).sort("timestamp", DESCENDING).limit(limit))
+
+    def top_k(self, npc_id, keywords, k=3):
+        """Best k memories for the keywords, scored as MemoryIndex.top_k scores them."""
+        candidates = {memory["_id"]: memory for memory in self.recent(npc_id, k)}
+        keywords = list(set(keywords))
+        if keywords:
+            matching = self.collection.find({"npc_id": npc_id, "terms": {"$in": keywords}}, MEMORY_SUMMARY_PROJECTION) \
+                .sort("timestamp", DESCENDING).limit(TOP_K_CANDIDATE_LIMIT)
+            for memory in matching:
+                candidates.setdefault(memory["_id"], memory)
+        if not candidates:
+            return []
+        memories = sorted(candidates.values(), key=lambda memory: memory.get("timestamp") if isinstance(memory.get("timestamp"), datetime) else datetime.min) # MemoryIndex wants oldest first
+        return MemoryIndex(memories).top_k(keywords, k=k)
+
+    def delete_for_npc(self, npc_id):
+        return self.collection.delete_many({"npc_id": npc_id}).deleted_count
+
+
+memory_store = MemoryStore()
@@ -0,0 +1,62 @@
+# server/app/services/model_pool.py
+import threading
+import google.generativeai as genai # type: ignore
+
+
+class ModelPool:
+    """
+    Process-wide pool of warm Gemini model handles, keyed by model name.
+
+    genai is configured once per process and each GenerativeModel is built once,
+    then shared by every request thread (the handles are safe to reuse concurrently).
+    """
+    def __init__(self, api_key, default_model_name, logger=None):
+        self.api_key = api_key
+        self.default_model_name = default_model_name
+        self.logger = logger
+        self._models = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    @property
+    def available(self):
+        return bool(self.api_key)
+
+    def _configure_locked(self):
+        # Must be called with self._lock held
+        if not self._configured:
+            genai.configure(api_key=self.api_key)
+            self._configured = True
+            if self.logger:
+                self.logger.info("ModelPool: genai configured for this process.")
+
+    def get(self, model_name=None):
+        """Returns the warm handle for model_name (default model if None), building it on first use."""
+        model_name = model_name or self.default_model_name
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        if not self.api_key:
+            return None
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                try:
+                    self._configure_locked()
+                    model = genai.GenerativeModel(model_name)
+                    self._models[model_name] = model
+                    if self.logger:
+                        self.logger.info(f"ModelPool: GenerativeModel '{model_name}' initialized.")
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"ModelPool: failed to initialize GenerativeModel '{model_name}': {e}", exc_info=True)
+                    return None
+        return model
+
+    def warm(self, model_names=None):
+        """Eagerly builds handles so the first request doesn't pay the setup cost."""
+        for name in (model_names or [self.default_model_name]):
+            self.get(name)
+
+    def model_names(self):
+        return list(self._models.keys())
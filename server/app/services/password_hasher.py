@@ -0,0 +1,126 @@
+# server/app/services/password_hasher.py
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt # type: ignore
+from ..utils.metrics import metrics
+
+
+class PasswordHasherBusyError(Exception):
+    """More hash/verify calls pending than the hasher accepts; the caller should retry later."""
+
+
+# Run in the worker processes, so they must be module-level (picklable). Each returns the wall
+# clock time it started at, which is how long the job sat in the pool's queue is measured.
+def _hash_password(password, rounds):
+    started_at = time.time()
+    return started_at, bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _check_password(password, password_hash):
+    started_at = time.time()
+    return started_at, bcrypt.checkpw(password, password_hash)
+
+
+def _noop():
+    return None
+
+
+def _process_context():
+    # Never plain fork: by the time the pool starts, the parent has MongoClient monitor threads
+    # (and maybe request threads), whose locks a forked child could inherit mid-acquire.
+    # forkserver forks workers from a clean single-threaded server process; spawn elsewhere.
+    # Either way workers re-import the __main__ script, which must not build the app (see run.py).
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def hash_rounds(password_hash):
+    """Cost factor of a bcrypt hash ('$2b$12$...' -> 12), or None if it isn't one."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing on a dedicated, bounded process pool, so a burst of logins costs at most
+    max_workers cores and never blocks request threads' CPU.
+
+    At most max_workers + max_pending calls are in the pool at once; a caller that can't get in
+    within wait_timeout gets PasswordHasherBusyError. Metrics: password_hash.wait_seconds
+    (admission + pool queue wait), .run_seconds, .rejected and .rehashed, and the
+    password_hash.in_flight gauge.
+    """
+    def __init__(self, rounds=12, max_workers=2, max_pending=16, wait_timeout=10.0, logger=None):
+        self.rounds = rounds
+        self.max_workers = max(1, max_workers)
+        self.wait_timeout = wait_timeout
+        self.logger = logger
+        self._admission = threading.BoundedSemaphore(self.max_workers + max(0, max_pending))
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def warm(self):
+        """Starts the worker processes now, so the first login doesn't pay for their start-up."""
+        self._get_executor().submit(_noop).result()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_process_context())
+                except (OSError, NotImplementedError) as e:
+                    # No process support (e.g. some sandboxes); bcrypt releases the GIL, so threads still help
+                    if self.logger:
+                        self.logger.warning(f"PasswordHasher: process pool unavailable ({e}); hashing on threads.")
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='password-hash')
+            return self._executor
+
+    def _reset_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        submitted_at = time.time()
+        if not self._admission.acquire(timeout=self.wait_timeout):
+            metrics.incr("password_hash.rejected")
+            raise PasswordHasherBusyError("Too many password checks in progress; try again shortly.")
+        with self._lock:
+            self._in_flight += 1
+            metrics.set_gauge("password_hash.in_flight", self._in_flight)
+        try:
+            executor = self._get_executor()
+            try:
+                started_at, result = executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool and retry once
+                self._reset_executor(executor)
+                started_at, result = self._get_executor().submit(fn, *args).result()
+            finished_at = time.time()
+            metrics.observe("password_hash.wait_seconds", max(0.0, started_at - submitted_at))
+            metrics.observe("password_hash.run_seconds", max(0.0, finished_at - started_at))
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                metrics.set_gauge("password_hash.in_flight", self._in_flight)
+            self._admission.release()
+
+    def hash(self, password):
+        return self._run(_hash_password, password.encode('utf-8'), self.rounds)
+
+    def verify(self, password, password_hash):
+        try:
+            return self._run(_check_password, password.encode('utf-8'), password_hash.encode('utf-8'))
+        except ValueError: # Malformed stored hash
+            return False
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
@@ -0,0 +1,129 @@
+# server/app/services/prompt_budget.py
+import math
+from flask import current_app
+from ..utils.metrics import metrics
+
+# Rough heuristic for English prose with Gemini's tokenizer; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "..."
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text, max_tokens, marker=TRUNCATION_MARKER):
+    """Cuts text to about max_tokens, on a word boundary where possible, adding marker if cut."""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(marker))
+    cut = text[:max_chars]
+    if ' ' in cut[max_chars // 2:]:
+        cut = cut[:cut.rfind(' ')]
+    return cut.rstrip(" ,;:") + marker
+
+
+class _Section:
+    __slots__ = ('name', 'text', 'priority', 'required', 'min_tokens', 'header', 'items')
+
+    def __init__(self, name, text=None, priority=0, required=False, min_tokens=0, header=None, items=None):
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.required = required
+        self.min_tokens = min_tokens
+        self.header = header
+        self.items = items
+
+
+class PromptBudget:
+    """
+    Assembles a prompt from named sections under a token budget.
+
+    Required sections are always kept whole. The rest are filled in descending priority:
+    text sections are kept whole, truncated (if at least min_tokens fit) or dropped;
+    item sections (e.g. conversation turns) keep as many of their newest items as fit.
+    Sections are rendered in the order they were added, whatever their priority.
+    """
+    def __init__(self, name, max_tokens):
+        self.name = name
+        self.max_tokens = max_tokens
+        self._sections = []
+        self.report = {}
+
+    def add(self, name, text, priority=0, required=False, min_tokens=16):
+        if text:
+            self._sections.append(_Section(name, text=text, priority=priority, required=required, min_tokens=min_tokens))
+        return self
+
+    def add_items(self, name, header, items, priority=0, max_items=None):
+        """items are ordered oldest -> newest; the newest are kept first."""
+        items = list(items or [])
+        if max_items is not None:
+            items = items[-max_items:] if max_items else []
+        if items:
+            self._sections.append(_Section(name, priority=priority, header=header, items=items))
+        return self
+
+    def render(self):
+        rendered = {}
+        remaining = self.max_tokens
+        for section in self._sections:
+            if section.required:
+                rendered[id(section)] = section.text
+                remaining -= estimate_tokens(section.text) + 1
+
+        dropped = []
+        optional = sorted((s for s in self._sections if not s.required), key=lambda s: -s.priority)
+        for section in optional:
+            if section.items is not None:
+                header_cost = estimate_tokens(section.header) + 1 if section.header else 0
+                kept = []
+                budget_left = remaining - header_cost
+                for item in reversed(section.items):
+                    cost = estimate_tokens(item) + 1
+                    if cost > budget_left:
+                        break
+                    kept.append(item)
+                    budget_left -= cost
+                if not kept:
+                    dropped.append(section.name)
+                    continue
+                lines = ([section.header] if section.header else []) + list(reversed(kept))
+                rendered[id(section)] = "\n".join(lines)
+                remaining = budget_left
+                if len(kept) < len(section.items):
+                    dropped.append(f"{section.name}[{len(section.items) - len(kept)} oldest]")
+                continue
+            cost = estimate_tokens(section.text) + 1
+            if cost <= remaining:
+                rendered[id(section)] = section.text
+                remaining -= cost
+            elif remaining - 1 >= section.min_tokens:
+                rendered[id(section)] = truncate_to_tokens(section.text, remaining - 1)
+                remaining -= estimate_tokens(rendered[id(section)]) + 1
+                dropped.append(f"{section.name}[truncated]")
+            else:
+                dropped.append(section.name)
+
+        parts = [rendered[id(s)] for s in self._sections if id(s) in rendered]
+        prompt = "\n".join(parts)
+        total_tokens = estimate_tokens(prompt)
+        self.report = {
+            "budget": self.max_tokens,
+            "total_tokens": total_tokens,
+            "sections": {s.name: estimate_tokens(rendered[id(s)]) for s in self._sections if id(s) in rendered},
+            "dropped": dropped
+        }
+        metrics.observe(f"prompt.tokens.{self.name}", total_tokens)
+        if dropped:
+            metrics.incr(f"prompt.trimmed.{self.name}")
+        current_app.logger.info(f"Prompt budget [{self.name}]: ~{total_tokens}/{self.max_tokens} tokens. Trimmed: {', '.join(dropped) if dropped else 'nothing'}.")
+        return prompt
+
+
+def budget_for(action_name):
+    budgets = current_app.config.get('PROMPT_TOKEN_BUDGETS', {})
+    return PromptBudget(action_name, budgets.get(action_name, budgets.get('default', 1500)))
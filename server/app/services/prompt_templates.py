@@ -0,0 +1,87 @@
+# server/app/services/prompt_templates.py
+import hashlib
+import json
+from ..utils.cache import LRUTTLCache
+
+# Fields that make up the NPC-static part of every prompt. profile_version is a hash of these,
+# so any write path that changes one of them must store a fresh version (see compute_profile_version).
+PROFILE_PROMPT_FIELDS = ('name', 'race', 'class', 'appearance', 'personality_traits', 'backstory', 'motivations', 'flaws', 'speech_patterns')
+
+
+def compute_profile_version(npc_doc):
+    """Content hash of the prompt-relevant profile fields."""
+    material = json.dumps({field: npc_doc.get(field) for field in PROFILE_PROMPT_FIELDS}, sort_keys=True, default=str)
+    return hashlib.sha1(material.encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_personality_traits(personality_traits_input):
+    """Personality traits as a list, whether stored as a comma separated string or a list."""
+    if isinstance(personality_traits_input, str): #This should ideally be handled at data ingestion (load_npc_data.py)
+        return [trait.strip() for trait in personality_traits_input.split(',') if trait.strip()]
+    if isinstance(personality_traits_input, list):
+        return personality_traits_input
+    return []
+
+
+class CompiledNpcPrompt:
+    """Pre-rendered, NPC-static prompt fragments; only scene/memory/history parts are built per request."""
+    __slots__ = ('npc_name', 'dialogue_profile', 'backstory', 'dialogue_profile_details', 'action_profile_summary', 'memory_personality_summary')
+
+    def __init__(self, npc_name, dialogue_profile, backstory, dialogue_profile_details, action_profile_summary, memory_personality_summary):
+        self.npc_name = npc_name
+        # The dialogue profile is split so the prompt budget can trim backstory/details independently
+        self.dialogue_profile = dialogue_profile
+        self.backstory = backstory
+        self.dialogue_profile_details = dialogue_profile_details
+        self.action_profile_summary = action_profile_summary
+        self.memory_personality_summary = memory_personality_summary
+
+
+def compile_npc_prompt(npc_profile):
+    npc_name = npc_profile.get('name', 'The NPC')
+    personality_traits_list = normalize_personality_traits(npc_profile.get('personality_traits', []))
+
+    prompt_lines = []
+    prompt_lines.append(f"You are an AI masterfully roleplaying as {npc_name}, a character in a rich fantasy world. Your goal is to deliver compelling, cinematic dialogue that reveals your character's depth, advances the narrative, and engages the Game Master (GM).")
+    prompt_lines.append(f"The GM will describe a scene or pose a question. Your response MUST be a single, impactful, in-character line or two of spoken dialogue from {npc_name}'s perspective. Do NOT narrate actions, describe thoughts out of character, or break character. Focus purely on what {npc_name} says aloud.")
+    prompt_lines.append(f"\n=== {npc_name}'s In-Depth Character Profile ===")
+    prompt_lines.append(f"Name: {npc_name}")
+    prompt_lines.append(f"Race: {npc_profile.get('race', 'Unknown')}")
+    prompt_lines.append(f"Class/Role: {npc_profile.get('class', 'Unknown')}")
+    prompt_lines.append(f"Appearance: {npc_profile.get('appearance', 'Not clearly described.')}")
+    if personality_traits_list:
+        prompt_lines.append(f"Core Personality Traits: {', '.join(personality_traits_list)}. These traits MUST be evident in your speech and attitude. Consider the subtext they imply.")
+    else: # Fallback if list is empty
+        prompt_lines.append("Core Personality Traits: Not specified. (Adopt a generally observant and cautious demeanor, reacting based on the immediate context).")
+    if npc_profile.get('backstory'): backstory = f"Key Backstory Elements: {npc_profile['backstory']}"
+    else: backstory = "Key Backstory Elements: Not specified."
+    detail_lines = []
+    if npc_profile.get('motivations'): detail_lines.append(f"Driving Motivations: {npc_profile['motivations']}. Your dialogue should reflect these underlying goals and desires, even if subtly.")
+    else: detail_lines.append("Driving Motivations: Not specified.")
+    if npc_profile.get('flaws'): detail_lines.append(f"Significant Flaws/Weaknesses: {npc_profile['flaws']}. These can create internal conflict or lead to characteristic reactions or mistakes in your speech.")
+    else: detail_lines.append("Significant Flaws/Weaknesses: Not specified.")
+    if npc_profile.get('speech_patterns'): detail_lines.append(f"Speech Patterns/Voice: {npc_profile.get('speech_patterns')}")
+
+    personality_summary = ', '.join(personality_traits_list) if personality_traits_list else 'Unknown'
+    action_profile_summary = f"NPC Profile Summary: Personality: {personality_summary}. Motivations: {npc_profile.get('motivations', 'Unknown')}."
+
+    raw_traits = npc_profile.get('personality_traits', [])
+    if isinstance(raw_traits, str): memory_personality_summary = raw_traits
+    elif isinstance(raw_traits, list): memory_personality_summary = ", ".join(raw_traits)
+    else: memory_personality_summary = "observant"
+
+    return CompiledNpcPrompt(npc_name, "\n".join(prompt_lines), backstory, "\n".join(detail_lines), action_profile_summary, memory_personality_summary)
+
+
+npc_prompt_cache = LRUTTLCache('npc_prompt_templates', max_size=512, ttl_seconds=6 * 3600)
+
+
+def get_compiled_npc_prompt(npc_profile):
+    """Compiled static prompt for an NPC, cached by (npc_id, profile_version)."""
+    profile_version = npc_profile.get('profile_version') or compute_profile_version(npc_profile)
+    cache_key = (npc_profile.get('_id'), profile_version)
+    compiled = npc_prompt_cache.get(cache_key)
+    if compiled is None:
+        compiled = compile_npc_prompt(npc_profile)
+        npc_prompt_cache.set(cache_key, compiled)
+    return compiled
@@ -0,0 +1,149 @@
+# server/app/services/registry.py
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from .model_pool import ModelPool
+from .llm_backends import create_llm_backend
+from .resilience import AIMDLimiter, CircuitBreaker, ResilientBackend
+from .scheduler import FairScheduler
+from .speculation import Speculator
+from .dialogue_service import DialogueService
+from .job_queue import JobQueue
+from .password_hasher import PasswordHasher
+from .google_auth import GoogleTokenVerifier
+from .prompt_templates import npc_prompt_cache
+from ..utils.cache import LRUTTLCache
+
+EXTENSION_KEY = 'bugbear_services'
+
+
+class ServiceRegistry:
+    """
+    Long-lived services shared by all requests handled by one worker process.
+    Built once by create_app; routes fetch them via get_services()/get_dialogue_service().
+    """
+    def __init__(self, app):
+        # Workers start from a clean forkserver process (never forked from this threaded one);
+        # warmed here so the first login does not wait for them
+        self.password_hasher = PasswordHasher(
+            rounds=app.config.get('BCRYPT_ROUNDS', 12),
+            max_workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+            max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 16),
+            wait_timeout=app.config.get('PASSWORD_HASH_WAIT_TIMEOUT_SECONDS', 10.0),
+            logger=app.logger
+        )
+        try:
+            self.password_hasher.warm()
+        except Exception as e:
+            app.logger.error(f"ServiceRegistry: could not start password hashing workers: {e}", exc_info=True)
+        self.google_token_verifier = GoogleTokenVerifier(
+            certs_file=app.config.get('GOOGLE_CERTS_FILE'),
+            default_ttl=app.config.get('GOOGLE_CERTS_DEFAULT_TTL_SECONDS', 300),
+            clock_skew_seconds=app.config.get('GOOGLE_TOKEN_CLOCK_SKEW_SECONDS', 10)
+        )
+        api_key = app.config.get('GEMINI_API_KEY') or app.config.get('GOOGLE_API_KEY')
+        self.model_pool = ModelPool(
+            api_key=api_key,
+            default_model_name=app.config.get('GEMINI_MODEL_NAME', 'gemini-1.5-flash-latest'),
+            logger=app.logger
+        )
+        backend = create_llm_backend(app, self.model_pool)
+        if backend.name == 'gemini':
+            if not api_key:
+                app.logger.critical("ServiceRegistry: Gemini API key IS MISSING. AI features will be unavailable.")
+            self.model_pool.warm()
+        # Every model call goes through the breaker, the adaptive concurrency limit and bounded retries
+        self.llm_backend = ResilientBackend(
+            backend,
+            limiter=AIMDLimiter(
+                'llm.concurrency',
+                initial_limit=app.config.get('LLM_INITIAL_CONCURRENCY', 4),
+                min_limit=app.config.get('LLM_MIN_CONCURRENCY', 1),
+                max_limit=app.config.get('LLM_MAX_CONCURRENCY', 16),
+                latency_target=app.config.get('LLM_LATENCY_TARGET_SECONDS', 8.0),
+                queue_timeout=app.config.get('LLM_QUEUE_TIMEOUT_SECONDS', 10.0)
+            ),
+            breaker=CircuitBreaker(
+                'llm.breaker',
+                failure_threshold=app.config.get('LLM_BREAKER_FAILURE_THRESHOLD', 5),
+                reset_seconds=app.config.get('LLM_BREAKER_RESET_SECONDS', 30.0)
+            ),
+            max_retries=app.config.get('LLM_MAX_RETRIES', 2),
+            retry_base_delay=app.config.get('LLM_RETRY_BASE_DELAY_SECONDS', 0.5),
+            retry_max_delay=app.config.get('LLM_RETRY_MAX_DELAY_SECONDS', 4.0)
+        )
+        # Decides whose call runs next; its capacity follows the adaptive limit so work queues
+        # here, in fair order, rather than inside the limiter.
+        limiter = self.llm_backend.limiter
+        self.scheduler = FairScheduler(
+            capacity=lambda: int(limiter.limit),
+            weights=app.config.get('LLM_SCHEDULER_WEIGHTS'),
+            wait_timeout=app.config.get('LLM_SCHEDULER_WAIT_TIMEOUT_SECONDS', 30.0)
+        )
+        self.response_cache = LRUTTLCache(
+            'llm_responses',
+            max_size=app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 512),
+            ttl_seconds=app.config.get('RESPONSE_CACHE_TTL_SECONDS', 300)
+        )
+        # Session user documents for Flask-Login's load_user (see auth_service.load_session_user_data)
+        self.user_cache = LRUTTLCache(
+            'users',
+            max_size=app.config.get('USER_CACHE_MAX_ENTRIES', 1024),
+            ttl_seconds=app.config.get('USER_CACHE_TTL_SECONDS', 30)
+        )
+        self.speculator = None
+        if app.config.get('LLM_SPECULATION_ENABLED'):
+            self.speculator = Speculator(
+                ThreadPoolExecutor(max_workers=app.config.get('LLM_SPECULATION_WORKERS', 2), thread_name_prefix='speculation'),
+                actions=app.config.get('LLM_SPECULATION_ACTIONS', ('next_topic', 'show_top5_options')),
+                ttl_seconds=app.config.get('LLM_SPECULATION_TTL_SECONDS', 120),
+                max_calls_per_user=app.config.get('LLM_SPECULATION_BUDGET_PER_USER', 20),
+                budget_window_seconds=app.config.get('LLM_SPECULATION_BUDGET_WINDOW_SECONDS', 600),
+                # A click joined to an unfinished speculation waits no longer than it would for a slot
+                join_timeout_seconds=app.config.get('LLM_SCHEDULER_WAIT_TIMEOUT_SECONDS', 30.0)
+            )
+        self.caches = {cache.name: cache for cache in (self.response_cache, npc_prompt_cache, self.user_cache)}
+        if self.speculator is not None:
+            self.caches[self.speculator.results.name] = self.speculator.results
+        self.job_queue = JobQueue(
+            app,
+            max_workers=app.config.get('JOB_QUEUE_WORKERS', 8), # Keep >= MEMORY_BATCH_MAX_ITEMS (see config.py)
+            lease_seconds=app.config.get('JOB_LEASE_SECONDS', 300)
+        )
+        self.dialogue_service = DialogueService(
+            self.llm_backend,
+            response_cache=self.response_cache,
+            cached_actions=app.config.get('RESPONSE_CACHE_ACTIONS', ()),
+            cache_refresh_actions=app.config.get('RESPONSE_CACHE_REFRESH_ACTIONS', ()),
+            job_queue=self.job_queue,
+            scheduler=self.scheduler,
+            speculator=self.speculator
+        )
+        if app.config.get('MEMORY_BATCH_ENABLED', True):
+            self.dialogue_service.enable_memory_batching(
+                app,
+                max_items=app.config.get('MEMORY_BATCH_MAX_ITEMS', 8),
+                window_seconds=app.config.get('MEMORY_BATCH_WINDOW_SECONDS', 0.5)
+            )
+        # Bounded pool for fanning a scene's per-NPC model calls out in parallel
+        self.scene_executor = ThreadPoolExecutor(
+            max_workers=app.config.get('SCENE_MAX_WORKERS', 6),
+            thread_name_prefix='scene-gen'
+        )
+        try:
+            self.job_queue.recover()
+        except Exception as e:
+            app.logger.error(f"ServiceRegistry: could not recover pending jobs: {e}", exc_info=True)
+
+
+def init_services(app):
+    registry = ServiceRegistry(app)
+    app.extensions[EXTENSION_KEY] = registry
+    return registry
+
+
+def get_services():
+    return current_app.extensions[EXTENSION_KEY]
+
+
+def get_dialogue_service():
+    return get_services().dialogue_service
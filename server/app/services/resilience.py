@@ -0,0 +1,250 @@
+# server/app/services/resilience.py
+import random
+import threading
+import time
+from ..utils.metrics import metrics
+from .llm_backends import LLMBackend, LLMBackendError, LLMBlockedError, LLMJSONError
+
+_STREAM_END = object()
+
+
+class LLMUnavailableError(LLMBackendError):
+    """Rejected without calling upstream: the breaker is open or no concurrency slot freed up in time."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+class ConcurrencyLimitError(LLMUnavailableError):
+    pass
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit (additive increase, multiplicative decrease).
+
+    Each successful call under latency_target grows the limit by about 1 per limit's worth of
+    calls; a failure or a slow call multiplies it by backoff_ratio (at most once per
+    cooldown_seconds, so one burst of failures doesn't collapse it to the floor).
+    Callers over the limit wait up to queue_timeout for a slot, then get ConcurrencyLimitError.
+    """
+    def __init__(self, name, initial_limit=4, min_limit=1, max_limit=16, latency_target=8.0,
+                 backoff_ratio=0.5, queue_timeout=10.0, cooldown_seconds=1.0):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.queue_timeout = queue_timeout
+        self.cooldown_seconds = cooldown_seconds
+        self.in_use = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge(f"{self.name}.limit", int(self.limit))
+        metrics.set_gauge(f"{self.name}.in_use", self.in_use)
+
+    def acquire(self):
+        deadline = time.monotonic() + self.queue_timeout
+        with self._condition:
+            while self.in_use >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.incr(f"{self.name}.rejected")
+                    raise ConcurrencyLimitError(f"No upstream capacity within {self.queue_timeout}s (limit {int(self.limit)}).")
+                self._condition.wait(remaining)
+            self.in_use += 1
+            self._publish()
+
+    def release(self, latency, success):
+        """success=None releases the slot without adjusting the limit (e.g. client went away)."""
+        with self._condition:
+            self.in_use -= 1
+            if success is not None:
+                if success and latency <= self.latency_target:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                else:
+                    now = time.monotonic()
+                    if now - self._last_decrease >= self.cooldown_seconds:
+                        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                        self._last_decrease = now
+                        metrics.incr(f"{self.name}.decreases")
+            self._publish()
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures; open rejects immediately for
+    reset_seconds, then half_open lets a single probe through: success closes, failure re-opens.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        metrics.set_gauge(f"{self.name}.state", self.state)
+
+    def _set_state(self, state):
+        # Called with self._lock held
+        self.state = state
+        metrics.set_gauge(f"{self.name}.state", state)
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    metrics.incr(f"{self.name}.rejected")
+                    raise CircuitOpenError(f"Circuit open after {self._consecutive_failures} consecutive upstream failures.")
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    metrics.incr(f"{self.name}.rejected")
+                    raise CircuitOpenError("Circuit half-open; a probe request is already in flight.")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+                metrics.incr(f"{self.name}.closed")
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.incr(f"{self.name}.opened")
+                self._set_state(self.OPEN)
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """A call that ended without a verdict (e.g. abandoned stream) frees the half-open probe slot."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+def _is_retryable(error):
+    # Blocked prompts and malformed JSON won't get better by asking again; our own rejections
+    # mean upstream is already struggling.
+    return not isinstance(error, (LLMBlockedError, LLMJSONError, LLMUnavailableError))
+
+
+class ResilientBackend(LLMBackend):
+    """
+    Wraps an LLMBackend with a circuit breaker, an AIMD concurrency limiter and bounded
+    retries with full-jitter exponential backoff. A blocked response counts as a healthy
+    upstream answer. Streams are only retried if they fail before their first chunk.
+    """
+    def __init__(self, inner, limiter, breaker, max_retries=2, retry_base_delay=0.5, retry_max_delay=4.0):
+        self.inner = inner
+        self.name = inner.name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+    @property
+    def available(self):
+        return self.inner.available
+
+    @property
+    def cache_namespace(self):
+        return self.inner.cache_namespace
+
+    def _backoff(self, attempt, purpose):
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+        metrics.incr(f"llm.retries.{purpose}")
+        time.sleep(delay)
+
+    def _generate(self, prompt, generation_config, purpose):
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            try:
+                self.limiter.acquire()
+            except ConcurrencyLimitError:
+                self.breaker.release_probe()
+                raise
+            started = time.monotonic()
+            try:
+                result = self.inner._generate(prompt, generation_config, purpose)
+            except LLMBlockedError:
+                self.limiter.release(time.monotonic() - started, True)
+                self.breaker.record_success()
+                raise
+            except Exception as e:
+                self.limiter.release(time.monotonic() - started, False)
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                self._backoff(attempt, purpose)
+                attempt += 1
+                continue
+            self.limiter.release(time.monotonic() - started, True)
+            self.breaker.record_success()
+            return result
+
+    def _stream(self, prompt, generation_config, purpose):
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            try:
+                self.limiter.acquire()
+            except ConcurrencyLimitError:
+                self.breaker.release_probe()
+                raise
+            # Only time spent waiting on the model counts as the call's latency, not time suspended
+            # at the yield while a slow client drains the stream
+            upstream_seconds = 0.0
+            produced = False
+            verdict = None
+            try:
+                waited_from = time.monotonic()
+                try:
+                    chunks = iter(self.inner._stream(prompt, generation_config, purpose))
+                finally:
+                    upstream_seconds += time.monotonic() - waited_from
+                while True:
+                    waited_from = time.monotonic()
+                    try:
+                        chunk = next(chunks, _STREAM_END)
+                    finally:
+                        upstream_seconds += time.monotonic() - waited_from
+                    if chunk is _STREAM_END:
+                        break
+                    produced = True
+                    yield chunk
+                verdict = True
+            except LLMBlockedError:
+                verdict = True
+                raise
+            except Exception as e:
+                verdict = False
+                if produced or attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+            finally:
+                self.limiter.release(upstream_seconds, verdict)
+                if verdict is True: self.breaker.record_success()
+                elif verdict is False: self.breaker.record_failure()
+                else: self.breaker.release_probe()
+            if verdict:
+                return
+            self._backoff(attempt, purpose)
+            attempt += 1
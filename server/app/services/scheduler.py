@@ -0,0 +1,191 @@
+# server/app/services/scheduler.py
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from ..utils.metrics import metrics
+from .resilience import LLMUnavailableError
+
+WORK_CLASS_INTERACTIVE = 'interactive'
+WORK_CLASS_SUGGESTION = 'suggestion'
+WORK_CLASS_BACKGROUND = 'background'
+
+# Model call purpose -> work class. Unknown purposes are treated as suggestions.
+PURPOSE_WORK_CLASSES = {
+    'dialogue': WORK_CLASS_INTERACTIVE,
+    'next_topic': WORK_CLASS_SUGGESTION,
+    'regenerate_topics': WORK_CLASS_SUGGESTION,
+    'show_top5_options': WORK_CLASS_SUGGESTION,
+    'memory_extraction': WORK_CLASS_BACKGROUND,
+    'memory_extraction_batch': WORK_CLASS_BACKGROUND,
+}
+DEFAULT_WORK_CLASS_WEIGHTS = {WORK_CLASS_INTERACTIVE: 6, WORK_CLASS_SUGGESTION: 3, WORK_CLASS_BACKGROUND: 1}
+ANONYMOUS_USER = 'anonymous'
+
+
+class SchedulerTimeoutError(LLMUnavailableError):
+    """Waited longer than the scheduler's wait_timeout for a model call slot."""
+
+
+class _Waiter:
+    __slots__ = ('user_key', 'work_class', 'granted', 'enqueued_at')
+
+    def __init__(self, user_key, work_class):
+        self.user_key = user_key
+        self.work_class = work_class
+        self.granted = threading.Event()
+        self.enqueued_at = time.monotonic()
+
+
+class SlotTicket:
+    """
+    Handle on a slot request that may be raised to a higher work class while it waits (see
+    FairScheduler.promote) - e.g. speculative work a user has just asked for for real.
+    """
+    __slots__ = ('waiter', 'work_class')
+
+    def __init__(self):
+        self.waiter = None # The queued _Waiter, once the request reaches the scheduler
+        self.work_class = None # Class requested by promote() before the request was queued
+
+
+class FairScheduler:
+    """
+    Admission scheduler for model calls, shared by all request threads of a worker.
+
+    At most capacity() calls run at once. When a slot frees up, work classes are served by
+    stride scheduling in proportion to their weights (so interactive dialogue is not starved by
+    suggestions or memory extraction), and within a class users are served round robin, so one
+    user's burst only delays that user's own requests.
+
+    Metrics per class: scheduler.<class>.queue_depth (gauge), .wait_seconds (timing),
+    .dispatched, .timeouts and .promoted (counters).
+    """
+    def __init__(self, capacity, weights=None, wait_timeout=30.0):
+        self._capacity = capacity if callable(capacity) else (lambda: capacity)
+        self.weights = dict(weights or DEFAULT_WORK_CLASS_WEIGHTS)
+        self.wait_timeout = wait_timeout
+        self.active = 0
+        self._lock = threading.Lock()
+        self._queues = {work_class: OrderedDict() for work_class in self.weights} # user -> deque of waiters
+        self._depth = {work_class: 0 for work_class in self.weights}
+        self._pass = {work_class: 0.0 for work_class in self.weights}
+        self._virtual_time = 0.0
+
+    def work_class_for(self, purpose):
+        work_class = PURPOSE_WORK_CLASSES.get(purpose, WORK_CLASS_SUGGESTION)
+        return work_class if work_class in self.weights else next(iter(self.weights))
+
+    @contextmanager
+    def slot(self, user_id, purpose, work_class=None, ticket=None):
+        """Holds one model call slot for the duration of the block. work_class overrides the purpose's
+        class; a ticket lets another thread promote the request while it is queued."""
+        if work_class not in self.weights:
+            work_class = self.work_class_for(purpose)
+        self._acquire(user_id or ANONYMOUS_USER, work_class, ticket)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, user_key, work_class, ticket=None):
+        waiter = _Waiter(user_key, work_class)
+        with self._lock:
+            if ticket is not None:
+                if ticket.work_class is not None and self.weights[ticket.work_class] > self.weights[work_class]:
+                    waiter.work_class = ticket.work_class # Promoted before it got here
+                ticket.waiter = waiter
+            self._enqueue_locked(waiter)
+            self._dispatch_locked()
+        if not waiter.granted.wait(self.wait_timeout):
+            with self._lock:
+                if not waiter.granted.is_set():
+                    self._remove_locked(waiter)
+                    metrics.incr(f"scheduler.{waiter.work_class}.timeouts")
+                    raise SchedulerTimeoutError(f"No model call slot for '{waiter.work_class}' work within {self.wait_timeout}s.")
+        metrics.observe(f"scheduler.{waiter.work_class}.wait_seconds", time.monotonic() - waiter.enqueued_at)
+
+    def promote(self, ticket, work_class):
+        """
+        Raises a slot request to work_class if that class has a higher weight: a queued request
+        moves to the back of its user's line in that class, one not yet
+        queued will be queued there. Returns False if it already holds a slot or needs no change.
+        """
+        if work_class not in self.weights:
+            return False
+        with self._lock:
+            current = ticket.waiter.work_class if ticket.waiter is not None else ticket.work_class
+            if current is not None and self.weights[work_class] <= self.weights[current]:
+                return False
+            ticket.work_class = work_class
+            waiter = ticket.waiter
+            if waiter is None:
+                return True
+            if waiter.granted.is_set() or not self._remove_locked(waiter):
+                return False # Already running (or timed out)
+            waiter.work_class = work_class
+            self._enqueue_locked(waiter)
+            metrics.incr(f"scheduler.{work_class}.promoted")
+            self._dispatch_locked()
+            return True
+
+    def _enqueue_locked(self, waiter):
+        users = self._queues[waiter.work_class]
+        if not users:
+            # A class that was idle rejoins at the current virtual time instead of using its
+            # stale, low pass value to monopolise the slots.
+            self._pass[waiter.work_class] = max(self._pass[waiter.work_class], self._virtual_time)
+        users.setdefault(waiter.user_key, deque()).append(waiter)
+        self._set_depth(waiter.work_class, self._depth[waiter.work_class] + 1)
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+            self._dispatch_locked()
+
+    def _set_depth(self, work_class, depth):
+        # Called with self._lock held
+        self._depth[work_class] = depth
+        metrics.set_gauge(f"scheduler.{work_class}.queue_depth", depth)
+
+    def _remove_locked(self, waiter):
+        users = self._queues[waiter.work_class]
+        waiters = users.get(waiter.user_key)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del users[waiter.user_key]
+            self._set_depth(waiter.work_class, self._depth[waiter.work_class] - 1)
+            return True
+        return False
+
+    def _dispatch_locked(self):
+        while self.active < max(1, self._capacity()):
+            pending = [work_class for work_class, users in self._queues.items() if users]
+            if not pending:
+                return
+            work_class = min(pending, key=lambda c: self._pass[c])
+            self._virtual_time = self._pass[work_class]
+            self._pass[work_class] += 1.0 / self.weights[work_class]
+
+            users = self._queues[work_class]
+            user_key, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            del users[user_key]
+            if waiters:
+                users[user_key] = waiters # Back of the line: round robin between users
+            self._set_depth(work_class, self._depth[work_class] - 1)
+            self.active += 1
+            metrics.incr(f"scheduler.{work_class}.dispatched")
+            waiter.granted.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "capacity": self._capacity(),
+                "classes": {
+                    work_class: {"weight": self.weights[work_class], "queue_depth": self._depth[work_class], "waiting_users": len(users)}
+                    for work_class, users in self._queues.items()
+                }
+            }
@@ -0,0 +1,99 @@
+# server/app/services/speculation.py
+import threading
+import time
+from collections import deque
+from ..utils.cache import LRUTTLCache
+from ..utils.metrics import metrics
+from .scheduler import SlotTicket
+
+
+class SpeculationBudget:
+    """Per-user sliding-window cap on speculative model calls."""
+    def __init__(self, max_calls, window_seconds):
+        self.max_calls = max_calls
+        self.window_seconds = window_seconds
+        self._calls = {} # user -> deque of call times
+        self._lock = threading.Lock()
+
+    def try_spend(self, user_key, calls=1):
+        now = time.monotonic()
+        with self._lock:
+            history = self._calls.setdefault(user_key, deque())
+            while history and now - history[0] >= self.window_seconds:
+                history.popleft()
+            if len(history) + calls > self.max_calls:
+                return False
+            history.extend([now] * calls)
+            return True
+
+
+class _PendingSpeculation:
+    __slots__ = ('done', 'ticket')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ticket = SlotTicket()
+
+
+class Speculator:
+    """
+    State for speculative suggestion generation: after an NPC line, the follow-up suggestion
+    prompts (next topic / top 5 options) are generated in the background and parked here,
+    keyed on the prompt hash - i.e. on the conversation state the follow-up click will send.
+    A parked result is served once, then dropped.
+
+    Speculations not finished yet are tracked too (begin/finish): a click for one of them joins
+    it (see join) instead of issuing a duplicate call or waiting behind background work.
+    """
+    def __init__(self, executor, actions, ttl_seconds=120, max_entries=256, max_calls_per_user=20, budget_window_seconds=600,
+                 join_timeout_seconds=30.0):
+        self.executor = executor
+        self.actions = tuple(actions)
+        self.results = LRUTTLCache('speculative_suggestions', max_size=max_entries, ttl_seconds=ttl_seconds)
+        self.budget = SpeculationBudget(max_calls_per_user, budget_window_seconds)
+        self.join_timeout_seconds = join_timeout_seconds
+        self._pending = {} # key -> _PendingSpeculation
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Registers a speculation for key; its ticket goes to the scheduler slot it waits for."""
+        pending = _PendingSpeculation()
+        with self._lock:
+            self._pending[key] = pending
+        return pending
+
+    def finish(self, key, pending):
+        """Marks the speculation done (parked or not), releasing any click joined to it."""
+        with self._lock:
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+        pending.done.set()
+
+    def join(self, key, scheduler, work_class):
+        """
+        For a click whose prompt is still being speculated: raises the speculative call to the
+        click's work class, waits up to join_timeout_seconds for it and returns its suggestions.
+        None if nothing is pending for key, or it failed, produced nothing or took too long.
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is None:
+            return None
+        if scheduler is not None and scheduler.promote(pending.ticket, work_class):
+            metrics.incr("speculation.promoted")
+        if not pending.done.wait(self.join_timeout_seconds):
+            metrics.incr("speculation.join_timeouts")
+            return None
+        metrics.incr("speculation.joined")
+        return self.take(key)
+
+    def take(self, key):
+        suggestions = self.results.get(key)
+        if suggestions is not None:
+            self.results.invalidate(key)
+            metrics.incr("speculation.served")
+        return suggestions
+
+    def park(self, key, suggestions):
+        self.results.set(key, suggestions)
+        metrics.incr("speculation.parked")
@@ -0,0 +1,75 @@
+# server/app/services/world_knowledge.py
+import time
+from flask import current_app
+from ..utils.db import mongo
+from ..utils.versions import collection_versions
+from .prompt_budget import truncate_to_tokens
+
+EMPTY_WORLD_KNOWLEDGE = "General world knowledge is currently undefined or sparse."
+# Per-entry caps (estimated tokens) so one long description can't crowd out the others
+DESCRIPTION_MAX_TOKENS = 25
+IMPACT_MAX_TOKENS = 18
+WORLD_COLLECTIONS = ('world_events', 'world_locations', 'world_religions')
+DEFAULT_CACHE_TTL_SECONDS = 300
+
+
+def build_world_knowledge_summary():
+    """Queries the world collections and renders the background summary used in prompts.
+    Returns (summary_text, ok) - ok is False if any query failed, so the caller won't cache it."""
+    knowledge_parts = []
+    ok = True
+    try:
+        recent_events = list(mongo.db.world_events.find().sort("status", -1).limit(3))
+        if recent_events:
+            knowledge_parts.append("Some Recent World Events of Note:")
+            for event in recent_events:
+                knowledge_parts.append(f"- {event.get('name')}: {truncate_to_tokens(event.get('description', ''), DESCRIPTION_MAX_TOKENS)} (Impact: {truncate_to_tokens(event.get('impact', ''), IMPACT_MAX_TOKENS)}) Status: {event.get('status', 'Unknown')}.")
+        prominent_locations = list(mongo.db.world_locations.find().limit(2))
+        if prominent_locations:
+            knowledge_parts.append("\nKey Locations in the World:")
+            for loc in prominent_locations:
+                knowledge_parts.append(f"- {loc.get('name')} ({loc.get('type')}): {truncate_to_tokens(loc.get('description', ''), DESCRIPTION_MAX_TOKENS)} Current Mood: {loc.get('current_mood', 'Normal')}.")
+        prominent_religions = list(mongo.db.world_religions.find().limit(2))
+        if prominent_religions:
+            knowledge_parts.append("\nProminent Deities or Beliefs:")
+            for religion in prominent_religions:
+                domains = religion.get('domains', [])
+                domains_str = ', '.join(domains) if isinstance(domains, list) else str(domains)
+                knowledge_parts.append(f"- {religion.get('name')}: Known for {domains_str}. Common saying: \"{religion.get('common_saying','')}\"")
+    except Exception as e:
+        current_app.logger.error(f"Error fetching world knowledge from DB: {e}")
+        knowledge_parts.append("Error retrieving some world knowledge details.")
+        ok = False
+    summary = "\n".join(knowledge_parts) if knowledge_parts else EMPTY_WORLD_KNOWLEDGE
+    return summary, ok
+
+
+class WorldKnowledgeCache:
+    """
+    In-process cache of the rendered world knowledge summary, keyed on the shared versions of
+    the world collections. Writers bump those (collection_versions); the next read rebuilds.
+    Entries also expire after WORLD_KNOWLEDGE_CACHE_TTL_SECONDS, for writes nobody bumped.
+    """
+    def __init__(self):
+        self._entry = None # (version, built_at, summary), swapped as a whole so readers never see a torn entry
+
+    @property
+    def version(self):
+        return collection_versions.snapshot(WORLD_COLLECTIONS)
+
+    def get_summary(self):
+        ttl = current_app.config.get('WORLD_KNOWLEDGE_CACHE_TTL_SECONDS', DEFAULT_CACHE_TTL_SECONDS)
+        # Capture the version before querying: if a write lands mid-build, the entry
+        # is stored under the old version and the next read rebuilds it.
+        version = self.version
+        entry = self._entry
+        # Unreadable versions (None) fall back to the TTL alone
+        if entry is not None and time.monotonic() - entry[1] < ttl and version in (None, entry[0]):
+            return entry[2]
+        summary, ok = build_world_knowledge_summary()
+        if ok and version is not None:
+            self._entry = (version, time.monotonic(), summary)
+        return summary
+
+
+world_knowledge_cache = WorldKnowledgeCache()
@@ -0,0 +1,69 @@
+# server/app/utils/cache.py
+import threading
+import time
+from collections import OrderedDict
+from .metrics import metrics
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """
+    Size-bounded LRU cache whose entries also expire after ttl_seconds.
+    Thread-safe; hit/miss/eviction counts are kept locally (stats()) and mirrored
+    into the metrics registry as cache.<name>.<counter>.
+    """
+    def __init__(self, name, max_size=256, ttl_seconds=300):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _count(self, counter):
+        # Called with self._lock held
+        self._stats[counter] += 1
+        metrics.incr(f"cache.{self.name}.{counter}")
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self._count("misses")
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._count("expirations")
+                self._count("misses")
+                return default
+            self._data.move_to_end(key)
+            self._count("hits")
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        expires_at = time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._count("evictions")
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, size=len(self._data), hit_rate=(self._stats["hits"] / lookups) if lookups else 0.0)
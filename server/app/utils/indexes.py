@@ -0,0 +1,123 @@
+# server/app/utils/indexes.py
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING # type: ignore
+from pymongo.errors import OperationFailure # type: ignore
+
+
+class IndexSpec:
+    """One index on one collection. Options are passed through to create_index."""
+    __slots__ = ('collection', 'keys', 'name', 'options')
+
+    def __init__(self, collection, keys, name, **options):
+        self.collection = collection
+        self.keys = keys
+        self.name = name
+        self.options = options
+
+
+class QueryShape:
+    """A query the app runs, checked against its indexes with explain()."""
+    __slots__ = ('name', 'collection', 'filter', 'sort', 'limit')
+
+    def __init__(self, name, collection, filter, sort=None, limit=0):
+        self.name = name
+        self.collection = collection
+        self.filter = filter
+        self.sort = sort
+        self.limit = limit
+
+
+# Every index the app relies on. Applied idempotently at startup (MONGO_ENSURE_INDEXES) and by
+# manage_indexes.py; removing an entry here does not drop the index from existing databases.
+INDEXES = (
+    # Not unique: existing databases may already hold duplicates, and the auth service checks
+    # for an existing email/google_id before inserting.
+    IndexSpec('users', [("email", ASCENDING)], "email"),
+    IndexSpec('users', [("google_id", ASCENDING)], "google_id", sparse=True),
+    # Non-sparse, so the NPC list's global branch (user_id null or missing) can use it too
+    IndexSpec('npcs', [("user_id", ASCENDING)], "user_id"),
+    IndexSpec('world_events', [("status", DESCENDING)], "status"),
+    IndexSpec('npc_memories', [("npc_id", ASCENDING), ("timestamp", DESCENDING)], "npc_timestamp"),
+    IndexSpec('npc_memories', [("npc_id", ASCENDING), ("extracted_entities", ASCENDING)], "npc_entities"),
+    IndexSpec('npc_memories', [("npc_id", ASCENDING), ("terms", ASCENDING)], "npc_terms"),
+    IndexSpec('dialogue_jobs', [("status", ASCENDING), ("lease_expires_at", ASCENDING)], "status_lease"),
+)
+
+# The shapes of the app's hot queries; placeholder values stand in for request data
+QUERY_SHAPES = (
+    QueryShape('load_user', 'users', {"_id": "user-id"}),
+    QueryShape('login_by_email', 'users', {"email": "player@example.com"}),
+    QueryShape('google_user', 'users', {"google_id": "google-sub"}),
+    QueryShape('listed_npcs', 'npcs', {"$or": [{"user_id": None}, {"user_id": "user-id"}], "_id": {"$gt": "npc-id"}}, sort=[("_id", ASCENDING)], limit=101),
+    QueryShape('global_npc_check', 'npcs', {"_id": "npc-id", "$or": [{"user_id": {"$exists": False}}, {"user_id": None}]}),
+    QueryShape('npc_by_id', 'npcs', {"_id": "npc-id"}),
+    QueryShape('world_knowledge_events', 'world_events', {}, sort=[("status", DESCENDING)], limit=3),
+    QueryShape('recent_memories', 'npc_memories', {"npc_id": "npc-id"}, sort=[("timestamp", DESCENDING)], limit=3),
+    QueryShape('keyword_memories', 'npc_memories', {"npc_id": "npc-id", "terms": {"$in": ["dragon", "mill"]}}, sort=[("timestamp", DESCENDING)], limit=200),
+    QueryShape('entity_memories', 'npc_memories', {"npc_id": "npc-id", "extracted_entities": "Baron"}, sort=[("timestamp", DESCENDING)], limit=10),
+    QueryShape('queued_jobs', 'dialogue_jobs', {"status": "queued"}),
+    QueryShape('expired_job_leases', 'dialogue_jobs', {"status": "running", "lease_expires_at": {"$lt": datetime(2000, 1, 1)}}),
+)
+
+
+def ensure_indexes(db, collections=None, logger=None):
+    """
+    Creates every registered index (optionally only those on the given collections).
+    create_index is a no-op for an index that already exists with the same spec. Returns
+    (created or confirmed index names, failures as (name, error) pairs); one rejected index
+    (e.g. a conflicting existing one) doesn't stop the others, connection errors propagate.
+    """
+    ensured, failed = [], []
+    for spec in INDEXES:
+        if collections is not None and spec.collection not in collections:
+            continue
+        qualified_name = f"{spec.collection}.{spec.name}"
+        try:
+            db[spec.collection].create_index(spec.keys, name=spec.name, **spec.options)
+            ensured.append(qualified_name)
+        except OperationFailure as e:
+            failed.append((qualified_name, str(e)))
+            if logger:
+                logger.error(f"Indexes: could not create {qualified_name}: {e}")
+    if logger:
+        logger.info(f"--- INFO DEBUG: Ensured {len(ensured)} Mongo indexes ({len(failed)} failed) ---")
+    return ensured, failed
+
+
+def _plan_stages(plan):
+    """All stage names in an explain() plan tree, whatever the server's explain format."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def verify_query_plans(db, shapes=QUERY_SHAPES):
+    """
+    Explains each known query shape and reports its winning plan. A plan containing a COLLSCAN
+    stage means the query reads the whole collection. Returns a list of dicts:
+    {"name", "collection", "stages", "collscan", "error"}.
+    """
+    report = []
+    for shape in shapes:
+        entry = {"name": shape.name, "collection": shape.collection, "stages": [], "collscan": False, "error": None}
+        try:
+            cursor = db[shape.collection].find(shape.filter)
+            if shape.sort:
+                cursor = cursor.sort(shape.sort)
+            if shape.limit:
+                cursor = cursor.limit(shape.limit)
+            explained = cursor.explain()
+            winning_plan = explained.get('queryPlanner', {}).get('winningPlan', explained)
+            entry["stages"] = _plan_stages(winning_plan)
+            entry["collscan"] = 'COLLSCAN' in entry["stages"]
+        except OperationFailure as e:
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
@@ -0,0 +1,63 @@
+# server/app/utils/json_provider.py
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+from bson import ObjectId, Decimal128, Timestamp # type: ignore
+
+try:
+    import orjson # type: ignore
+except ImportError: # Optional: without it the stdlib encoder is used, with the same output types
+    orjson = None
+
+
+def encode_bson_value(obj):
+    """BSON/Mongo types the app returns, as JSON-friendly values. Raises TypeError otherwise."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Timestamp):
+        return obj.as_datetime().isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class BSONJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that serializes Mongo documents as they come off a cursor: ObjectId
+    and Decimal128 become strings, datetimes ISO 8601 strings. Uses orjson when installed
+    (several times faster on large payloads such as world info), else the stdlib encoder.
+    """
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and set(kwargs) <= {'indent', 'separators', 'sort_keys'}:
+            option = orjson.OPT_NON_STR_KEYS # Always compact output, so 'separators' needs no mapping
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            if kwargs.get('sort_keys', self.sort_keys):
+                option |= orjson.OPT_SORT_KEYS
+            try:
+                return orjson.dumps(obj, default=self._orjson_default, option=option).decode('utf-8')
+            except TypeError:
+                pass # e.g. an int beyond 64 bits; the stdlib encoder handles what orjson won't
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def _orjson_default(self, obj):
+        # orjson encodes datetime, date and UUID itself; this covers the rest
+        try:
+            return encode_bson_value(obj)
+        except TypeError:
+            return DefaultJSONProvider.default(obj)
+
+    @staticmethod
+    def default(obj):
+        try:
+            return encode_bson_value(obj)
+        except TypeError:
+            return DefaultJSONProvider.default(obj)
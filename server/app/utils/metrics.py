@@ -0,0 +1,43 @@
+# server/app/utils/metrics.py
+import threading
+
+
+class Metrics:
+    """
+    Minimal thread-safe, in-process metrics registry (per worker).
+    Counters only go up, gauges hold the latest value, and timings keep count/sum/max.
+    Exposed as JSON by the /metrics route.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+            timing["count"] += 1
+            timing["sum"] += value
+            if value > timing["max"]:
+                timing["max"] = value
+
+    def snapshot(self):
+        with self._lock:
+            timings = {}
+            for name, timing in self._timings.items():
+                timings[name] = dict(timing, avg=(timing["sum"] / timing["count"]) if timing["count"] else 0.0)
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges), "timings": timings}
+
+
+metrics = Metrics()
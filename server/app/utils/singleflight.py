@@ -0,0 +1,67 @@
+# server/app/utils/singleflight.py
+import threading
+from .metrics import metrics
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller (the leader) runs fn,
+    callers arriving while it is in flight wait and get the same result, or the same exception.
+    Nothing is kept once the call finishes - this de-duplicates work, it is not a cache.
+
+    Metrics: singleflight.<name>.calls (upstream calls made), .coalesced (callers that
+    shared one), .waiters (timing: waiters per completed key) and the .in_flight gauge.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Returns (result, shared); shared is True if this caller waited on another's call."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+                metrics.set_gauge(f"singleflight.{self.name}.in_flight", len(self._calls))
+
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        metrics.incr(f"singleflight.{self.name}.calls")
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+                metrics.set_gauge(f"singleflight.{self.name}.in_flight", len(self._calls))
+            metrics.observe(f"singleflight.{self.name}.waiters", waiters)
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        """Waiter count per in-flight key (keys shortened for display)."""
+        with self._lock:
+            return {str(key)[:40]: call.waiters for key, call in self._calls.items()}
@@ -0,0 +1,100 @@
+# server/app/utils/versions.py
+import hashlib
+import time
+import uuid
+from functools import wraps
+from flask import current_app, make_response, request
+from flask_login import current_user
+from pymongo.errors import PyMongoError
+from .db import mongo
+from .metrics import metrics
+
+# One doc per collection: {_id: <collection name>, version: <int>, token: <random hex>}
+VERSIONS_COLLECTION_NAME = 'collection_versions'
+# Conditional responses must be revalidated every time, and only by the requesting browser
+CONDITIONAL_CACHE_CONTROL = 'private, no-cache'
+DEFAULT_ETAG_MAX_AGE_SECONDS = 300
+
+
+def bump_collection_versions(db, *collections):
+    """
+    Records a write to each collection. Takes a plain pymongo Database so the loader and
+    migration scripts bump the same versions the routes do.
+    """
+    for collection in collections:
+        db[VERSIONS_COLLECTION_NAME].update_one(
+            {"_id": collection},
+            # A fresh token too: if the doc is ever dropped, the restarted count can't reproduce an old tag
+            {"$inc": {"version": 1}, "$set": {"token": uuid.uuid4().hex}},
+            upsert=True
+        )
+
+
+def read_collection_versions(db, collections):
+    """Current token per collection (None if never written), in one query."""
+    docs = db[VERSIONS_COLLECTION_NAME].find({"_id": {"$in": list(collections)}}, {"token": 1})
+    tokens = {doc['_id']: doc.get('token') for doc in docs}
+    return tuple(tokens.get(collection) for collection in collections)
+
+
+class CollectionVersions:
+    """
+    Change tokens per collection, kept in Mongo (the collection_versions collection) so every
+    worker sees the same ones. The write routes bump them here; load_npc_data.py and
+    migrate_npc_memories.py bump them with bump_collection_versions.
+    """
+    def bump(self, *collections):
+        try:
+            bump_collection_versions(mongo.db, *collections)
+        except PyMongoError as e:
+            # The write itself went through; tags over it expire with their time bucket
+            current_app.logger.error(f"Failed to bump collection versions {collections}: {e}")
+
+    def snapshot(self, collections):
+        """Tokens for the collections, or None if they can't be read."""
+        try:
+            return read_collection_versions(mongo.db, collections)
+        except PyMongoError as e:
+            current_app.logger.warning(f"Failed to read collection versions {collections}: {e}")
+            return None
+
+    def etag(self, snapshot, *vary):
+        # The time bucket bounds how long a tag can validate over a write that was never bumped
+        max_age = current_app.config.get('CONDITIONAL_ETAG_MAX_AGE_SECONDS', DEFAULT_ETAG_MAX_AGE_SECONDS)
+        bucket = int(time.time() // max_age) if max_age > 0 else None
+        key = repr((snapshot, bucket, vary))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+collection_versions = CollectionVersions()
+
+
+def conditional_on(*collections, per_user=False):
+    """
+    Route decorator: ETag from the versions of the collections the view reads (plus the request
+    path and query, the user id when per_user, and a CONDITIONAL_ETAG_MAX_AGE_SECONDS time
+    bucket). A matching If-None-Match gets a 304 before the view - and the collections it
+    reads - is touched. Only 200 responses are tagged; if the versions can't be read the view
+    is served untagged.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Taken before the view reads: a write landing mid-read only makes the tag stale-early
+            snapshot = collection_versions.snapshot(collections)
+            if snapshot is None:
+                return view(*args, **kwargs)
+            vary = (request.full_path, current_user.get_id() if per_user else None)
+            tag = collection_versions.etag(snapshot, *vary)
+            if tag in request.if_none_match:
+                metrics.incr("http.not_modified")
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = CONDITIONAL_CACHE_CONTROL
+            return response
+        return wrapper
+    return decorator
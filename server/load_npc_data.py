@@ -1,10 +1,15 @@
 # server/load_npc_data.py
 import os
 import json
-from pymongo import MongoClient, errors # type: ignore
+from pymongo import MongoClient, UpdateOne, errors # type: ignore
 from dotenv import load_dotenv
 import glob 
 import uuid
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from app.services.prompt_templates import compute_profile_version
+from app.services.foundry_import import FoundryImportError, foundry_actor_to_npc, is_foundry_actor_filename, read_foundry_actor
+from app.utils.versions import bump_collection_versions
 
 SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
 dotenv_path = os.path.join(SERVER_DIR, '.env')
@@ -15,49 +20,46 @@ DATABASE_NAME = MONGO_URI.split('/')[-1].split('?')[0]
 NPC_COLLECTION_NAME = 'npcs'
 NPC_DATA_DIR_PATH = os.path.join(SERVER_DIR, 'app', 'data')
 VUTHAUSK_SOULS_KEY = 'wyrmshard_collected_souls'
-
-def process_npc_data(npc_raw_data, npc_collection, file_name="Unknown File", is_soul_npc=False, main_npc_id_for_soul=None):
-    inserted, updated, skipped, matched_no_change = 0, 0, 0, 0
-
-    if not isinstance(npc_raw_data, dict):
-        print(f"Warning [{file_name}]: Item is not a valid NPC object. Skipping: {str(npc_raw_data)[:100]}")
-        return 0, 0, 1, 0
-
-    npc_id_source = "unknown"
+BULK_BATCH_SIZE = 500 # UpdateOne upserts per bulk_write in --bulk mode
+BULK_DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+def _id_slug(value):
+    return value.lower().replace(' ', '_').replace('-', '_')
+
+def resolve_npc_id(npc_raw_data, file_name, is_soul_npc=False):
+    """
+    (_id, source) for an NPC record: its own _id or id field, else an id generated from the file
+    and NPC name (source "generated"). Generated ids are only candidates - the caller checks
+    them against the collection and de-duplicates a clash with a different NPC.
+    """
     # Use name from Vuthausk's specific structure if it's him for ID gen before general mapping
     if file_name.lower() == 'vuthausk.json' and not is_soul_npc and 'character_details' in npc_raw_data:
          actual_name_for_id = npc_raw_data.get('character_details', {}).get('basic_information', {}).get('name', 'vuthausk')
-         npc_name_for_id_gen = actual_name_for_id.lower().replace(' ', '_').replace('-', '_')
+         npc_name_for_id_gen = _id_slug(actual_name_for_id)
     else:
-        npc_name_for_id_gen = npc_raw_data.get('name', 'unnamed').lower().replace(' ', '_').replace('-', '_')
+        npc_name_for_id_gen = _id_slug(npc_raw_data.get('name', 'unnamed'))
 
-    
     if '_id' in npc_raw_data and npc_raw_data['_id']:
-        npc_id = npc_raw_data['_id']
-        npc_id_source = "_id field"
-    elif 'id' in npc_raw_data and npc_raw_data['id']:
-        npc_id = npc_raw_data['id']
-        npc_id_source = "id field"
-    else:
-        file_name_part = os.path.splitext(file_name)[0].lower().replace(' ', '_').replace('-', '_')
-        base_id_prefix = f"{file_name_part}_soul_" if is_soul_npc else f"{file_name_part}_"
-        
-        temp_id = f"{base_id_prefix}{npc_name_for_id_gen}"
-        
-        if is_soul_npc and len(npc_name_for_id_gen) > 20: 
-            npc_name_for_id_gen_short = npc_name_for_id_gen[:20]
-            temp_id = f"{base_id_prefix}{npc_name_for_id_gen_short}"
-
-
-        existing_doc = npc_collection.find_one({"_id": temp_id})
-        if existing_doc and existing_doc.get('name') != npc_raw_data.get('name'): 
-            npc_id = f"{temp_id}_{str(uuid.uuid4())[:4]}"
-            print(f"Warning [{file_name}]: Generated _id '{temp_id}' might conflict for '{npc_raw_data.get('name', 'Unnamed')}'. Appended UUID part: '{npc_id}'")
-        else:
-            npc_id = temp_id
-
-        npc_id_source = "generated"
-    
+        return npc_raw_data['_id'], "_id field"
+    if 'id' in npc_raw_data and npc_raw_data['id']:
+        return npc_raw_data['id'], "id field"
+
+    file_name_part = _id_slug(os.path.splitext(file_name)[0])
+    base_id_prefix = f"{file_name_part}_soul_" if is_soul_npc else f"{file_name_part}_"
+    if is_soul_npc and len(npc_name_for_id_gen) > 20: 
+        npc_name_for_id_gen = npc_name_for_id_gen[:20]
+    return f"{base_id_prefix}{npc_name_for_id_gen}", "generated"
+
+def deduplicated_npc_id(temp_id, npc_raw_data, file_name, existing_doc):
+    """temp_id, or temp_id plus a short random suffix if existing_doc (its current holder) is a differently named NPC."""
+    if existing_doc and existing_doc.get('name') != npc_raw_data.get('name'):
+        npc_id = f"{temp_id}_{str(uuid.uuid4())[:4]}"
+        print(f"Warning [{file_name}]: Generated _id '{temp_id}' might conflict for '{npc_raw_data.get('name', 'Unnamed')}'. Appended UUID part: '{npc_id}'")
+        return npc_id
+    return temp_id
+
+def build_npc_doc(npc_raw_data, npc_id, file_name="Unknown File", is_soul_npc=False, main_npc_id_for_soul=None):
+    """The NPC document to upsert for one raw record. Pure (no database access), so it runs in --bulk workers."""
     # --- Field Mapping ---
     name = npc_raw_data.get('name', 'Unnamed NPC')
     appearance = npc_raw_data.get('appearance', 'No description available.')
@@ -127,14 +129,29 @@ def process_npc_data(npc_raw_data, npc_collection, file_name="Unknown File", is_
         'mannerisms': mannerisms,
         'source_file': file_name,
         'is_soul_npc': is_soul_npc,
-        'main_npc_id_if_soul': main_npc_id_for_soul if is_soul_npc else None,
-        'memories': [] # Initialize memories array
+        'main_npc_id_if_soul': main_npc_id_for_soul if is_soul_npc else None
     }
-    # Clean out None values or empty strings/lists before insertion if desired, but ensure 'memories: []' stays
-    npc_doc_cleaned = {k: v for k, v in npc_doc.items() if v is not None and v != '' and (isinstance(v, list) and len(v) > 0 or not isinstance(v, list) or k == 'memories')}
-    if 'memories' not in npc_doc_cleaned: # Ensure memories is always present, even if empty
-        npc_doc_cleaned['memories'] = []
+    # Clean out None values and empty strings/lists before insertion. Memories are not part of
+    # the NPC document; they live in the npc_memories collection.
+    npc_doc_cleaned = {k: v for k, v in npc_doc.items() if v is not None and v != '' and (isinstance(v, list) and len(v) > 0 or not isinstance(v, list))}
+    # Prompt templates are cached per profile version; a content hash only changes when the profile does
+    npc_doc_cleaned['profile_version'] = compute_profile_version(npc_doc_cleaned)
+    return npc_doc_cleaned
+
+def process_npc_data(npc_raw_data, npc_collection, file_name="Unknown File", is_soul_npc=False, main_npc_id_for_soul=None):
+    inserted, updated, skipped, matched_no_change = 0, 0, 0, 0
+
+    if not isinstance(npc_raw_data, dict):
+        print(f"Warning [{file_name}]: Item is not a valid NPC object. Skipping: {str(npc_raw_data)[:100]}")
+        return 0, 0, 1, 0
+
+    npc_id, npc_id_source = resolve_npc_id(npc_raw_data, file_name, is_soul_npc)
+    if npc_id_source == "generated":
+        existing_doc = npc_collection.find_one({"_id": npc_id})
+        npc_id = deduplicated_npc_id(npc_id, npc_raw_data, file_name, existing_doc)
 
+    npc_doc_cleaned = build_npc_doc(npc_raw_data, npc_id, file_name, is_soul_npc, main_npc_id_for_soul)
+    name = npc_doc_cleaned.get('name')
 
     try:
         result = npc_collection.update_one(
@@ -167,7 +184,101 @@ def process_npc_data(npc_raw_data, npc_collection, file_name="Unknown File", is_
     
     return inserted, updated, skipped, matched_no_change
 
-def load_npcs_to_db():
+def expand_npc_file(file_name, data_from_file, log=print):
+    """
+    The NPC records in one parsed file, as (npc_raw, is_soul, main_id_link) tuples, or None if the
+    file holds neither a list nor an object. vuthausk.json expands into Vuthausk plus one NPC per
+    collected soul.
+    """
+    npcs_to_process = []
+    vuthausk_main_id_for_souls = None 
+
+    if file_name.lower() == 'vuthausk.json' and isinstance(data_from_file, dict) and 'character_details' in data_from_file:
+        log(f"Handling {file_name} (Vuthausk + souls).")
+        npcs_to_process.append(data_from_file) 
+        vuthausk_name_from_json = data_from_file.get('character_details', {}).get('basic_information', {}).get('name', 'vuthausk')
+        vuthausk_main_id_for_souls = f"vuthausk_{_id_slug(vuthausk_name_from_json)}"
+
+        souls_list = data_from_file.get('character_details', {}).get('in_game_details', {}).get(VUTHAUSK_SOULS_KEY, [])
+        if isinstance(souls_list, list) and souls_list:
+            log(f"Found {len(souls_list)} souls in {file_name}.")
+            for soul_str in souls_list:
+                if isinstance(soul_str, str) and soul_str.strip():
+                    soul_name_parts = soul_str.split(' - ')
+                    soul_name = soul_name_parts[0].strip() if soul_name_parts else "Unnamed Soul"
+                    soul_desc = soul_name_parts[1].strip() if len(soul_name_parts) > 1 else soul_str
+                    soul_npc_data = {
+                        'name': soul_name,
+                        'appearance': f"A past life soul: {soul_desc}",
+                        'personality_traits': ["Past Life Influence"], # Stored as list
+                    }
+                    npcs_to_process.append(soul_npc_data)
+        else:
+            log(f"No souls list found or empty in {file_name} under key '{VUTHAUSK_SOULS_KEY}'.")
+
+    elif isinstance(data_from_file, list):
+        npcs_to_process = data_from_file
+        log(f"Found {len(npcs_to_process)} NPCs (list) in {file_name}.")
+    elif isinstance(data_from_file, dict):
+        npcs_to_process = [data_from_file]
+        log(f"Found 1 NPC (single object) in {file_name}.")
+    else:
+        log(f"Warning: Data in {file_name} is not a list or object. Skipping.")
+        return None
+
+    records = []
+    for i, npc_raw in enumerate(npcs_to_process):
+        is_soul = False
+        main_id_link = None
+        if file_name.lower() == 'vuthausk.json':
+            if i == 0: 
+                is_soul = False
+            else: 
+                is_soul = True
+                main_id_link = vuthausk_main_id_for_souls 
+        records.append((npc_raw, is_soul, main_id_link))
+    return records
+
+def read_npc_file(json_file_path, log=print):
+    """
+    The records of one NPC file, as expand_npc_file returns them, or None if it can't be read.
+    Foundry VTT actor exports (fvtt-Actor-*.json) are streamed for just their profile fields
+    and mapped to one NPC.
+    """
+    file_name = os.path.basename(json_file_path)
+    if is_foundry_actor_filename(file_name):
+        try:
+            with open(json_file_path, 'rb') as f:
+                npc_raw = foundry_actor_to_npc(read_foundry_actor(f), file_name)
+        except (OSError, FoundryImportError) as e:
+            log(f"Error reading/parsing {file_name}: {e}. Skipping.")
+            return None
+        log(f"Found 1 NPC (Foundry VTT actor export) in {file_name}.")
+        return [(npc_raw, False, None)]
+
+    try:
+        with open(json_file_path, 'r', encoding='utf-8') as f:
+            data_from_file = json.load(f)
+    except Exception as e:
+        log(f"Error reading/parsing {file_name}: {e}. Skipping.")
+        return None
+    return expand_npc_file(file_name, data_from_file, log=log)
+
+def find_npc_json_files(foundry_paths=()):
+    json_files = glob.glob(os.path.join(NPC_DATA_DIR_PATH, '*.json'))
+    # Filter out world data files from being processed by process_npc_data here
+    # Assumes NPC files don't start with "world_"
+    npc_json_files = sorted(f for f in json_files if not os.path.basename(f).startswith('world_'))
+    # --foundry: export files, or directories searched for fvtt-Actor-*.json
+    for path in foundry_paths:
+        if os.path.isdir(path):
+            npc_json_files.extend(sorted(glob.glob(os.path.join(path, 'fvtt-Actor-*.json'))))
+        else:
+            npc_json_files.append(path)
+    return npc_json_files
+
+def connect_npc_collection():
+    """(client, npc collection), or (None, None) after printing why the connection failed."""
     try:
         print(f"Connecting to MongoDB: {MONGO_URI}")
         client = MongoClient(MONGO_URI)
@@ -175,8 +286,33 @@ def load_npcs_to_db():
         db = client[DATABASE_NAME]
         npc_collection = db[NPC_COLLECTION_NAME]
         print(f"Connected to DB '{DATABASE_NAME}', collection '{NPC_COLLECTION_NAME}'.")
+        return client, npc_collection
     except Exception as e:
         print(f"Fatal: MongoDB connection error: {e}")
+        return None, None
+
+def print_load_summary(files_processed, total_records_in_files, total_inserted, total_updated, total_skipped, total_matched_no_change):
+    print(f"\n--- Overall NPC Load Summary ---")
+    print(f"NPC Files processed: {files_processed}")
+    print(f"NPC records in files (from NPC files only): {total_records_in_files}") # This count is now more accurate for NPCs
+    print(f"Inserted to DB: {total_inserted}")
+    print(f"Updated in DB: {total_updated}")
+    print(f"Matched (no change): {total_matched_no_change}")
+    print(f"Skipped: {total_skipped}")
+    print(f"NPC Load complete.")
+
+def bump_npc_version(npc_collection, total_inserted, total_updated):
+    """Tells the running server the NPC list changed, so its cached responses (ETags) are revalidated."""
+    if not (total_inserted or total_updated):
+        return
+    try:
+        bump_collection_versions(npc_collection.database, NPC_COLLECTION_NAME)
+    except errors.PyMongoError as e:
+        print(f"Warning: could not bump the '{NPC_COLLECTION_NAME}' version ({e}); browsers may show the old NPC list for a few minutes.")
+
+def load_npcs_to_db(foundry_paths=()):
+    client, npc_collection = connect_npc_collection()
+    if client is None:
         return
 
     total_records_in_files, total_inserted, total_updated, total_skipped, total_matched_no_change = 0, 0, 0, 0, 0
@@ -185,12 +321,7 @@ def load_npcs_to_db():
         print(f"Error: NPC data directory not found: {NPC_DATA_DIR_PATH}")
         return
 
-    json_files = glob.glob(os.path.join(NPC_DATA_DIR_PATH, '*.json'))
-    # Filter out world data files from being processed by process_npc_data here
-    # Assumes NPC files don't start with "world_"
-    npc_json_files = [f for f in json_files if not os.path.basename(f).startswith('world_')]
-    # world_data_files = [f for f in json_files if os.path.basename(f).startswith('world_')]
-
+    npc_json_files = find_npc_json_files(foundry_paths)
 
     if not npc_json_files:
         print(f"No NPC specific .json files found in {NPC_DATA_DIR_PATH} (excluding files starting with 'world_').")
@@ -205,62 +336,13 @@ def load_npcs_to_db():
             file_name = os.path.basename(json_file_path)
             print(f"\n--- Processing NPC file: {file_name} ---")
             
-            try:
-                with open(json_file_path, 'r', encoding='utf-8') as f:
-                    data_from_file = json.load(f)
-            except Exception as e:
-                print(f"Error reading/parsing {file_name}: {e}. Skipping.")
-                continue
-
-            npcs_to_process = []
-            vuthausk_main_id_for_souls = None 
-
-            if file_name.lower() == 'vuthausk.json' and isinstance(data_from_file, dict) and 'character_details' in data_from_file:
-                print(f"Handling {file_name} (Vuthausk + souls).")
-                npcs_to_process.append(data_from_file) 
-                vuthausk_name_from_json = data_from_file.get('character_details', {}).get('basic_information', {}).get('name', 'vuthausk')
-                vuthausk_main_id_for_souls = f"vuthausk_{vuthausk_name_from_json.lower().replace(' ', '_').replace('-', '_')}"
-
-                souls_list = data_from_file.get('character_details', {}).get('in_game_details', {}).get(VUTHAUSK_SOULS_KEY, [])
-                if isinstance(souls_list, list) and souls_list:
-                    print(f"Found {len(souls_list)} souls in {file_name}.")
-                    for soul_str in souls_list:
-                        if isinstance(soul_str, str) and soul_str.strip():
-                            soul_name_parts = soul_str.split(' - ')
-                            soul_name = soul_name_parts[0].strip() if soul_name_parts else "Unnamed Soul"
-                            soul_desc = soul_name_parts[1].strip() if len(soul_name_parts) > 1 else soul_str
-                            soul_npc_data = {
-                                'name': soul_name,
-                                'appearance': f"A past life soul: {soul_desc}",
-                                'personality_traits': ["Past Life Influence"], # Stored as list
-                            }
-                            npcs_to_process.append(soul_npc_data)
-                else:
-                    print(f"No souls list found or empty in {file_name} under key '{VUTHAUSK_SOULS_KEY}'.")
-
-            elif isinstance(data_from_file, list):
-                npcs_to_process = data_from_file
-                print(f"Found {len(npcs_to_process)} NPCs (list) in {file_name}.")
-            elif isinstance(data_from_file, dict):
-                npcs_to_process = [data_from_file]
-                print(f"Found 1 NPC (single object) in {file_name}.")
-            else:
-                print(f"Warning: Data in {file_name} is not a list or object. Skipping.")
+            records = read_npc_file(json_file_path)
+            if records is None:
                 continue
             
             file_inserted, file_updated, file_skipped, file_matched_no_change = 0,0,0,0
-            for i, npc_raw in enumerate(npcs_to_process):
+            for npc_raw, is_soul, main_id_link in records:
                 total_records_in_files +=1
-                
-                is_soul = False
-                main_id_link = None
-                if file_name.lower() == 'vuthausk.json':
-                    if i == 0: 
-                        is_soul = False
-                    else: 
-                        is_soul = True
-                        main_id_link = vuthausk_main_id_for_souls 
-
                 inserted, updated, skipped, matched = process_npc_data(
                     npc_raw, npc_collection, file_name, 
                     is_soul_npc=is_soul,
@@ -281,17 +363,144 @@ def load_npcs_to_db():
     # e.g., by iterating through them and inserting/updating them into their respective collections
     # For now, this script primarily focuses on the 'npcs' collection.
 
-    print(f"\n--- Overall NPC Load Summary ---")
-    print(f"NPC Files processed: {len(npc_json_files)}")
-    print(f"NPC records in files (from NPC files only): {total_records_in_files}") # This count is now more accurate for NPCs
-    print(f"Inserted to DB: {total_inserted}")
-    print(f"Updated in DB: {total_updated}")
-    print(f"Matched (no change): {total_matched_no_change}")
-    print(f"Skipped: {total_skipped}")
-    print(f"NPC Load complete.")
+    print_load_summary(len(npc_json_files), total_records_in_files, total_inserted, total_updated, total_skipped, total_matched_no_change)
+    bump_npc_version(npc_collection, total_inserted, total_updated)
+
+    client.close()
+
+# --- Bulk mode (--bulk) ---
+# Files are parsed and mapped in worker processes; the parent resolves generated ids against one
+# $in query plus the ids claimed earlier in the run (what the per-NPC find_one saw in serial mode),
+# then upserts in unordered bulk_write batches: one round-trip per BULK_BATCH_SIZE NPCs.
+
+def parse_npc_file(json_file_path):
+    """
+    Worker: reads and maps one NPC file without touching the database. Returns a dict with the
+    file name, its log lines (printed by the parent, in file order), the number of records, the
+    number skipped as invalid, and the mapped entries ({'doc', 'id_source', 'raw_name'}).
+    """
+    file_name = os.path.basename(json_file_path)
+    log = []
+    parsed = {'file_name': file_name, 'log': log, 'records': 0, 'skipped': 0, 'entries': []}
+    records = read_npc_file(json_file_path, log=log.append)
+    if records is None:
+        return parsed
+
+    for npc_raw, is_soul, main_id_link in records:
+        parsed['records'] += 1
+        if not isinstance(npc_raw, dict):
+            log.append(f"Warning [{file_name}]: Item is not a valid NPC object. Skipping: {str(npc_raw)[:100]}")
+            parsed['skipped'] += 1
+            continue
+        npc_id, npc_id_source = resolve_npc_id(npc_raw, file_name, is_soul)
+        parsed['entries'].append({
+            'doc': build_npc_doc(npc_raw, npc_id, file_name, is_soul, main_id_link),
+            'id_source': npc_id_source,
+            'raw_name': npc_raw.get('name'),
+        })
+    return parsed
+
+def parse_npc_files(json_file_paths, workers):
+    """parse_npc_file over all files, in a process pool when workers > 1; results keep file order."""
+    if workers > 1 and len(json_file_paths) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(json_file_paths))) as executor:
+                return list(executor.map(parse_npc_file, json_file_paths))
+        except (OSError, NotImplementedError) as e:
+            print(f"Warning: process pool unavailable ({e}); parsing in this process.")
+    return [parse_npc_file(path) for path in json_file_paths]
+
+def resolve_generated_ids(entries, npc_collection, batch_size=BULK_BATCH_SIZE):
+    """Gives each entry with a generated id a final _id, checking collisions in memory. Mutates the docs."""
+    generated_ids = list({entry['doc']['_id'] for entry in entries if entry['id_source'] == "generated"})
+    existing = {}
+    for start in range(0, len(generated_ids), batch_size):
+        chunk = generated_ids[start:start + batch_size]
+        for doc in npc_collection.find({"_id": {"$in": chunk}}, {"name": 1}):
+            existing[doc['_id']] = doc
+
+    for entry in entries:
+        doc = entry['doc']
+        if entry['id_source'] == "generated":
+            holder = existing.get(doc['_id'])
+            doc['_id'] = deduplicated_npc_id(doc['_id'], {'name': entry['raw_name']}, doc.get('source_file', 'Unknown File'), holder)
+        # Later records in this run see this one, as they would have via find_one after its upsert
+        existing[doc['_id']] = {'_id': doc['_id'], 'name': doc.get('name')}
+
+def bulk_upsert_npcs(npc_collection, docs, batch_size=BULK_BATCH_SIZE):
+    """Unordered bulk_write batches of $set upserts. Returns (inserted, updated, skipped, matched_no_change)."""
+    inserted, updated, skipped, matched_no_change = 0, 0, 0, 0
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        operations = [UpdateOne({'_id': doc['_id']}, {'$set': doc}, upsert=True) for doc in batch]
+        try:
+            result = npc_collection.bulk_write(operations, ordered=False)
+            n_upserted, n_matched, n_modified = result.upserted_count, result.matched_count, result.modified_count
+        except errors.BulkWriteError as e:
+            # Unordered: everything but the failed operations was applied
+            details = e.details
+            n_upserted, n_matched, n_modified = details.get('nUpserted', 0), details.get('nMatched', 0), details.get('nModified', 0)
+            for write_error in details.get('writeErrors', []):
+                failed_doc = batch[write_error['index']]
+                print(f"MongoDB error for _id '{failed_doc['_id']}' from {failed_doc.get('source_file', 'Unknown File')}: {write_error.get('errmsg')}. Skipping.")
+            skipped += len(details.get('writeErrors', []))
+        except errors.PyMongoError as e:
+            print(f"MongoDB error writing NPCs {start + 1}-{start + len(batch)}: {e}. Skipping batch.")
+            skipped += len(batch)
+            continue
+        inserted += n_upserted
+        updated += n_modified
+        matched_no_change += n_matched - n_modified
+        print(f"Info: Batch of {len(batch)} NPCs written: {n_upserted} ins, {n_modified} upd, {n_matched - n_modified} no-change.")
+    return inserted, updated, skipped, matched_no_change
+
+def load_npcs_to_db_bulk(workers=BULK_DEFAULT_WORKERS, batch_size=BULK_BATCH_SIZE, foundry_paths=()):
+    client, npc_collection = connect_npc_collection()
+    if client is None:
+        return
+
+    if not os.path.isdir(NPC_DATA_DIR_PATH):
+        print(f"Error: NPC data directory not found: {NPC_DATA_DIR_PATH}")
+        return
+
+    npc_json_files = find_npc_json_files(foundry_paths)
+    if not npc_json_files:
+        print(f"No NPC specific .json files found in {NPC_DATA_DIR_PATH} (excluding files starting with 'world_').")
+        client.close()
+        return
+
+    print(f"Found NPC JSON files: {', '.join(os.path.basename(f) for f in npc_json_files)}")
+    print(f"Parsing NPC files with {workers} worker(s)...")
+
+    total_records_in_files, parse_skipped = 0, 0
+    entries = []
+    for parsed in parse_npc_files(npc_json_files, workers):
+        for line in parsed['log']:
+            print(line)
+        total_records_in_files += parsed['records']
+        parse_skipped += parsed['skipped']
+        entries.extend(parsed['entries'])
+
+    resolve_generated_ids(entries, npc_collection, batch_size)
+    print(f"\nUpserting {len(entries)} NPCs in batches of {batch_size}...")
+    inserted, updated, skipped, matched_no_change = bulk_upsert_npcs(npc_collection, [entry['doc'] for entry in entries], batch_size)
+
+    print_load_summary(len(npc_json_files), total_records_in_files, inserted, updated, skipped + parse_skipped, matched_no_change)
+    bump_npc_version(npc_collection, inserted, updated)
 
     client.close()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load NPC JSON files from app/data into MongoDB.")
+    parser.add_argument('--bulk', action='store_true', help="Parse files in parallel and upsert with batched bulk_write.")
+    parser.add_argument('--workers', type=int, default=BULK_DEFAULT_WORKERS, help="Parser processes in --bulk mode.")
+    parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE, help="Upserts per bulk_write in --bulk mode.")
+    parser.add_argument('--foundry', nargs='+', default=[], metavar='PATH',
+                        help="Also import Foundry VTT actor exports: files, or directories of fvtt-Actor-*.json.")
+    args = parser.parse_args()
+
     print("Starting NPC data loader...")
-    load_npcs_to_db()
\ No newline at end of file
+    if args.bulk:
+        load_npcs_to_db_bulk(workers=max(1, args.workers), batch_size=max(1, args.batch_size), foundry_paths=args.foundry)
+    else:
+        load_npcs_to_db(foundry_paths=args.foundry)
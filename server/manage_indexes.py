@@ -0,0 +1,75 @@
+# server/manage_indexes.py
+"""
+Applies the Mongo indexes declared in app/utils/indexes.py and checks the app's known query
+shapes for collection scans.
+
+    python manage_indexes.py ensure   # create missing indexes (idempotent)
+    python manage_indexes.py verify   # explain() each query shape; exit code 1 on any COLLSCAN
+    python manage_indexes.py all      # ensure, then verify
+"""
+import os
+import sys
+import argparse
+from pymongo import MongoClient # type: ignore
+from dotenv import load_dotenv
+from app.utils.indexes import ensure_indexes, verify_query_plans
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+dotenv_path = os.path.join(SERVER_DIR, '.env')
+load_dotenv(dotenv_path)
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ttrpg_app_db')
+DATABASE_NAME = MONGO_URI.split('/')[-1].split('?')[0]
+
+
+def run_ensure(db):
+    ensured, failed = ensure_indexes(db)
+    for name in ensured:
+        print(f"Info: index {name} in place.")
+    for name, error in failed:
+        print(f"Error: index {name} could not be created: {error}")
+    print(f"Indexes ensured: {len(ensured)}, failed: {len(failed)}")
+    return not failed
+
+
+def run_verify(db):
+    collscans = 0
+    for entry in verify_query_plans(db):
+        if entry['error']:
+            print(f"Error: {entry['name']} ({entry['collection']}): explain failed: {entry['error']}")
+            collscans += 1
+        elif entry['collscan']:
+            print(f"COLLSCAN: {entry['name']} ({entry['collection']}): {' > '.join(entry['stages'])}")
+            collscans += 1
+        else:
+            print(f"OK: {entry['name']} ({entry['collection']}): {' > '.join(entry['stages'])}")
+    print(f"Query shapes needing attention: {collscans}")
+    return collscans == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the app's MongoDB indexes.")
+    parser.add_argument('command', choices=['ensure', 'verify', 'all'], nargs='?', default='all')
+    args = parser.parse_args()
+
+    try:
+        print(f"Connecting to MongoDB: {MONGO_URI}")
+        client = MongoClient(MONGO_URI)
+        client.admin.command('ping')
+        db = client[DATABASE_NAME]
+        print(f"Connected to DB '{DATABASE_NAME}'.")
+    except Exception as e:
+        print(f"Fatal: MongoDB connection error: {e}")
+        return 2
+
+    ok = True
+    if args.command in ('ensure', 'all'):
+        ok = run_ensure(db) and ok
+    if args.command in ('verify', 'all'):
+        ok = run_verify(db) and ok
+    client.close()
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# server/migrate_npc_memories.py
+"""
+Moves memories embedded in NPC documents (npcs.memories) into the npc_memories collection.
+
+Safe to re-run: each memory is upserted by its memory_id, and an NPC's embedded array is
+only removed once all of its memories have been written. Entries that can't be migrated
+(not memory objects) are left in the array, and reported, for a human to look at.
+
+    python migrate_npc_memories.py            # migrate
+    python migrate_npc_memories.py --dry-run  # report what would move, change nothing
+"""
+import os
+import argparse
+import uuid
+from pymongo import MongoClient, ReplaceOne, errors # type: ignore
+from dotenv import load_dotenv
+from app.services.memory_store import MEMORY_COLLECTION_NAME, memory_document
+from app.utils.indexes import ensure_indexes
+from app.utils.versions import bump_collection_versions
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+dotenv_path = os.path.join(SERVER_DIR, '.env')
+load_dotenv(dotenv_path)
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ttrpg_app_db')
+DATABASE_NAME = MONGO_URI.split('/')[-1].split('?')[0]
+NPC_COLLECTION_NAME = 'npcs'
+
+
+def migrate_npc(npc, memory_collection, npc_collection, dry_run=False):
+    """Returns (memories written, skipped entries) for one NPC; skipped entries stay in its array."""
+    npc_id = npc['_id']
+    operations, unmigrated = [], []
+    for position, memory in enumerate(npc.get('memories') or []):
+        if not isinstance(memory, dict):
+            unmigrated.append(memory)
+            continue
+        if not memory.get('memory_id'):
+            # Derived rather than random, so a re-run after a partial failure upserts the same document
+            memory = {**memory, 'memory_id': str(uuid.uuid5(uuid.NAMESPACE_URL, f"{npc_id}:{position}:{memory.get('timestamp')}"))}
+        document = memory_document(npc_id, memory)
+        operations.append(ReplaceOne({"_id": document["_id"]}, document, upsert=True))
+
+    if dry_run:
+        return len(operations), len(unmigrated)
+    if operations:
+        memory_collection.bulk_write(operations, ordered=False)
+    if unmigrated:
+        # Keep what couldn't be moved; the written memories are dropped from the array
+        npc_collection.update_one({"_id": npc_id}, {"$set": {"memories": unmigrated}})
+    else:
+        npc_collection.update_one({"_id": npc_id}, {"$unset": {"memories": ""}})
+    return len(operations), len(unmigrated)
+
+
+def migrate_memories(dry_run=False):
+    try:
+        print(f"Connecting to MongoDB: {MONGO_URI}")
+        client = MongoClient(MONGO_URI)
+        client.admin.command('ping')
+        db = client[DATABASE_NAME]
+        npc_collection = db[NPC_COLLECTION_NAME]
+        memory_collection = db[MEMORY_COLLECTION_NAME]
+        print(f"Connected to DB '{DATABASE_NAME}'.")
+    except Exception as e:
+        print(f"Fatal: MongoDB connection error: {e}")
+        return
+
+    if not dry_run:
+        ensure_indexes(db, collections=(MEMORY_COLLECTION_NAME,))
+
+    total_npcs, total_memories, total_skipped, total_failed = 0, 0, 0, 0
+    for npc in npc_collection.find({"memories": {"$exists": True}}, {"name": 1, "memories": 1}):
+        total_npcs += 1
+        try:
+            written, skipped = migrate_npc(npc, memory_collection, npc_collection, dry_run=dry_run)
+        except errors.PyMongoError as e:
+            print(f"MongoDB error migrating memories of '{npc.get('name', npc['_id'])}' ({npc['_id']}): {e}. Left in place.")
+            total_failed += 1
+            continue
+        total_memories += written
+        total_skipped += skipped
+        print(f"Info: {'Would move' if dry_run else 'Moved'} {written} memories for '{npc.get('name', npc['_id'])}' ({npc['_id']}){f', skipped {skipped} malformed (left in place)' if skipped else ''}.")
+
+    print(f"\n--- Memory Migration Summary{' (dry run)' if dry_run else ''} ---")
+    print(f"NPCs with embedded memories: {total_npcs}")
+    print(f"Memories {'to move' if dry_run else 'moved'}: {total_memories}")
+    print(f"Malformed entries skipped (left in npcs.memories): {total_skipped}")
+    print(f"NPCs failed (left in place): {total_failed}")
+
+    if not dry_run and total_npcs > total_failed:
+        try:
+            bump_collection_versions(db, NPC_COLLECTION_NAME)
+        except errors.PyMongoError as e:
+            print(f"Warning: could not bump the '{NPC_COLLECTION_NAME}' version: {e}")
+
+    client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move embedded NPC memories into the npc_memories collection.")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would be migrated without writing anything.")
+    args = parser.parse_args()
+    print("Starting NPC memory migration...")
+    migrate_memories(dry_run=args.dry_run)
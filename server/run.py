@@ -3,7 +3,9 @@ import os
 from app import create_app # create_app now handles all blueprint registration
 
 config_name = os.getenv('FLASK_CONFIG', 'dev')
-app = create_app(config_name)
+# The password hashing worker processes re-import this script as __mp_main__; they need no app
+if __name__ != '__mp_main__':
+    app = create_app(config_name)
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5150))
@@ -53,16 +53,16 @@ document.addEventListener('DOMContentLoaded', async () => {
     try {
         if(loadingMessageElement) loadingMessageElement.style.display = 'block'; 
 
-        const response = await fetch('/api/npcs'); 
-        if (!response.ok) {
-            if (response.status === 401) { 
+        try {
+            allAvailableNPCs = await fetchAllNpcs();
+        } catch (fetchError) {
+            if (fetchError.status === 401) { 
                 if(loadingMessageElement) loadingMessageElement.textContent = 'Authentication required.';
                 window.location.href = '/login';
                 return Promise.reject('User not authenticated, redirecting.');
             }
-            throw new Error(`HTTP error fetching NPCs! Status: ${response.status}`);
+            throw fetchError;
         }
-        allAvailableNPCs = await response.json();
 
         if(loadingMessageElement) loadingMessageElement.style.display = 'none';
 
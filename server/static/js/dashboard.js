@@ -109,13 +109,13 @@ document.addEventListener('DOMContentLoaded', async () => {
         if (!currentUser || !userNpcListDiv) return;
         userNpcListDiv.innerHTML = '<p>Loading NPCs...</p>';
         try {
-            const response = await fetch('/api/npcs'); 
-            if (!response.ok) {
-                if (response.status === 401) { window.location.href = '/login'; return; }
-                throw new Error(`HTTP error! Status: ${response.status}`);
+            let allAccessibleNpcs;
+            try {
+                allAccessibleNpcs = await fetchAllNpcs({ fields: 'name,user_id' });
+            } catch (fetchError) {
+                if (fetchError.status === 401) { window.location.href = '/login'; return; }
+                throw fetchError;
             }
-            
-            const allAccessibleNpcs = await response.json();
 
             if (allAccessibleNpcs.length === 0) {
                 userNpcListDiv.innerHTML = '<p>No NPCs found. Try uploading one or check if default NPCs are loaded.</p>';
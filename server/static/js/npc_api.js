@@ -0,0 +1,22 @@
+// static/js/npc_api.js - NPC API helpers shared by the selector (app.js) and dashboard (dashboard.js) pages
+
+// GET /api/npcs is paged; follows X-Next-Cursor until every page is loaded
+async function fetchAllNpcs(query) {
+    let npcs = [];
+    let cursor = null;
+    do {
+        const params = new URLSearchParams(query || {});
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/api/npcs?${params.toString()}`);
+        if (!response.ok) {
+            const error = new Error(`HTTP error fetching NPCs! Status: ${response.status}`);
+            error.status = response.status;
+            throw error;
+        }
+        const page = await response.json();
+        if (!Array.isArray(page)) return page;
+        npcs = npcs.concat(page);
+        cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return npcs;
+}
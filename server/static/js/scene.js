@@ -52,8 +52,8 @@ document.addEventListener('DOMContentLoaded', () => {
         return;
     }
 
-    console.log('Scene.js: Fetching /api/npcs...');
-    fetch('/api/npcs') 
+    console.log('Scene.js: Fetching selected NPCs from /api/npcs...');
+    fetch(`/api/npcs?${new URLSearchParams({ ids: selectedNpcIds.join(','), fields: 'name', limit: String(Math.max(selectedNpcIds.length, 1)) }).toString()}`) 
         .then(response => {
             console.log('Scene.js: /api/npcs response received.');
             if (!response.ok) {
@@ -258,7 +258,10 @@ document.addEventListener('DOMContentLoaded', () => {
             if (!response.ok) throw new Error(responseData.error || responseData.message || `Action '${actionType}' failed`);
             
             let systemMessage = responseData.message || `Action '${escapeForHtml(actionType)}' for ${npcNameSafe} processed.`;
-            addDialogueEntryToNpcLog(npc._id, "SYSTEM", systemMessage, "system-success");
+            addDialogueEntryToNpcLog(npc._id, "SYSTEM", systemMessage, responseData.status === "queued" ? "system-info" : "system-success");
+            if (responseData.status === "queued" && responseData.job_id) {
+                pollJobUntilDone(npc._id, responseData.job_id); // Runs in the background; the UI stays usable
+            }
 
             if (responseData.data) {
                 if (responseData.action === "next_topic" || responseData.action === "regenerate_topics") {
@@ -279,6 +282,29 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Polls a background job (e.g. memory submission) and logs its outcome when it finishes.
+    async function pollJobUntilDone(npcId, jobId, intervalMs = 1500, maxAttempts = 40) {
+        for (let attempt = 0; attempt < maxAttempts; attempt++) {
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+            try {
+                const response = await fetch(`/api/dialogue/jobs/${encodeURIComponent(jobId)}`);
+                if (!response.ok) throw new Error(`Server status ${response.status}`);
+                const job = await response.json();
+                if (job.status === "succeeded") {
+                    addDialogueEntryToNpcLog(npcId, "SYSTEM", (job.result && job.result.message) || "Memory recorded.", "system-success");
+                    return;
+                }
+                if (job.status === "failed") {
+                    addDialogueEntryToNpcLog(npcId, "SYSTEM", (job.result && job.result.message) || job.error || "Background job failed.", "system-error");
+                    return;
+                }
+            } catch (error) {
+                console.error(`Scene.js: Error polling job ${jobId}:`, error);
+            }
+        }
+        addDialogueEntryToNpcLog(npcId, "SYSTEM", "Still working on it in the background; check back later.", "system-info");
+    }
+
     startSceneButton.addEventListener('click', () => {
         console.log('Scene.js: Start Scene button clicked.');
         const sceneDescriptionInput = sceneDescriptionTextarea.value.trim();
@@ -297,26 +323,120 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         });
 
-        sceneParticipants.forEach((npc, index) => {
+        sceneParticipants.forEach(npc => {
             addDialogueEntryToNpcLog(npc._id, npc.name, "<i>...formulating a response...</i>", "npc-thinking"); 
-            setTimeout(() => { 
-                console.log(`Scene.js: Fetching initial dialogue for ${escapeForHtml(npc.name)} (ID: ${npc._id})`);
-                fetchNpcInitialDialogue(npc, currentSceneContext); 
-            }, index * 700 + 400); 
         });
+        startSceneForAllNpcs(currentSceneContext);
         sceneDescriptionTextarea.value = ""; 
     });
 
-    async function fetchNpcInitialDialogue(npc, sceneDescForCall) {
-        const npcId = npc._id; 
+    function removeThinkingEntry(npcId) {
         const npcLogContainer = document.getElementById(`chat-log-${npcId}`);
         if (npcLogContainer) {
             const thinkingMessageEntry = npcLogContainer.querySelector('.chat-entry.npc-thinking');
             if(thinkingMessageEntry) thinkingMessageEntry.remove();
         }
+    }
+
+    // Reads a text/event-stream response body and calls onEvent(eventName, parsedData) per event.
+    async function readServerSentEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let separatorIndex;
+            while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, separatorIndex);
+                buffer = buffer.slice(separatorIndex + 2);
+                let eventName = 'message';
+                let dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length === 0) continue;
+                try { onEvent(eventName, JSON.parse(dataLines.join('\n'))); }
+                catch (e) { console.error('Scene.js: Could not parse SSE data:', e, rawEvent); }
+            }
+        }
+    }
+
+    // One request for the whole scene; the server generates all NPC lines concurrently
+    // and streams each one back as soon as it is ready.
+    async function startSceneForAllNpcs(sceneDescForCall) {
+        const histories = {};
+        sceneParticipants.forEach(npc => {
+            histories[npc._id] = conversationHistory[npc._id] ? conversationHistory[npc._id].slice(-10) : [];
+        });
+        const pendingNpcIds = new Set(sceneParticipants.map(npc => npc._id));
         try {
-            const payload = { npc_id: npcId, scene_context: sceneDescForCall, history: conversationHistory[npcId] ? conversationHistory[npcId].slice(-10) : [] };
-            const response = await fetch('/api/dialogue/generate_npc_line', {
+            const response = await fetch('/api/dialogue/scene/start', {
+                method: 'POST', headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ npc_ids: [...pendingNpcIds], scene_context: sceneDescForCall, histories: histories, stream: true }),
+            });
+            if (!response.ok) {
+                let errorDetail = `Server status ${response.status}`;
+                try { const errorData = await response.json(); errorDetail = errorData.error || errorDetail; } catch (e) { /* non-JSON error */ }
+                throw new Error(errorDetail);
+            }
+            await readServerSentEvents(response, (eventName, data) => {
+                const npc = sceneParticipants.find(p => p._id === data.npc_id);
+                if (!npc) return;
+                pendingNpcIds.delete(npc._id);
+                removeThinkingEntry(npc._id);
+                if (eventName === 'npc_line' && data.dialogue_text) {
+                    addDialogueEntryToNpcLog(npc._id, npc.name, data.dialogue_text, "npc");
+                } else {
+                    addDialogueEntryToNpcLog(npc._id, "SYSTEM", data.error || ("AI could not generate an initial response for " + escapeForHtml(npc.name)), "system-error");
+                }
+            });
+        } catch (error) {
+            console.error('Scene.js: Error starting scene:', error);
+            pendingNpcIds.forEach(npcId => {
+                removeThinkingEntry(npcId);
+                addDialogueEntryToNpcLog(npcId, "SYSTEM", `Error starting scene: ${error.message}`, "system-error");
+            });
+            pendingNpcIds.clear();
+        }
+        pendingNpcIds.forEach(npcId => {
+            removeThinkingEntry(npcId);
+            addDialogueEntryToNpcLog(npcId, "SYSTEM", "No response was received for this NPC.", "system-error");
+        });
+    }
+
+    // Creates an NPC chat bubble whose text can grow while a streamed line arrives.
+    function createStreamingNpcEntry(npcId) {
+        const logContainer = document.getElementById(`chat-log-${npcId}`);
+        if (!logContainer) return null;
+        const entryDiv = document.createElement('div');
+        entryDiv.classList.add('chat-entry', 'npc');
+        const bubble = document.createElement('div');
+        bubble.className = 'chat-bubble';
+        const textElement = document.createElement('p');
+        textElement.className = 'dialogue-text';
+        bubble.appendChild(textElement);
+        entryDiv.appendChild(bubble);
+        logContainer.appendChild(entryDiv);
+        return {
+            append(text) {
+                textElement.textContent += text;
+                logContainer.scrollTop = logContainer.scrollHeight;
+            },
+            setText(text) { textElement.textContent = text; },
+            remove() { entryDiv.remove(); }
+        };
+    }
+
+    async function fetchNpcInitialDialogue(npc, sceneDescForCall) {
+        const npcId = npc._id; 
+        let streamingEntry = null;
+        try {
+            // scene_description is what follow-up actions send, so the server can pre-generate them
+            const payload = { npc_id: npcId, scene_context: sceneDescForCall, scene_description: currentSceneContext, history: conversationHistory[npcId] ? conversationHistory[npcId].slice(-10) : [] };
+            const response = await fetch('/api/dialogue/generate_npc_line/stream', {
                 method: 'POST', headers: { 'Content-Type': 'application/json', }, body: JSON.stringify(payload),
             });
             if (!response.ok) {
@@ -324,11 +444,36 @@ document.addEventListener('DOMContentLoaded', () => {
                 try { const errorData = await response.json(); errorDetail = errorData.detail || errorData.error || `Server status ${response.status}`; } catch (e) { errorDetail = `Server status ${response.status}, non-JSON error.`; }
                 throw new Error(errorDetail);
             }
-            const data = await response.json(); 
-            if (data.dialogue_text) addDialogueEntryToNpcLog(npcId, npc.name, data.dialogue_text, "npc");
-            else addDialogueEntryToNpcLog(npcId, "SYSTEM", "AI could not generate an initial response for " + escapeForHtml(npc.name), "system-error");
+            let finalText = null;
+            let streamError = null;
+            await readServerSentEvents(response, (eventName, data) => {
+                if (eventName === 'delta') {
+                    if (!streamingEntry) {
+                        removeThinkingEntry(npcId);
+                        streamingEntry = createStreamingNpcEntry(npcId);
+                    }
+                    if (streamingEntry) streamingEntry.append(data.text || '');
+                } else if (eventName === 'done') {
+                    finalText = data.dialogue_text;
+                } else if (eventName === 'error') {
+                    streamError = data.error;
+                }
+            });
+            removeThinkingEntry(npcId);
+            if (streamError) throw new Error(streamError);
+            if (finalText) {
+                if (!streamingEntry) streamingEntry = createStreamingNpcEntry(npcId);
+                if (streamingEntry) streamingEntry.setText(finalText);
+                if (!conversationHistory[npcId]) conversationHistory[npcId] = [];
+                conversationHistory[npcId].push({ speaker: npc.name, text: finalText });
+            } else {
+                if (streamingEntry) streamingEntry.remove();
+                addDialogueEntryToNpcLog(npcId, "SYSTEM", "AI could not generate an initial response for " + escapeForHtml(npc.name), "system-error");
+            }
         } catch (error) {
             console.error(`Scene.js: Error fetching initial dialogue for ${escapeForHtml(npc.name)} (ID: ${npcId}):`, error);
+            removeThinkingEntry(npcId);
+            if (streamingEntry) streamingEntry.remove();
             addDialogueEntryToNpcLog(npcId, "SYSTEM", `Error for ${escapeForHtml(npc.name)}: ${error.message}`, "system-error");
         }
     }